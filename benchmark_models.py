@@ -0,0 +1,250 @@
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+
+import torch
+import torch.nn.functional as F
+from prettytable import PrettyTable
+from torch.utils.flop_counter import FlopCounterMode
+
+import models
+from models.modules.search_space import get_search_space
+from utils.accumulation import SavedBytes
+
+# the models whose forward takes an arch, benchmarked at the widest one
+ARCH_MODELS = ['super', 'slimmable']
+
+FIELDS = ['model', 'batch_size', 'params', 'macs', 'first_batch_s', 'forward', 'train', 'peak_mb', 'status']
+# higher is better for these, lower for the rest of the compared fields
+HIGHER_BETTER = ['forward', 'train']
+COMPARED = ['params', 'macs', 'first_batch_s', 'forward', 'train', 'peak_mb']
+HEADER = ['model', 'batch', 'params(M)', 'MACs(M)', 'first batch(s)', 'fwd img/s', 'train img/s',
+          'peak(MB)', 'status']
+
+parser = argparse.ArgumentParser("model-zoo-benchmark")
+parser.add_argument('--models', nargs='+', default=None, help='registry names, all of them by default')
+parser.add_argument('--skip', nargs='+', default=[], help='registry names left out')
+parser.add_argument('--batch_sizes', nargs='+', default=[1, 32], type=int)
+parser.add_argument('--iters', default=5, type=int, help='timed steps per batch size')
+parser.add_argument('--warmup', default=1, type=int, help='untimed steps per batch size')
+parser.add_argument('--input_size', default=32, type=int)
+parser.add_argument('--num_classes', default=10, type=int)
+parser.add_argument('--threads', default=None, type=int, help='torch cpu threads, fixed for comparable runs')
+parser.add_argument('--seed', default=0, type=int)
+parser.add_argument('--device', default='cpu', type=str, help='cpu or cuda')
+parser.add_argument('--save_file', default=None, type=str, help='json file the results are saved to, a baseline')
+parser.add_argument('--csv', default=None, type=str, help='csv file the results are saved to')
+parser.add_argument('--markdown', default=None, type=str, help='markdown file the results are saved to')
+parser.add_argument('--baseline', default=None, type=str, help='json of an earlier run to compare against')
+parser.add_argument('--tolerance', default=0.1, type=float,
+                    help='relative change against the baseline reported as a regression')
+
+
+def model_forward(name, model):
+    '''forward(x) of a registry model'''
+    if name in ARCH_MODELS:
+        arch = get_search_space().max_widths
+        return lambda x: model(x, arch)
+    return model
+
+
+def count_macs(forward, x):
+    '''
+    multiply-accumulates of one forward of x, per image: the convs and
+    matmuls counted at the aten level, so the F.conv2d of sliced weights in
+    the dynamic ops count as well as nn.Conv2d
+    '''
+    counter = FlopCounterMode(display=False)
+    with torch.no_grad(), counter:
+        forward(x)
+    return counter.get_total_flops() // 2 // len(x)
+
+
+def sync(device):
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+
+
+def first_batch(name, args):
+    '''(model, seconds): build_model, its module imported on first use, and one training step'''
+    start = time.time()
+    model = models.build_model(name, num_classes=args.num_classes).to(args.device).train()
+    forward = model_forward(name, model)
+    x = torch.randn(args.batch_sizes[0], 3, args.input_size, args.input_size, device=args.device)
+    y = torch.randint(0, args.num_classes, (len(x),), device=args.device)
+    F.cross_entropy(forward(x), y).backward()
+    sync(args.device)
+    return model, time.time() - start
+
+
+def benchmark(model, forward, batch_size, args):
+    '''
+    (forward imgs/s, forward+backward imgs/s, peak MB) at batch_size. peak
+    is the max allocated cuda memory of a training step, on cpu the bytes
+    autograd saves for backward plus the parameters and grads.
+    '''
+    x = torch.randn(batch_size, 3, args.input_size, args.input_size, device=args.device)
+    y = torch.randint(0, args.num_classes, (batch_size,), device=args.device)
+
+    with torch.no_grad():
+        for _ in range(args.warmup):
+            forward(x)
+        sync(args.device)
+        start = time.time()
+        for _ in range(args.iters):
+            forward(x)
+        sync(args.device)
+        fwd = batch_size * args.iters / (time.time() - start)
+
+    for _ in range(args.warmup):
+        F.cross_entropy(forward(x), y).backward()
+    if args.device.startswith('cuda'):
+        torch.cuda.reset_peak_memory_stats()
+    sync(args.device)
+    start = time.time()
+    saved = 0
+    for _ in range(args.iters):
+        model.zero_grad(set_to_none=True)
+        with SavedBytes() as counter:
+            loss = F.cross_entropy(forward(x), y)
+        saved = max(saved, counter.bytes)
+        loss.backward()
+    sync(args.device)
+    train = batch_size * args.iters / (time.time() - start)
+
+    if args.device.startswith('cuda'):
+        peak = torch.cuda.max_memory_allocated()
+    else:
+        peak = saved + 2 * sum(p.numel() * p.element_size() for p in model.parameters())
+    return fwd, train, peak / 2 ** 20
+
+
+def run(name, args):
+    '''one row per batch size, a failed model gets one row with its error as status'''
+    torch.manual_seed(args.seed)
+    try:
+        model, first_batch_s = first_batch(name, args)
+        forward = model_forward(name, model)
+        x = torch.randn(1, 3, args.input_size, args.input_size, device=args.device)
+        common = {'model': name, 'params': sum(p.numel() for p in model.parameters()),
+                  'macs': count_macs(forward, x), 'first_batch_s': first_batch_s}
+        rows = []
+        for batch_size in args.batch_sizes:
+            row = dict(common, batch_size=batch_size)
+            row['forward'], row['train'], row['peak_mb'] = benchmark(model, forward, batch_size, args)
+            row['status'] = 'ok'
+            rows.append(row)
+        return rows
+    except Exception as e:
+        # a broken model is a row of the report, not the end of the run
+        message = str(e).splitlines()[0] if str(e) else ''
+        return [{'model': name, 'status': '{}: {}'.format(type(e).__name__, message)}]
+
+
+def format_row(row):
+    cells = [row['model'], row.get('batch_size', '-')]
+    if row['status'] != 'ok':
+        return cells + ['-'] * 6 + [row['status'][:60]]
+    return cells + ['{:.2f}'.format(row['params'] / 1e6), '{:.1f}'.format(row['macs'] / 1e6),
+                    '{:.2f}'.format(row['first_batch_s']), '{:.0f}'.format(row['forward']),
+                    '{:.0f}'.format(row['train']), '{:.1f}'.format(row['peak_mb']), 'ok']
+
+
+def save_csv(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def save_markdown(rows, path):
+    lines = ['| ' + ' | '.join(HEADER) + ' |', '|' + ' --- |' * len(HEADER)]
+    lines += ['| ' + ' | '.join(map(str, format_row(row))) + ' |' for row in rows]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def compare(rows, baseline, tolerance):
+    '''
+    [(model, batch_size, field, old, new, relative change, regression)] of
+    the baseline rows matched by (model, batch_size) in rows. a drop of the
+    throughputs or a rise of the rest beyond tolerance is a regression, so
+    is a model the baseline ran and this run failed. the models and batch
+    sizes not run this time are left out.
+    '''
+    new_rows = {(r['model'], r.get('batch_size')): r for r in rows}
+    failed = {r['model']: r['status'] for r in rows if r['status'] != 'ok'}
+    changes = []
+    for old in baseline:
+        if old['status'] != 'ok':
+            continue
+        name, batch_size = old['model'], old['batch_size']
+        if name in failed:
+            changes.append((name, batch_size, 'status', 'ok', failed[name], None, True))
+            continue
+        row = new_rows.get((name, batch_size))
+        if row is None:
+            continue
+        for field in COMPARED:
+            if not old[field]:
+                continue
+            change = (row[field] - old[field]) / old[field]
+            worse = -change if field in HIGHER_BETTER else change
+            changes.append((name, batch_size, field, old[field], row[field], change, worse > tolerance))
+    return changes
+
+
+def main():
+    args = parser.parse_args()
+    log_format = '%(asctime)s %(message)s'
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format=log_format, datefmt='%m/%d %I:%M:%S %p')
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    names = args.models or list(models.__model_factory)
+    names = [name for name in names if name not in args.skip]
+
+    rows = []
+    tb = PrettyTable()
+    tb.field_names = HEADER
+    for name in names:
+        model_rows = run(name, args)
+        logging.info('{}: {}'.format(name, model_rows[0]['status']))
+        for row in model_rows:
+            tb.add_row(format_row(row))
+        rows.extend(model_rows)
+        if args.device.startswith('cuda'):
+            torch.cuda.empty_cache()
+    print(tb)
+
+    if args.save_file:
+        with open(args.save_file, 'w') as f:
+            json.dump(rows, f, indent=2)
+    if args.csv:
+        save_csv(rows, args.csv)
+    if args.markdown:
+        save_markdown(rows, args.markdown)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            changes = compare(rows, json.load(f), args.tolerance)
+        tb = PrettyTable()
+        tb.field_names = ['model', 'batch', 'field', 'baseline', 'now', 'change', 'regression']
+        for name, batch_size, field, old, new, change, regression in changes:
+            if field == 'status' or regression or abs(change) > args.tolerance:
+                tb.add_row([name, batch_size, field, old if field == 'status' else '{:.4g}'.format(old),
+                            new if field == 'status' else '{:.4g}'.format(new),
+                            '-' if change is None else '{:+.1%}'.format(change), 'yes' if regression else ''])
+        print(tb)
+        regressions = sum(change[-1] for change in changes)
+        logging.info('{} regressions against {} (tolerance {:.0%})'.format(
+            regressions, args.baseline, args.tolerance))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
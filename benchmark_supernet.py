@@ -0,0 +1,152 @@
+import argparse
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+
+import torch
+import torch.nn.functional as F
+from prettytable import PrettyTable
+
+from models.modules import dynamic_ops
+from models.modules.lazy_store import count_parameters
+from models.modules.search_space import get_search_space
+from models.supernet import SuperNet
+from utils.accumulation import SavedBytes
+
+CONV_OPS = ['Full', 'Dynamic', 'Independent', 'FrontShare', 'EndShare', 'Masked']
+BN_OPS = ['Full', 'Dynamic', 'Independent', 'FrontShare', 'EndShare', 'Masked']
+FC_OPS = ['Full', 'Dynamic', 'Independent']
+
+parser = argparse.ArgumentParser("SuperNet-op-benchmark")
+parser.add_argument('--conv', nargs='+', default=CONV_OPS, choices=CONV_OPS, help='conv ops to compare')
+parser.add_argument('--bn', nargs='+', default=BN_OPS, choices=BN_OPS, help='bn ops to compare')
+parser.add_argument('--fc', nargs='+', default=FC_OPS, choices=FC_OPS, help='fc ops to compare')
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--iters', default=10, type=int, help='timed steps per combination')
+parser.add_argument('--warmup', default=2, type=int, help='untimed steps per combination')
+parser.add_argument('--check_archs', default=8, type=int,
+                    help='random archs every combination is checked on')
+parser.add_argument('--num_classes', default=100, type=int)
+parser.add_argument('--seed', default=0, type=int)
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu',
+                    type=str, help='cpu or cuda')
+parser.add_argument('--save_file', default=None, type=str, help='json file the results are saved to')
+
+
+def random_archs(num, rng):
+    return [[rng.choice(choices) for choices in get_search_space().setting] for _ in range(num)]
+
+
+def build_supernet(conv, bn, fc, num_classes=100):
+    return SuperNet(getattr(dynamic_ops, conv + 'Conv'), getattr(dynamic_ops, bn + 'BN'),
+                    getattr(dynamic_ops, fc + 'FC'), num_classes=num_classes)
+
+
+def check(model, archs, batch_size, device):
+    '''forward and backward every arch, the logits must be (B, num_classes) and finite'''
+    x = torch.randn(batch_size, 3, 32, 32, device=device)
+    for arch in archs:
+        model.zero_grad(set_to_none=True)
+        out = model(x, arch)
+        if out.shape != (batch_size, model.num_classes):
+            raise ValueError('output {} for arch {}'.format(tuple(out.shape), arch))
+        if not torch.isfinite(out).all():
+            raise ValueError('non finite output for arch {}'.format(arch))
+        out.mean().backward()
+
+
+def benchmark(model, archs, batch_size, device, warmup=2):
+    '''
+    (forward imgs/s, forward+backward imgs/s, peak MB): one random arch per
+    step. peak is the max allocated cuda memory of a training step, on cpu
+    the bytes autograd saves for backward plus the parameters and grads.
+    '''
+    x = torch.randn(batch_size, 3, 32, 32, device=device)
+    y = torch.randint(0, model.num_classes, (batch_size,), device=device)
+
+    def sync():
+        if device.startswith('cuda'):
+            torch.cuda.synchronize()
+
+    with torch.no_grad():
+        for arch in archs[:warmup]:
+            model(x, arch)
+        sync()
+        start = time.time()
+        for arch in archs[warmup:]:
+            model(x, arch)
+        sync()
+        forward = batch_size * (len(archs) - warmup) / (time.time() - start)
+
+    for arch in archs[:warmup]:
+        F.cross_entropy(model(x, arch), y).backward()
+    if device.startswith('cuda'):
+        torch.cuda.reset_peak_memory_stats()
+    sync()
+    start = time.time()
+    saved = 0
+    for arch in archs[warmup:]:
+        model.zero_grad(set_to_none=True)
+        with SavedBytes() as counter:
+            loss = F.cross_entropy(model(x, arch), y)
+        saved = max(saved, counter.bytes)
+        loss.backward()
+    sync()
+    train = batch_size * (len(archs) - warmup) / (time.time() - start)
+
+    if device.startswith('cuda'):
+        peak = torch.cuda.max_memory_allocated()
+    else:
+        # params and grads of the touched entries only, as count_parameters
+        peak = saved + 2 * count_parameters(model) * next(model.parameters()).element_size()
+    return forward, train, peak / 2 ** 20
+
+
+def main():
+    args = parser.parse_args()
+    log_format = '%(asctime)s %(message)s'
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format=log_format, datefmt='%m/%d %I:%M:%S %p')
+    rng = random.Random(args.seed)
+    torch.manual_seed(args.seed)
+    check_archs = random_archs(args.check_archs, rng)
+    # the widest and the narrowest arch are always checked
+    check_archs += [[max(c) for c in get_search_space().setting], [min(c) for c in get_search_space().setting]]
+    bench_archs = random_archs(args.warmup + args.iters, rng)
+
+    tb = PrettyTable()
+    tb.field_names = ['conv', 'bn', 'fc', 'params(M)', 'fwd img/s', 'train img/s', 'peak(MB)', 'status']
+    results = []
+    for conv, bn, fc in itertools.product(args.conv, args.bn, args.fc):
+        model = build_supernet(conv, bn, fc, args.num_classes).to(args.device).train()
+        result = {'conv': conv, 'bn': bn, 'fc': fc}
+        try:
+            check(model, check_archs, 4, args.device)
+            result['forward'], result['train'], result['peak_mb'] = benchmark(
+                model, bench_archs, args.batch_size, args.device, args.warmup)
+            result['status'] = 'ok'
+            # the Independent ops only hold the weights of the archs they have seen
+            result['params'] = params = count_parameters(model)
+            tb.add_row([conv, bn, fc, '{:.2f}'.format(params / 1e6), '{:.0f}'.format(result['forward']),
+                        '{:.0f}'.format(result['train']), '{:.1f}'.format(result['peak_mb']), 'ok'])
+        except (RuntimeError, ValueError) as e:
+            result['status'] = str(e).splitlines()[0]
+            result['params'] = params = count_parameters(model)
+            tb.add_row([conv, bn, fc, '{:.2f}'.format(params / 1e6), '-', '-', '-', result['status'][:40]])
+        logging.info('{}Conv {}BN {}FC: {}'.format(conv, bn, fc, result['status']))
+        results.append(result)
+        del model
+        if args.device.startswith('cuda'):
+            torch.cuda.empty_cache()
+
+    print(tb)
+    if args.save_file:
+        with open(args.save_file, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
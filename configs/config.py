@@ -1,22 +1,4 @@
-SuperNetSetting = [
-    [4, 8, 12, 16],  # 1
-    [4, 8, 12, 16],  # 2
-    [4, 8, 12, 16],  # 3
-    [4, 8, 12, 16],  # 4
-    [4, 8, 12, 16],  # 5
-    [4, 8, 12, 16],  # 6
-    [4, 8, 12, 16],  # 7
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 8
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 9
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 10
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 11
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 12
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 13
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 14
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 15
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 16
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 17
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 18
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 19
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # fc
-]
\ No newline at end of file
+from models.modules.search_space import load_supernet_setting
+
+# single source of truth: configs/meta.yml
+SuperNetSetting = [list(choices) for choices in load_supernet_setting()]
@@ -0,0 +1,202 @@
+'''
+AutoAugment CIFAR10Policy on (B, 3, H, W) uint8 batches.
+
+every image draws its sub-policy, images are grouped by sub-policy and
+every operation runs once on its whole group. the operations follow the
+PIL ones of datasets/autoaugmentation.py (same magnitudes, same fill).
+'''
+import math
+
+import torch
+import torch.nn.functional as F
+
+from datasets.autoaugmentation import CIFAR10_POLICIES, RANGES
+
+
+def _signs(n, device):
+    return torch.randint(0, 2, (n,), device=device).float() * 2 - 1
+
+
+def _affine(x, matrix, mode, fill=128):
+    '''
+    PIL Image.transform(AFFINE): output pixel (x, y) reads input pixel
+    matrix @ (x, y, 1), in pixel coordinates. matrix: (B, 2, 3).
+    '''
+    b, _, h, w = x.shape
+    ys, xs = torch.meshgrid(torch.arange(h, device=x.device, dtype=torch.float32) + 0.5,
+                            torch.arange(w, device=x.device, dtype=torch.float32) + 0.5,
+                            indexing='ij')
+    coords = torch.stack([xs, ys, torch.ones_like(xs)], dim=-1).view(1, -1, 3)
+    src = coords @ matrix.transpose(1, 2)  # (B, H*W, 2)
+    grid = torch.stack([src[..., 0] * 2 / w - 1, src[..., 1] * 2 / h - 1], dim=-1).view(b, h, w, 2)
+    # PIL fills the pixels read from outside the image, the others (bicubic
+    # near the border included) only see clamped image pixels
+    out = F.grid_sample(x.float(), grid, mode=mode, padding_mode='border', align_corners=False)
+    outside = ((src[..., 0] < 0) | (src[..., 0] >= w) | (src[..., 1] < 0) | (src[..., 1] >= h)).view(b, 1, h, w)
+    return _to_uint8(out.masked_fill_(outside, fill))
+
+
+def _to_uint8(x):
+    return x.round_().clamp_(0, 255).to(torch.uint8)
+
+
+def _blend(degenerate, x, factor):
+    '''PIL ImageEnhance: degenerate + factor * (x - degenerate), factor (B,)'''
+    factor = factor.view(-1, 1, 1, 1)
+    return _to_uint8(degenerate + factor * (x.float() - degenerate))
+
+
+def _grayscale(x):
+    '''PIL convert('L'), (B, 1, H, W) float'''
+    r, g, b = x.float().unbind(1)
+    return (r * 0.299 + g * 0.587 + b * 0.114).round_().unsqueeze(1)
+
+
+def shear_x(x, magnitude):
+    matrix = x.new_zeros(x.size(0), 2, 3, dtype=torch.float32)
+    matrix[:, 0, 0] = matrix[:, 1, 1] = 1
+    matrix[:, 0, 1] = magnitude * _signs(x.size(0), x.device)
+    return _affine(x, matrix, 'bicubic')
+
+
+def shear_y(x, magnitude):
+    matrix = x.new_zeros(x.size(0), 2, 3, dtype=torch.float32)
+    matrix[:, 0, 0] = matrix[:, 1, 1] = 1
+    matrix[:, 1, 0] = magnitude * _signs(x.size(0), x.device)
+    return _affine(x, matrix, 'bicubic')
+
+
+def translate_x(x, magnitude):
+    matrix = x.new_zeros(x.size(0), 2, 3, dtype=torch.float32)
+    matrix[:, 0, 0] = matrix[:, 1, 1] = 1
+    matrix[:, 0, 2] = magnitude * x.size(3) * _signs(x.size(0), x.device)
+    return _affine(x, matrix, 'nearest')
+
+
+def translate_y(x, magnitude):
+    matrix = x.new_zeros(x.size(0), 2, 3, dtype=torch.float32)
+    matrix[:, 0, 0] = matrix[:, 1, 1] = 1
+    matrix[:, 1, 2] = magnitude * x.size(2) * _signs(x.size(0), x.device)
+    return _affine(x, matrix, 'nearest')
+
+
+def rotate(x, magnitude):
+    '''counter clockwise around the center, as Image.rotate'''
+    h, w = x.shape[2:]
+    angle = -math.radians(magnitude)
+    cx, cy = w / 2, h / 2
+    cos, sin = math.cos(angle), math.sin(angle)
+    matrix = torch.tensor([[cos, sin, cx - cos * cx - sin * cy],
+                           [-sin, cos, cy + sin * cx - cos * cy]], device=x.device)
+    return _affine(x, matrix.expand(x.size(0), 2, 3), 'nearest')
+
+
+def color(x, magnitude):
+    return _blend(_grayscale(x), x, 1 + magnitude * _signs(x.size(0), x.device))
+
+
+def contrast(x, magnitude):
+    mean = _grayscale(x).mean(dim=(1, 2, 3), keepdim=True).add_(0.5).floor_()
+    return _blend(mean, x, 1 + magnitude * _signs(x.size(0), x.device))
+
+
+def brightness(x, magnitude):
+    return _blend(torch.zeros(1, device=x.device), x, 1 + magnitude * _signs(x.size(0), x.device))
+
+
+def sharpness(x, magnitude):
+    '''blend with the PIL SMOOTH filtered image, whose one pixel border is the original'''
+    kernel = torch.ones(3, 3, device=x.device)
+    kernel[1, 1] = 5
+    kernel = (kernel / 13).expand(x.size(1), 1, 3, 3)
+    degenerate = x.float()
+    smooth = F.conv2d(degenerate, kernel, groups=x.size(1)).round_()
+    degenerate = degenerate.clone()
+    degenerate[:, :, 1:-1, 1:-1] = smooth
+    return _blend(degenerate, x, 1 + magnitude * _signs(x.size(0), x.device))
+
+
+def posterize(x, bits):
+    return x & (256 - (1 << (8 - int(bits))))
+
+
+def solarize(x, threshold):
+    return torch.where(x < threshold, x, 255 - x)
+
+
+def autocontrast(x):
+    '''stretch every channel of every image to [0, 255]'''
+    low = x.amin(dim=(2, 3), keepdim=True).float()
+    high = x.amax(dim=(2, 3), keepdim=True).float()
+    scale = 255 / (high - low).clamp_(min=1)
+    out = _to_uint8((x.float() - low) * scale)
+    return torch.where(high > low, out, x)
+
+
+def equalize(x):
+    '''histogram equalization of every channel of every image, as ImageOps.equalize'''
+    b, c, h, w = x.shape
+    flat = x.reshape(b * c, h * w).long()
+    hist = torch.zeros(b * c, 256, device=x.device).scatter_add_(1, flat, torch.ones_like(flat, dtype=torch.float))
+    # the count of the last non empty bin, i.e. of the brightest value
+    last = hist.gather(1, flat.amax(dim=1, keepdim=True))
+    step = torch.div(h * w - last, 255, rounding_mode='floor')
+    lut = torch.div(torch.cumsum(hist, dim=1) - hist + torch.div(step, 2, rounding_mode='floor'),
+                    step.clamp(min=1), rounding_mode='floor').clamp_(max=255)
+    out = lut.gather(1, flat).to(torch.uint8)
+    return torch.where(step > 0, out, flat.to(torch.uint8)).view(b, c, h, w)
+
+
+def invert(x):
+    return 255 - x
+
+
+OPERATIONS = {
+    "shearX": shear_x,
+    "shearY": shear_y,
+    "translateX": translate_x,
+    "translateY": translate_y,
+    "rotate": rotate,
+    "color": color,
+    "posterize": posterize,
+    "solarize": solarize,
+    "contrast": contrast,
+    "sharpness": sharpness,
+    "brightness": brightness,
+    "autocontrast": lambda x, magnitude: autocontrast(x),
+    "equalize": lambda x, magnitude: equalize(x),
+    "invert": lambda x, magnitude: invert(x),
+}
+
+
+class SubPolicy(object):
+    def __init__(self, p1, operation1, magnitude_idx1, p2, operation2, magnitude_idx2):
+        self.steps = [(p1, OPERATIONS[operation1], RANGES[operation1][magnitude_idx1]),
+                      (p2, OPERATIONS[operation2], RANGES[operation2][magnitude_idx2])]
+
+    def __call__(self, x):
+        for p, operation, magnitude in self.steps:
+            idx = (torch.rand(x.size(0), device=x.device) < p).nonzero().squeeze(1)
+            if len(idx):
+                x = x.index_copy(0, idx, operation(x[idx], magnitude))
+        return x
+
+
+class CIFAR10Policy(object):
+    """ Every image of the batch draws one of the best 25 Sub-policies on CIFAR10.
+    """
+
+    def __init__(self):
+        self.policies = [SubPolicy(*policy) for policy in CIFAR10_POLICIES]
+
+    def __call__(self, x):
+        assert x.dtype == torch.uint8, 'AutoAugment runs on uint8 batches'
+        choice = torch.randint(0, len(self.policies), (x.size(0),), device=x.device)
+        out = torch.empty_like(x)
+        for k in choice.unique().tolist():
+            idx = (choice == k).nonzero().squeeze(1)
+            out[idx] = self.policies[k](x[idx])
+        return out
+
+    def __repr__(self):
+        return "AutoAugment CIFAR10 Policy (batched)"
@@ -0,0 +1,165 @@
+'''
+transforms on whole (B, C, H, W) batches, randomness drawn per sample
+with one call per batch instead of one PIL op per image.
+'''
+import torch
+
+from datasets.batch_autoaugment import CIFAR10Policy
+
+
+def random_crop(x, size=32, padding=4):
+    '''zero pad and crop every image at its own random offset, as T.RandomCrop(size, padding)'''
+    b = x.size(0)
+    padded = torch.nn.functional.pad(x, (padding, padding, padding, padding))
+    max_offset = padded.size(-1) - size
+    dy = torch.randint(0, max_offset + 1, (b, 1), device=x.device)
+    dx = torch.randint(0, max_offset + 1, (b, 1), device=x.device)
+    grid = torch.arange(size, device=x.device).view(1, -1)
+    rows = (grid + dy).view(b, 1, size, 1)
+    cols = (grid + dx).view(b, 1, 1, size)
+    batch = torch.arange(b, device=x.device).view(b, 1, 1, 1)
+    channels = torch.arange(x.size(1), device=x.device).view(1, -1, 1, 1)
+    return padded[batch, channels, rows, cols]
+
+
+def random_flip(x, p=0.5):
+    '''flip every image horizontally with probability p'''
+    flip = torch.rand(x.size(0), device=x.device) < p
+    return torch.where(flip.view(-1, 1, 1, 1), x.flip(-1), x)
+
+
+def cutout(x, length):
+    '''zero one length x length square per image, centered anywhere (clipped at the border)'''
+    b, _, h, w = x.shape
+    cy = torch.randint(0, h, (b, 1, 1), device=x.device)
+    cx = torch.randint(0, w, (b, 1, 1), device=x.device)
+    ys = torch.arange(h, device=x.device).view(1, h, 1)
+    xs = torch.arange(w, device=x.device).view(1, 1, w)
+    inside = (ys >= cy - length // 2) & (ys < cy + length // 2) & \
+        (xs >= cx - length // 2) & (xs < cx + length // 2)
+    return x * (~inside).unsqueeze(1).to(x.dtype)
+
+
+def to_float(x):
+    '''uint8 [0, 255] -> float [0, 1], as T.ToTensor'''
+    return x.float().div_(255)
+
+
+def normalize(x, mean, std):
+    mean = torch.as_tensor(mean, dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+    std = torch.as_tensor(std, dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+    return (x - mean) / std
+
+
+def mixup(x, y, alpha=1.0):
+    '''mix every sample with a random other one of the batch, as transforms.mixup_data but on x's device'''
+    lam = float(torch.distributions.Beta(alpha, alpha).sample()) if alpha > 0 else 1.
+    index = torch.randperm(x.size(0), device=x.device)
+    return lam * x + (1 - lam) * x[index], y, y[index], lam
+
+
+class RandomCrop(object):
+    def __init__(self, size=32, padding=4):
+        self.size = size
+        self.padding = padding
+
+    def __call__(self, x):
+        return random_crop(x, self.size, self.padding)
+
+
+class RandomHorizontalFlip(object):
+    def __init__(self, p=0.5):
+        self.p = p
+
+    def __call__(self, x):
+        return random_flip(x, self.p)
+
+
+class Cutout(object):
+    def __init__(self, length):
+        self.length = length
+
+    def __call__(self, x):
+        return cutout(x, self.length)
+
+
+class ToFloat(object):
+    def __call__(self, x):
+        return to_float(x) if x.dtype == torch.uint8 else x
+
+
+class Normalize(object):
+    def __init__(self, mean, std):
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, x):
+        return normalize(x, self.mean, self.std)
+
+
+class Compose(object):
+    def __init__(self, transforms):
+        self.transforms = transforms
+
+    def __call__(self, x):
+        for t in self.transforms:
+            x = t(x)
+        return x
+
+
+class Mixup(object):
+    '''the only stage that needs the labels: (x, y) -> (mixed x, y_a, y_b, lam)'''
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+
+    def __call__(self, x, y):
+        return mixup(x, y, self.alpha)
+
+
+def get_batch_transforms(mean, std, train=True, cutout=0, autoaug=None):
+    '''
+    batch equivalent of DatasetTransforms: crop/flip/autoaugment/cutout
+    (train) and normalization, on uint8 batches.
+    autoaug: AutoAugment CIFAR10Policy, by default when cutout is off as
+    DatasetTransforms.get_train_transforms.
+    '''
+    if autoaug is None:
+        autoaug = cutout == 0
+    transforms = [RandomCrop(32, 4), RandomHorizontalFlip()] if train else []
+    if train and autoaug:
+        transforms.append(CIFAR10Policy())
+    transforms.append(ToFloat())
+    if train and cutout > 0:
+        transforms.append(Cutout(cutout))
+    transforms.append(Normalize(mean, std))
+    return Compose(transforms)
+
+
+class BatchAugmentLoader(object):
+    '''
+    wrap any loader of collated (x, y) batches: move every batch to device
+    and run the batch transforms there, after the collate step.
+    '''
+
+    def __init__(self, loader, transform, device='cpu'):
+        self.loader = loader
+        self.transform = transform
+        self.device = torch.device(device)
+
+    @property
+    def dataset(self):
+        return self.loader.dataset
+
+    @property
+    def batch_size(self):
+        return self.loader.batch_size
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for x, y in self.loader:
+            x = x.to(self.device, non_blocking=True)
+            y = y.to(self.device, non_blocking=True)
+            yield self.transform(x), y
@@ -1,7 +1,6 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-import json
 import random
 
 import numpy as np
@@ -11,30 +10,27 @@ from torchvision import transforms
 from torchvision.datasets import CIFAR100
 from torchvision.datasets.cifar import CIFAR10, CIFAR100
 
+from datasets.batch_transforms import BatchAugmentLoader
+from datasets.tensor_dataset import get_tensor_loader
 from datasets.transforms import DatasetTransforms
+from models.modules.search_space import get_search_space
+from utils.arch_table import open_arch_table
 
 
 class ArchDataSet(torch.utils.data.Dataset):
     def __init__(self, path):
         super(ArchDataSet, self).__init__()
         assert path is not None
-        with open(path, "r") as f:
-            self.arch_dict = json.load(f)
-
-        self.arc_list = []
-        self.arc_key = []
-
-        for key, v in self.arch_dict.items():
-            self.arc_list.append(v["arch"])
-            self.arc_key.append(key)
+        # memory mapped arch table, built from the json on first use
+        self.table = open_arch_table(path)
 
     def __getitem__(self, index):
-        tmp_arc = self.arc_list[index]
-        tmp_key = self.arc_key[index]
+        tmp_arc = '-'.join(map(str, self.table.widths[index].tolist()))
+        tmp_key = str(self.table.keys[index])
         return tmp_key, tmp_arc
 
     def __len__(self):
-        return len(self.arch_dict)
+        return len(self.table)
 
 
 class ArchLoader():
@@ -42,106 +38,95 @@ class ArchLoader():
     load arch from json file
     '''
 
-    def __init__(self, path):
+    def __init__(self, path=None):
         super(ArchLoader, self).__init__()
 
         self.arc_list = []
-        self.arc_dict = {}
-        self.get_arch_list_dict(path)
+        self.table = None
+        if path is not None:
+            self.get_arch_list_dict(path)
         self.idx = -1
 
-        self.level_config = {
-            "level1": [4, 8, 12, 16],
-            "level2": [4, 8, 12, 16, 20, 24, 28, 32],
-            "level3": [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64]
-        }
+        self.space = get_search_space()
+        self.level_config = self.space.level_config
+        # [(choices, layer ids)] of every level, sampled together
+        self.levels = [(choices, np.array([i for i, c in enumerate(self.space.setting) if c == choices]))
+                       for choices in self.level_config.values()]
 
     def get_arch_list(self):
-        arc_int_list = []
-        for str_arc in self.arc_list:
-            arc_int_list.append(self.convert_str_arc_list(str_arc))
-        return arc_int_list
+        return self.table.widths.tolist()
+
+    def get_arch_tensor(self):
+        '''(N, 20) choice indices of every arch in the file'''
+        return self.space.encode(torch.from_numpy(self.table.widths.astype(np.int64)))
 
     def get_arch_dict(self):
-        return self.arc_dict
+        return self.table.to_dict() if self.table is not None else {}
 
     def get_arch_list_dict(self, path):
-        with open(path, "r") as f:
-            self.arc_dict = json.load(f)
-
-        self.arc_list = []
-
-        for _, v in self.arc_dict.items():
-            self.arc_list.append(v["arch"])
+        self.table = open_arch_table(path)
+        self.arc_list = self.table.arch_strs()
 
     def convert_list_arc_str(self, arc_list):
-        arc_str = ""
-        arc_list = [str(item)+"-" for item in arc_list]
-        for item in arc_list:
-            arc_str += item
-        return arc_str[:-1]
+        return self.space.format(arc_list)
 
     def convert_str_arc_list(self, arc_str):
         return [int(i) for i in arc_str.split('-')]
 
+    def sample(self, n, strategy='uniform', current_epoch=0, total_epoch=1,
+               prob_ratio=1.0, rng=np.random):
+        '''
+        sample n archs as an (n, 20) int array of channel numbers,
+        with one vectorized draw per level.
+
+        uniform          every choice of a layer equally likely (spos)
+        fair             every choice of a layer is taken equally often over
+                         the n archs, in a random order (fairnas)
+        width_to_narrow  softmax(linspace(p, 1 - p)) with p the training
+                         progress, moves from wide to narrow choices
+        flops            p(choice) proportional to the flops of the choice
+                         (cost model, others at their widest) ** prob_ratio
+        '''
+        archs = np.empty((n, self.space.num_layers), dtype=np.int64)
+        for choices, layers in self.levels:
+            choices = np.asarray(choices)
+            shape = (n, len(layers))
+            if strategy == 'uniform':
+                index = rng.randint(0, len(choices), size=shape)
+            elif strategy == 'fair':
+                # one random permutation of the choices per block of len(choices) archs
+                blocks = -(-n // len(choices))
+                perm = np.argsort(rng.random_sample((len(layers), blocks, len(choices))), axis=-1)
+                index = perm.reshape(len(layers), -1)[:, :n].T
+            elif strategy in ('width_to_narrow', 'flops'):
+                if strategy == 'width_to_narrow':
+                    current_p = float(current_epoch) / total_epoch
+                    p = self.softmax(np.linspace(current_p, 1 - current_p, len(choices)))
+                else:
+                    p = self.level_flops(layers) ** prob_ratio
+                    p = p / p.sum()
+                cdf = np.cumsum(p)
+                index = np.searchsorted(cdf, rng.random_sample(shape) * cdf[-1], side='right')
+                index = np.minimum(index, len(choices) - 1)
+            else:
+                raise ValueError('unknown sample strategy: {}'.format(strategy))
+            archs[:, layers] = choices[index]
+        return archs
+
+    def level_flops(self, layers):
+        '''(num_choices,) mean flops of every choice over the layers of a level'''
+        from utils.cost_model import get_cost_model
+        choice_flops = get_cost_model().choice_flops()
+        return np.mean([choice_flops[layer] for layer in layers], axis=0).astype(np.float64)
+
     def generate_spos_like_batch(self):
-        rngs = []
-        for i in range(0, 7):
-            rngs += np.random.choice(
-                self.level_config["level1"], size=1).tolist()
-        for i in range(7, 13):
-            rngs += np.random.choice(
-                self.level_config['level2'], size=1).tolist()
-        for i in range(13, 20):
-            rngs += np.random.choice(
-                self.level_config['level3'], size=1).tolist()
-        return np.array(rngs)
+        return self.sample(1, 'uniform')[0]
 
     def generate_niu_fair_batch(self, seed):
-        rngs = []
-        seed = seed
-        random.seed(seed)
-        # level1
-        for i in range(0, 7):
-            tmp_rngs = []
-            for _ in range(4):
-                tmp_rngs.extend(random.sample(self.level_config['level1'],
-                                              len(self.level_config['level1'])))
-            rngs.append(tmp_rngs)
-        # level2
-        for i in range(7, 13):
-            tmp_rngs = []
-            for _ in range(2):
-                tmp_rngs.extend(random.sample(self.level_config['level2'],
-                                              len(self.level_config['level2'])))
-            rngs.append(tmp_rngs)
-
-        # level3
-        for i in range(13, 20):
-            rngs.append(random.sample(self.level_config['level3'],
-                                      len(self.level_config['level3'])))
-        return np.transpose(rngs)
+        return self.sample(16, 'fair', rng=np.random.RandomState(seed))
 
     def generate_width_to_narrow(self, current_epoch, total_epoch):
-        current_p = float(current_epoch) / total_epoch
-        opposite_p = 1 - current_p
-        # print(current_p, opposite_p)
-
-        def p_generator(length):
-            rng_list = np.linspace(current_p, opposite_p, length)
-            return self.softmax(rng_list)
-
-        rngs = []
-        for i in range(0, 7):
-            rngs += np.random.choice(self.level_config["level1"], size=1, p=p_generator(
-                len(self.level_config['level1']))).tolist()
-        for i in range(7, 13):
-            rngs += np.random.choice(self.level_config['level2'], size=1, p=p_generator(
-                len(self.level_config['level2']))).tolist()
-        for i in range(13, 20):
-            rngs += np.random.choice(self.level_config['level3'], size=1, p=p_generator(
-                len(self.level_config['level3']))).tolist()
-        return np.array(rngs)
+        return self.sample(1, 'width_to_narrow', current_epoch, total_epoch)[0]
 
     @staticmethod
     def softmax(rng_lst):
@@ -157,19 +142,27 @@ class ArchLoader():
         return softmax
 
 
-def get_train_loader(batch_size, num_workers, clss='cifar100', cutout=0):
+def get_train_loader(batch_size, num_workers, clss='cifar100', cutout=0, backend='torchvision', device='cpu'):
+    '''
+    backend: 'torchvision' (PIL transforms in workers), 'batch' (workers only
+    decode and collate uint8, augmentation runs on whole batches on device)
+    or 'tensor' (uint8 arrays from a .npy cache, no workers at all)
+    '''
     assert clss in ['cifar10', 'cifar100']
+    if backend == 'tensor':
+        return get_tensor_loader(batch_size, clss, train=True, cutout=cutout, device=device)
 
     # 1. get transform
     dt = DatasetTransforms(clss=clss, cutout=cutout)
+    transform = transforms.PILToTensor() if backend == 'batch' else dt.get_train_transforms()
 
     # 2. get dataset
     if clss == 'cifar10':
         train_dataset = CIFAR10(root="./data", train=True,
-                                download=True, transform=dt.get_train_transforms())
+                                download=True, transform=transform)
     elif clss == 'cifar100':
         train_dataset = CIFAR100(
-            root="./data", train=True, download=True, transform=dt.get_train_transforms())
+            root="./data", train=True, download=True, transform=transform)
     else:
         raise "Not support %s" % clss
 
@@ -178,11 +171,15 @@ def get_train_loader(batch_size, num_workers, clss='cifar100', cutout=0):
     train_loader = torch.utils.data.DataLoader(
         train_dataset, num_workers=num_workers, pin_memory=True, batch_size=batch_size, drop_last=True, shuffle=True)
 
+    if backend == 'batch':
+        train_loader = BatchAugmentLoader(train_loader, dt.get_batch_transforms(train=True), device)
     return train_loader
 
 
-def get_val_loader(batch_size, num_workers, clss='cifar10'):
+def get_val_loader(batch_size, num_workers, clss='cifar10', backend='torchvision', device='cpu'):
     assert clss in ['cifar10', 'cifar100']
+    if backend == 'tensor':
+        return get_tensor_loader(batch_size, clss, train=False, device=device)
 
     # 1. get transform
     dt = DatasetTransforms(clss)
@@ -199,5 +196,5 @@ def get_val_loader(batch_size, num_workers, clss='cifar10'):
 
     # 3. get dataloader
     val_loader = torch.utils.data.DataLoader(
-        val_dataset, batch_size=batch_size, shuffle=False, num_workers=0, pin_memory=True)
+        val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, pin_memory=True)
     return val_loader
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import torch
+from torchvision.datasets.cifar import CIFAR10, CIFAR100
+
+from datasets.transforms import DatasetTransforms
+
+
+def load_cifar_arrays(clss='cifar100', train=True, root='./data', mmap=True):
+    '''
+    cifar images as one (N, 3, 32, 32) uint8 array and labels as (N,) int64.
+
+    the first call decodes torchvision's pickles once and saves them as
+    {root}/{clss}-{split}-images.npy / -labels.npy, later calls only
+    np.load them, memory-mapped when mmap is set.
+    '''
+    assert clss in ['cifar10', 'cifar100']
+    split = 'train' if train else 'test'
+    image_path = os.path.join(root, '{}-{}-images.npy'.format(clss, split))
+    label_path = os.path.join(root, '{}-{}-labels.npy'.format(clss, split))
+
+    if not (os.path.exists(image_path) and os.path.exists(label_path)):
+        dataset_cls = CIFAR10 if clss == 'cifar10' else CIFAR100
+        dataset = dataset_cls(root=root, train=train, download=True)
+        # NHWC -> NCHW, contiguous so a batch is one slice per image
+        np.save(image_path, np.ascontiguousarray(dataset.data.transpose(0, 3, 1, 2)))
+        np.save(label_path, np.asarray(dataset.targets, dtype=np.int64))
+
+    images = np.load(image_path, mmap_mode='r' if mmap else None)
+    labels = np.load(label_path)
+    return images, labels
+
+
+class CIFARArrays(torch.utils.data.Dataset):
+    '''uint8 images (numpy, possibly memory-mapped, or a tensor) and int64 labels'''
+
+    def __init__(self, images, labels):
+        self.images = images
+        self.labels = torch.as_tensor(labels, dtype=torch.long)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        image, label = self.batch(torch.tensor([index]))
+        return image[0], label[0]
+
+    def batch(self, indices):
+        '''(B, 3, 32, 32) uint8 images and (B,) labels of indices'''
+        if torch.is_tensor(self.images):
+            return self.images[indices.to(self.images.device)], self.labels[indices]
+        images = torch.from_numpy(np.ascontiguousarray(self.images[indices.numpy()]))
+        return images, self.labels[indices]
+
+    def to(self, device):
+        '''keep the whole uint8 dataset on device, 150MB for cifar train'''
+        self.images = torch.as_tensor(np.ascontiguousarray(self.images)).to(device)
+        self.labels = self.labels.to(device)
+        return self
+
+
+class TensorLoader(object):
+    '''
+    minibatches of a CIFARArrays, each one gathered with a single index op
+    and transformed as a whole batch.
+
+    transform: callable on a (B, 3, 32, 32) uint8 batch on device, returns
+    the network input.
+    '''
+
+    def __init__(self, dataset, batch_size, shuffle=False, drop_last=False,
+                 transform=None, device='cpu'):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.transform = transform
+        self.device = torch.device(device)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return -(-len(self.dataset) // self.batch_size)
+
+    def __iter__(self):
+        num = len(self.dataset)
+        order = torch.randperm(num) if self.shuffle else torch.arange(num)
+        for i in range(len(self)):
+            images, labels = self.dataset.batch(order[i * self.batch_size:(i + 1) * self.batch_size])
+            images = images.to(self.device, non_blocking=True)
+            labels = labels.to(self.device, non_blocking=True)
+            if self.transform is not None:
+                images = self.transform(images)
+            yield images, labels
+
+
+def get_tensor_loader(batch_size, clss='cifar100', train=True, cutout=0, device='cpu',
+                      root='./data', mmap=True, on_device=False):
+    '''
+    on_device: copy the whole uint8 dataset to device once, every batch is
+    then gathered on device with no host work at all.
+    '''
+    dataset = CIFARArrays(*load_cifar_arrays(clss, train, root, mmap))
+    if on_device:
+        dataset.to(device)
+    return TensorLoader(dataset, batch_size, shuffle=train, drop_last=train,
+                        transform=DatasetTransforms(clss, cutout).get_batch_transforms(train),
+                        device=device)
@@ -2,6 +2,7 @@ import numpy as np
 import torch
 from torchvision import transforms as T
 from datasets.autoaugmentation import CIFAR10Policy
+from datasets.batch_transforms import get_batch_transforms
 from torchvision.transforms import transforms
 
 CIFAR10_MEAN = [0.4914, 0.4822, 0.4465]
@@ -45,8 +46,8 @@ def mixup_data(x, y, alpha=1.0):
         lam = 1
 
     bs = x.size()[0]
-    
-    index = torch.randperm(bs).cuda()
+
+    index = torch.randperm(bs, device=x.device)
 
     mixed_x = lam * x + (1-lam) * x[index, :]
 
@@ -65,7 +66,7 @@ class DatasetTransforms:
             self.std = CIFAR100_STD
         else:
             print("Not Support %s dataset." % clss)
-        self.cutout = 0
+        self.cutout = cutout
 
     def _get_cutout(self):
         if self.cutout == 0:
@@ -100,6 +101,10 @@ class DatasetTransforms:
 
         return train_transform
 
+    def get_batch_transforms(self, train=True):
+        '''the same augmentation on whole collated batches, see datasets/batch_transforms.py'''
+        return get_batch_transforms(self.mean, self.std, train, self.cutout)
+
     def get_val_transform(self):
         val_transform = T.Compose([
             T.ToTensor(),
@@ -0,0 +1,161 @@
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from datasets.dataset import get_val_loader
+from models.sample_resnet20 import sample_resnet20
+from utils.arch_table import open_arch_table
+from utils.eval_cache import EvalCache, state_dict_hash
+from utils.evaluator import convert_str_arc_list, eval_config, iter_evaluate, preload
+from utils.journal import ResultJournal, check_journal_dir, load_journal_dir
+
+parser = argparse.ArgumentParser("ResNet20-cifar100-batched-eval")
+parser.add_argument('--eval_json_path', help='json file or arch table (.npy) containing archs to evaluate',
+                    default='data/benchmark.json', type=str)
+parser.add_argument('--model_path', default='weights/model-latest.th',
+                    help='supernet checkpoint', type=str)
+parser.add_argument('--arch_start', default=1, type=int,
+                    help='the start index of eval archs (1-based, file order)')
+parser.add_argument('--arch_num', default=None, type=int,
+                    help='the num of eval archs, all by default')
+parser.add_argument('--group_size', default=None, type=int,
+                    help='num of archs packed in one forward, '
+                         '1 (sliced, shared-prefix reuse) on cpu and 8 on gpu by default')
+parser.add_argument('--chunk_size', default=256, type=int,
+                    help='num of archs sharing cached blocks when group_size is 1')
+parser.add_argument('--batch_size', default=1000, type=int, help='val batch size')
+parser.add_argument('--workers', default=3, type=int, help='num of workers')
+parser.add_argument('--dataset', default='cifar100', type=str, help='cifar10 or cifar100')
+parser.add_argument('--data_backend', default='torchvision', type=str,
+                    help='torchvision or tensor (uint8 .npy cache, batched normalize)')
+parser.add_argument('--track_running_stats', action='store_true',
+                    help='bn track_running_stats')
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu',
+                    type=str, help='cpu or cuda')
+parser.add_argument('--procs', default=1, type=int,
+                    help='num of local processes, each evaluates its own shards')
+parser.add_argument('--shards', default=None, type=int,
+                    help='num of shards the pending archs are split into, procs by default')
+parser.add_argument('--journal_dir', default=None, type=str,
+                    help='append-only result journal, <save_dir>/<save_file>.journal by default')
+parser.add_argument('--eval_cache', default='data/eval_cache.sqlite', type=str,
+                    help='sqlite cache of results keyed by weights and eval config, empty to disable')
+parser.add_argument('--save_dir', default='eval', type=str,
+                    help='the directory used to save the result')
+parser.add_argument('--save_file', default='eval-final', type=str,
+                    help='the file used to save the result')
+
+
+def load_supernet(model_path, device, track_running_stats=False):
+    model = sample_resnet20(track_running_stats=track_running_stats)
+    checkpoint = torch.load(model_path, map_location='cpu')
+    model.load_state_dict(checkpoint['state_dict'])
+    return model.to(device)
+
+
+def run_shard(args, shard_id, keys, arch_strs):
+    '''
+    evaluate one shard and journal every group as soon as it is scored.
+    runs in a pool worker, so it loads its own model and data.
+    '''
+    if args.procs > 1 and args.device == 'cpu':
+        torch.set_num_threads(max(1, mp.cpu_count() // args.procs))
+
+    model = load_supernet(args.model_path, args.device, args.track_running_stats)
+    val_loader = get_val_loader(args.batch_size, args.workers, clss=args.dataset,
+                                backend=args.data_backend, device=args.device)
+    journal = ResultJournal(os.path.join(args.journal_dir, 'shard-{:03d}.jsonl'.format(shard_id)))
+
+    cache = None
+    if args.eval_cache:
+        cache = EvalCache(args.eval_cache, model, eval_config(
+            val_loader, dataset=args.dataset, track_running_stats=args.track_running_stats))
+        hit = cache.get(arch_strs)
+        journal.append([{'key': key, 'arch': arch, 'acc': hit[arch][0], 'loss': hit[arch][1]}
+                        for key, arch in zip(keys, arch_strs) if arch in hit])
+        todo = [i for i, arch in enumerate(arch_strs) if arch not in hit]
+        keys, arch_strs = [keys[i] for i in todo], [arch_strs[i] for i in todo]
+        if not keys:
+            return 0
+
+    batches = preload(val_loader, args.device)
+    archs = np.array([convert_str_arc_list(arch) for arch in arch_strs])
+    for idx, top1, loss in iter_evaluate(model, batches, archs, args.group_size,
+                                         args.chunk_size, verbose=args.procs == 1):
+        journal.append([{'key': keys[i], 'arch': arch_strs[i], 'acc': float(acc),
+                         'loss': float(l)} for i, acc, l in zip(idx, top1, loss)])
+        if cache is not None:
+            cache.put([arch_strs[i] for i in idx], top1, loss)
+    return len(keys)
+
+
+def main():
+    args = parser.parse_args()
+    if args.group_size is None:
+        args.group_size = 1 if args.device == 'cpu' else 8
+    if args.shards is None:
+        args.shards = args.procs
+    if args.journal_dir is None:
+        args.journal_dir = os.path.join(args.save_dir, '{}.journal'.format(args.save_file))
+
+    if not os.path.exists(args.save_dir):
+        os.makedirs(args.save_dir)
+
+    log_format = '%(asctime)s %(message)s'
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format=log_format, datefmt='%m/%d %I:%M:%S %p')
+    logging.info(args)
+
+    table = open_arch_table(args.eval_json_path)
+    keys = table.keys[args.arch_start - 1:].tolist()
+    if args.arch_num is not None:
+        keys = keys[:args.arch_num]
+
+    # resume only from results of the same weights and eval settings,
+    # and skip a key only when it was journaled for the same arch
+    checkpoint = torch.load(args.model_path, map_location='cpu')
+    check_journal_dir(args.journal_dir, {
+        'model': state_dict_hash(checkpoint['state_dict']), 'dataset': args.dataset,
+        'data_backend': args.data_backend, 'batch_size': args.batch_size,
+        'track_running_stats': args.track_running_stats})
+    del checkpoint
+    done = load_journal_dir(args.journal_dir)
+    pending = [key for key in keys if key not in done or done[key]['arch'] != table.arch_str(key)]
+    logging.info('{} archs, {} already journaled, {} pending'.format(
+        len(keys), len(keys) - len(pending), len(pending)))
+
+    t0 = time.time()
+    if pending:
+        # contiguous shards keep neighbouring archs (and their shared blocks) together
+        shards = [list(shard) for shard in np.array_split(pending, args.shards) if len(shard)]
+        tasks = [(args, i, shard, [table.arch_str(key) for key in shard])
+                 for i, shard in enumerate(shards)]
+        if args.procs > 1:
+            with mp.get_context('spawn').Pool(args.procs) as pool:
+                for num in pool.starmap(run_shard, tasks):
+                    logging.info('shard done: {} archs evaluated'.format(num))
+        else:
+            for task in tasks:
+                run_shard(*task)
+    logging.info('evaluated {} archs in {:.1f}s'.format(len(pending), time.time() - t0))
+
+    done = load_journal_dir(args.journal_dir)
+    result_dict = {}
+    for key in keys:
+        result_dict[key] = {'acc': done[key]['acc'], 'arch': table.arch_str(key)}
+
+    save_json = os.path.join(args.save_dir, '{}.json'.format(args.save_file))
+    with open(save_json, 'w') as f:
+        json.dump(result_dict, f)
+    logging.info('saved {}'.format(save_json))
+
+
+if __name__ == '__main__':
+    main()
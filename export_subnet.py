@@ -0,0 +1,84 @@
+import argparse
+import logging
+import sys
+
+import torch
+from torchvision.datasets import CIFAR10, CIFAR100
+
+from datasets.dataset import get_val_loader
+from datasets.transforms import DatasetTransforms
+from models.sample_resnet20 import sample_resnet20
+from utils.bn_calibration import BNCalibrator, calibration_images
+from utils.export import export_subnet, fold_bn, save_subnet
+
+parser = argparse.ArgumentParser("ResNet20-subnet-export")
+parser.add_argument('--arch', required=True, type=str,
+                    help='arch string, 20 channel numbers joined by -')
+parser.add_argument('--model_path', default='weights/model-latest.th',
+                    help='supernet checkpoint', type=str)
+parser.add_argument('--output', default=None, type=str,
+                    help='exported subnet, subnet-<arch>.th by default')
+parser.add_argument('--num_classes', default=100, type=int)
+parser.add_argument('--track_running_stats', action='store_true',
+                    help='the supernet was trained with bn track_running_stats, skip calibration')
+parser.add_argument('--calibrate_num', default=10000, type=int,
+                    help='num of train images the bn stats of the subnet are calibrated on')
+parser.add_argument('--calibrate_batch', default=2000, type=int, help='calibration batch size')
+parser.add_argument('--no_fold_bn', action='store_true', help='keep bn layers instead of folding them')
+parser.add_argument('--verify', action='store_true',
+                    help='compare the exported subnet with the supernet on the val set')
+parser.add_argument('--batch_size', default=1000, type=int, help='val batch size')
+parser.add_argument('--workers', default=3, type=int, help='num of workers')
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu',
+                    type=str, help='cpu or cuda')
+
+
+def main():
+    args = parser.parse_args()
+    log_format = '%(asctime)s %(message)s'
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format=log_format, datefmt='%m/%d %I:%M:%S %p')
+    arch = [int(w) for w in args.arch.split('-')]
+    clss = 'cifar10' if args.num_classes == 10 else 'cifar100'
+
+    # running stats buffers are needed even if the checkpoint has none
+    supernet = sample_resnet20(track_running_stats=True, num_classes=args.num_classes)
+    checkpoint = torch.load(args.model_path, map_location='cpu')
+    supernet.load_state_dict(checkpoint['state_dict'], strict=args.track_running_stats)
+    supernet = supernet.to(args.device).eval()
+
+    if not args.track_running_stats:
+        dataset_cls = CIFAR10 if clss == 'cifar10' else CIFAR100
+        train_set = dataset_cls(root='./data', train=True, download=True,
+                                transform=DatasetTransforms(clss).get_val_transform())
+        loader = torch.utils.data.DataLoader(train_set, batch_size=args.calibrate_batch,
+                                             shuffle=False, num_workers=args.workers)
+        images = calibration_images(loader, args.calibrate_num, args.device)
+        BNCalibrator(supernet, images, capacity=1, batch_size=args.calibrate_batch).apply(arch)
+        logging.info('calibrated bn stats on {} images'.format(images.size(0)))
+
+    model = export_subnet(supernet, arch, args.num_classes)
+    if not args.no_fold_bn:
+        model = fold_bn(model)
+    logging.info('{} params'.format(sum(p.numel() for p in model.parameters())))
+
+    if args.verify:
+        val_loader = get_val_loader(args.batch_size, args.workers, clss=clss)
+        correct, max_diff, total = 0, 0., 0
+        with torch.no_grad():
+            for x, y in val_loader:
+                x, y = x.to(args.device), y.to(args.device)
+                logits = model(x)
+                max_diff = max(max_diff, (logits - supernet(x, arch)).abs().max().item())
+                correct += (logits.argmax(dim=1) == y).sum().item()
+                total += y.size(0)
+        logging.info('top1 {:.2f}, max logit diff to the supernet {:.2e}'.format(
+            100. * correct / total, max_diff))
+
+    output = args.output or 'subnet-{}.th'.format(args.arch)
+    save_subnet(output, model, arch, folded=not args.no_fold_bn)
+    logging.info('saved {}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
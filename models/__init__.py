@@ -1,101 +1,152 @@
 from __future__ import absolute_import
 
-from models.cbam_resnext import cbam_resnext29_8x64d, cbam_resnext29_16x64d
-from models.genet import ge_resnext29_8x64d, ge_resnext29_16x64d
-from models.shake_shake import shake_resnet26_2x32d, shake_resnet26_2x64d
-from models.sknet import sk_resnext29_16x32d, sk_resnext29_16x64d
-from models.squeezenet import squeezenet
-from models.stochasticdepth import (stochastic_depth_resnet18,
-                                    stochastic_depth_resnet34,
-                                    stochastic_depth_resnet50,
-                                    stochastic_depth_resnet101,
-                                    stochastic_depth_resnet152)
-from models.xception import xception
-
-from .attention import *
-from .densenet import *
-from .dla import *
-from .dpn import DPN26
-from .dynamic_resnet20 import *
-from .efficientnetb0 import *
-from .googlenet import *
-from .inceptionv3 import *
-from .inceptionv4 import *
-from .lenet import *
-from .masked_resnet20 import *
-from .mobilenet import *
-from .mobilenetv2 import *
-from .nasnet import *
-from .pnasnet import *
-from .preact_resnet import *
-from .regnet import *
-from .resnet import *
-from .resnet20 import *
-from .resnext import *
-from .rir import *
-from .sample_resnet20 import *
-from .senet import *
-from .shufflenet import *
-from .shufflenetv2 import *
-from .slimmable_resnet20 import *
-from .stochasticdepth import *
-from .supernet import *
-from .vgg import *
-from .wideresidual import *
-from .xception import *
+import importlib
+
+# 模型按需导入: build_model 只导入被选中的那个模型文件
 
 __model_factory = {
-    'dynamic': dynamic_resnet20,# 参考once for all那版
-    'masked': masked_resnet20, #基于mask进行实现
-    'resnet20': resnet20,
-    'sample': sample_resnet20,
-    'slimmable': slimmable_resnet20, #最开始那版slimmable network
-    'super': SuperNet,
-    'densenet': densenet_cifar,
-    'senet': senet18_cifar,
-    'googlenet': GoogLeNet,
-    'dla': DLA,
-    'shufflenet': ShuffleNetG2,
-    'shufflenetv2': ShuffleNetV2,
-    'resnet18': ResNet18,
-    'resnet34': ResNet34,
-    'resnet50': ResNet50,
-    'efficientnetb0': EfficientNetB0,
-    'lenet': LeNet,
-    'mobilenet': MobileNet,
-    'mobilenetv2': MobileNetV2,
-    'pnasnet': PNASNetB,
-    'preact_resnet': PreActResNet18,
-    'regnet': RegNetX_200MF,
-    'resnext': ResNeXt29_2x64d,
-    'vgg': vgg11,
-    'attention56': attention56,
-    'attention92': attention92,
-    'inceptionv3': inceptionv3,
-    'inceptionv4': inceptionv4,
-    'inception_resnet_v2': inception_resnet_v2,
-    'nasnet': nasnet,
-    'rir': resnet_in_resnet,
-    'squeezenet': squeezenet,
-    'stochastic_depth_resnet18': stochastic_depth_resnet18,
-    'stochastic_depth_resnet34': stochastic_depth_resnet34,
-    'stochastic_depth_resnet50': stochastic_depth_resnet50,
-    'stochastic_depth_resnet101': stochastic_depth_resnet101,
-    'stochastic_depth_resnet152': stochastic_depth_resnet152,
-    'wideresnet': wideresnet,
-    'xception': xception,
-    'dpn': DPN26,
-    'shake_resnet26_2x32d': shake_resnet26_2x32d,
-    'shake_resnet26_2x64d': shake_resnet26_2x64d,
-    'ge_resnext29_8x64d': ge_resnext29_8x64d,
-    'ge_resnext29_16x64d': ge_resnext29_16x64d,
-    'sk_resnext29_16x32d': sk_resnext29_16x32d,
-    'sk_resnext29_16x64d': sk_resnext29_16x64d,
-    'cbam_resnext29_16x64d': cbam_resnext29_16x64d,
-    'cbam_resnext29_8x64d': cbam_resnext29_8x64d
+    'dynamic': ('dynamic_resnet20', 'dynamic_resnet20'),  # 参考once for all那版
+    'masked': ('masked_resnet20', 'masked_resnet20'),  # 基于mask进行实现
+    'resnet20': ('resnet20', 'resnet20'),
+    'sample': ('sample_resnet20', 'sample_resnet20'),
+    'slimmable': ('slimmable_resnet20', 'slimmable_resnet20'),  # 最开始那版slimmable network
+    'super': ('supernet', 'SuperNet'),
+    'densenet': ('densenet', 'densenet_cifar'),
+    'senet': ('senet', 'senet18_cifar'),
+    'googlenet': ('googlenet', 'GoogLeNet'),
+    'dla': ('dla', 'DLA'),
+    'shufflenet': ('shufflenet', 'ShuffleNetG2'),
+    'shufflenetv2': ('shufflenetv2', 'ShuffleNetV2'),
+    'resnet18': ('resnet', 'ResNet18'),
+    'resnet34': ('resnet', 'ResNet34'),
+    'resnet50': ('resnet', 'ResNet50'),
+    'efficientnetb0': ('efficientnetb0', 'EfficientNetB0'),
+    'lenet': ('lenet', 'LeNet'),
+    'mobilenet': ('mobilenet', 'MobileNet'),
+    'mobilenetv2': ('mobilenetv2', 'MobileNetV2'),
+    'pnasnet': ('pnasnet', 'PNASNetB'),
+    'preact_resnet': ('preact_resnet', 'PreActResNet18'),
+    'regnet': ('regnet', 'RegNetX_200MF'),
+    'resnext': ('resnext', 'ResNeXt29_2x64d'),
+    'vgg': ('vgg', 'vgg11'),
+    'attention56': ('attention', 'attention56'),
+    'attention92': ('attention', 'attention92'),
+    'inceptionv3': ('inceptionv3', 'inceptionv3'),
+    'inceptionv4': ('inceptionv4', 'inceptionv4'),
+    'inception_resnet_v2': ('inceptionv4', 'inception_resnet_v2'),
+    'nasnet': ('nasnet', 'nasnet'),
+    'rir': ('rir', 'resnet_in_resnet'),
+    'squeezenet': ('squeezenet', 'squeezenet'),
+    'stochastic_depth_resnet18': ('stochasticdepth', 'stochastic_depth_resnet18'),
+    'stochastic_depth_resnet34': ('stochasticdepth', 'stochastic_depth_resnet34'),
+    'stochastic_depth_resnet50': ('stochasticdepth', 'stochastic_depth_resnet50'),
+    'stochastic_depth_resnet101': ('stochasticdepth', 'stochastic_depth_resnet101'),
+    'stochastic_depth_resnet152': ('stochasticdepth', 'stochastic_depth_resnet152'),
+    'wideresnet': ('wideresidual', 'wideresnet'),
+    'xception': ('xception', 'xception'),
+    'dpn': ('dpn', 'DPN26'),
+    'shake_resnet26_2x32d': ('shake_shake', 'shake_resnet26_2x32d'),
+    'shake_resnet26_2x64d': ('shake_shake', 'shake_resnet26_2x64d'),
+    'ge_resnext29_8x64d': ('genet', 'ge_resnext29_8x64d'),
+    'ge_resnext29_16x64d': ('genet', 'ge_resnext29_16x64d'),
+    'sk_resnext29_16x32d': ('sknet', 'sk_resnext29_16x32d'),
+    'sk_resnext29_16x64d': ('sknet', 'sk_resnext29_16x64d'),
+    'cbam_resnext29_16x64d': ('cbam_resnext', 'cbam_resnext29_16x64d'),
+    'cbam_resnext29_8x64d': ('cbam_resnext', 'cbam_resnext29_8x64d')
+
+}
 
+# the names models.X used to import eagerly: name -> (module, attr)
+__exports = {
+    'attention56': ('attention', 'attention56'),
+    'attention92': ('attention', 'attention92'),
+    'cbam_resnext29_8x64d': ('cbam_resnext', 'cbam_resnext29_8x64d'),
+    'cbam_resnext29_16x64d': ('cbam_resnext', 'cbam_resnext29_16x64d'),
+    'densenet_cifar': ('densenet', 'densenet_cifar'),
+    'DLA': ('dla', 'DLA'),
+    'DPN26': ('dpn', 'DPN26'),
+    'dynamic_resnet20': ('dynamic_resnet20', 'dynamic_resnet20'),
+    'EfficientNetB0': ('efficientnetb0', 'EfficientNetB0'),
+    'ge_resnext29_8x64d': ('genet', 'ge_resnext29_8x64d'),
+    'ge_resnext29_16x64d': ('genet', 'ge_resnext29_16x64d'),
+    'GoogLeNet': ('googlenet', 'GoogLeNet'),
+    'BasicConv2d': ('inceptionv3', 'BasicConv2d'),
+    'InceptionA': ('inceptionv3', 'InceptionA'),
+    'InceptionB': ('inceptionv3', 'InceptionB'),
+    'InceptionC': ('inceptionv3', 'InceptionC'),
+    'InceptionD': ('inceptionv3', 'InceptionD'),
+    'InceptionE': ('inceptionv3', 'InceptionE'),
+    'InceptionV3': ('inceptionv3', 'InceptionV3'),
+    'inceptionv3': ('inceptionv3', 'inceptionv3'),
+    'torch': ('inceptionv3', 'torch'),  # inceptionv3 has no __all__
+    'nn': ('inceptionv3', 'nn'),
+    'inceptionv4': ('inceptionv4', 'inceptionv4'),
+    'inception_resnet_v2': ('inceptionv4', 'inception_resnet_v2'),
+    'LeNet': ('lenet', 'LeNet'),
+    'masked_resnet20': ('masked_resnet20', 'masked_resnet20'),
+    'MobileNet': ('mobilenet', 'MobileNet'),
+    'MobileNetV2': ('mobilenetv2', 'MobileNetV2'),
+    'nasnet': ('nasnet', 'nasnet'),
+    'PNASNetA': ('pnasnet', 'PNASNetA'),
+    'PNASNetB': ('pnasnet', 'PNASNetB'),
+    'PreActResNet18': ('preact_resnet', 'PreActResNet18'),
+    'RegNetX_200MF': ('regnet', 'RegNetX_200MF'),
+    'ResNet18': ('resnet', 'ResNet18'),
+    'ResNet34': ('resnet', 'ResNet34'),
+    'ResNet50': ('resnet', 'ResNet50'),
+    'ResNet101': ('resnet', 'ResNet101'),
+    'ResNet152': ('resnet', 'ResNet152'),
+    'ResNet': ('resnet20', 'ResNet'),
+    'resnet20': ('resnet20', 'resnet20'),
+    'ResNeXt29_2x64d': ('resnext', 'ResNeXt29_2x64d'),
+    'resnet_in_resnet': ('rir', 'resnet_in_resnet'),
+    'sample_resnet20': ('sample_resnet20', 'sample_resnet20'),
+    'senet18_cifar': ('senet', 'senet18_cifar'),
+    'shake_resnet26_2x32d': ('shake_shake', 'shake_resnet26_2x32d'),
+    'shake_resnet26_2x64d': ('shake_shake', 'shake_resnet26_2x64d'),
+    'ShuffleNetG2': ('shufflenet', 'ShuffleNetG2'),
+    'ShuffleNetG3': ('shufflenet', 'ShuffleNetG3'),
+    'ShuffleNetV2': ('shufflenetv2', 'ShuffleNetV2'),
+    'sk_resnext29_16x32d': ('sknet', 'sk_resnext29_16x32d'),
+    'sk_resnext29_16x64d': ('sknet', 'sk_resnext29_16x64d'),
+    'slimmable_resnet20': ('slimmable_resnet20', 'slimmable_resnet20'),
+    'squeezenet': ('squeezenet', 'squeezenet'),
+    'stochastic_depth_resnet18': ('stochasticdepth', 'stochastic_depth_resnet18'),
+    'stochastic_depth_resnet34': ('stochasticdepth', 'stochastic_depth_resnet34'),
+    'stochastic_depth_resnet50': ('stochasticdepth', 'stochastic_depth_resnet50'),
+    'stochastic_depth_resnet101': ('stochasticdepth', 'stochastic_depth_resnet101'),
+    'stochastic_depth_resnet152': ('stochasticdepth', 'stochastic_depth_resnet152'),
+    'SuperNet': ('supernet', 'SuperNet'),
+    'vgg11': ('vgg', 'vgg11'),
+    'wideresnet': ('wideresidual', 'wideresnet'),
+    'xception': ('xception', 'xception'),
 }
 
+# the submodules models.X used to bind, imported on first access
+__submodules = {module for module, _ in __model_factory.values()} | {'modules'}
+
+
+def _import(module):
+    mod = importlib.import_module('.' + module, __name__)
+    # importing models.X binds the module as models.X, where X is also an
+    # exported constructor (models.resnet20) the constructor is bound back
+    if __exports.get(module, (None,))[0] == module:
+        globals()[module] = getattr(mod, __exports[module][1])
+    return mod
+
+
+def __getattr__(name):
+    """models.X for the names of the model modules, imported on first access"""
+    if name in __exports:
+        module, attr = __exports[name]
+        obj = getattr(_import(module), attr)
+    elif name in __submodules:
+        obj = _import(name)
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = obj
+    return obj
+
 
 def show_available_models():
     """Displays available models
@@ -104,10 +155,16 @@ def show_available_models():
     print(list(__model_factory.keys()))
 
 
-def build_model(name, num_classes=10):
+def get_model_builder(name):
+    """the constructor of a registered model, importing only its module"""
     avai_models = list(__model_factory.keys())
     if name not in avai_models:
         raise KeyError(
             'Unknown model: {}. Must be one of {}'.format(name, avai_models)
         )
-    return __model_factory[name](num_classes=num_classes)
+    module, attr = __model_factory[name]
+    return getattr(_import(module), attr)
+
+
+def build_model(name, num_classes=10):
+    return get_model_builder(name)(num_classes=num_classes)
@@ -5,19 +5,13 @@ import torch.nn.init as init
 from collections import OrderedDict
 
 from .modules.masked_modules import MaskedConv2dBN
+from .modules.search_space import get_search_space
 
 __all__ = ['masked_resnet20']
 
 
 def get_configs():
-    model_config = {}
-    for i in range(0, 7):
-        model_config[i] = [4*(i+1) for i in range(4)]
-    for i in range(7, 13):
-        model_config[i] = [4*(i+1) for i in range(8)]
-    for i in range(13, 20):
-        model_config[i] = [4*(i+1) for i in range(16)]
-    return model_config
+    return get_search_space().model_config
 
 
 class MaskedBlock(nn.Module):
@@ -5,29 +5,10 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.nn.init as init
 
-# from config.config import SuperNetSetting
-SuperNetSetting = [
-    [4, 8, 12, 16],  # 1
-    [4, 8, 12, 16],  # 2
-    [4, 8, 12, 16],  # 3
-    [4, 8, 12, 16],  # 4
-    [4, 8, 12, 16],  # 5
-    [4, 8, 12, 16],  # 6
-    [4, 8, 12, 16],  # 7
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 8
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 9
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 10
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 11
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 12
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 13
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 14
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 15
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 16
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 17
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 18
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 19
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # fc
-]
+from .lazy_store import LazyStore
+from .search_space import get_search_space
+
+SuperNetSetting = get_search_space().setting
 
 
 def get_same_padding(kernel_size):
@@ -43,19 +24,94 @@ def get_same_padding(kernel_size):
 
 
 def pad(tensor, max_dim):
-    """padding with zeros"""
+    """padding with zeros, on the device and dtype of tensor"""
     c = tensor.shape[1]  # channels
     if c != max_dim:
-        # padd
-        tmp_shape = list(tensor.shape)
-        tmp_shape[1] = max_dim - c
-        pad_zero = torch.zeros(tmp_shape)
-        return torch.cat([tensor, pad_zero], dim=1)
+        return F.pad(tensor, (0, 0, 0, 0, 0, max_dim - c))
     return tensor
 
 
+def conv_first_channels(x, conv, indim):
+    """conv(pad(x[:, :indim], conv.in_channels)) without the padding: zero
+    input channels add nothing, so the weight is sliced instead"""
+    x = x[:, :indim]
+    weight = conv.weight[:, :x.size(1)]
+    return F.conv2d(x, weight, conv.bias, conv.stride, conv.padding, conv.dilation, conv.groups)
+
+
+def bn_first_channels(x, bn, outdim=None):
+    """pad(bn(pad(x, bn.num_features))[:, :outdim], bn.num_features) without
+    the padded copy of x: the bn runs on the channels x has, the zero
+    channels are filled in closed form and their running stats decayed as
+    the padded bn would. outdim None keeps every channel."""
+    num = bn.num_features
+    outdim = num if outdim is None else outdim
+    c = x.size(1)
+    if c < num:
+        x = slice_batch_norm(x, bn, c)
+    else:
+        x = bn(x)
+    if outdim < c:
+        # batch_norm saves its input for backward, not its output
+        x[:, outdim:] = 0
+    if c == num:
+        return x
+
+    n, _, h, w = x.shape
+    if bn.training or bn.running_mean is None:
+        # batch stats of zero channels: mean 0, var 0, normalized to the bias
+        tail = bn.bias[c:outdim] if bn.affine else x.new_zeros(max(0, outdim - c))
+        if bn.training and bn.track_running_stats:
+            factor = 1.0 / float(bn.num_batches_tracked) if bn.momentum is None else bn.momentum
+            # through .data, as batch_norm updates the stats: the graphs that
+            # saved the stats of the first channels stay valid
+            bn.running_mean.data[c:].mul_(1 - factor)
+            bn.running_var.data[c:].mul_(1 - factor)
+    else:
+        tail = -bn.running_mean[c:outdim] * torch.rsqrt(bn.running_var[c:outdim] + bn.eps)
+        if bn.affine:
+            tail = tail * bn.weight[c:outdim] + bn.bias[c:outdim]
+    parts = [x, tail.to(x.dtype).view(1, -1, 1, 1).expand(n, -1, h, w)]
+    rest = num - max(c, outdim)
+    if rest > 0:
+        parts.append(x.new_zeros(1, 1, 1, 1).expand(n, rest, h, w))
+    return torch.cat(parts, 1)
+
+
 # BN PART
 
+def slice_batch_norm(x, bn, feature_dim=None):
+    '''bn forward on its first feature_dim (x.size(1) by default) channels, x holds only those'''
+    if feature_dim is None:
+        feature_dim = x.size(1)
+    if feature_dim == bn.num_features:
+        return bn(x)
+
+    exponential_average_factor = 0.0 if bn.momentum is None else bn.momentum
+    if bn.training and bn.track_running_stats:
+        if bn.num_batches_tracked is not None:
+            bn.num_batches_tracked.add_(1)
+            if bn.momentum is None:  # use cumulative moving average
+                exponential_average_factor = 1.0 / float(bn.num_batches_tracked)
+            else:  # use exponential moving average
+                exponential_average_factor = bn.momentum
+
+    if bn.training:
+        bn_training = True
+    else:
+        bn_training = bn.running_mean is None and bn.running_var is None
+
+    use_running_stats = bn.running_mean is not None and (not bn.training or bn.track_running_stats)
+    return F.batch_norm(
+        x,
+        bn.running_mean[:feature_dim] if use_running_stats else None,
+        bn.running_var[:feature_dim] if use_running_stats else None,
+        bn.weight[:feature_dim] if bn.weight is not None else None,
+        bn.bias[:feature_dim] if bn.bias is not None else None,
+        bn_training, exponential_average_factor, bn.eps,
+    )
+
+
 class BaseBN(nn.Module):
     def __init__(self, indims, outdims):
         super().__init__()
@@ -74,51 +130,59 @@ class DynamicBN(BaseBN):
             self.max, affine=affine, track_running_stats=track_running_stats)
 
     def bn_forward(self, x, bn, feature_dim):
-        if bn.num_features == feature_dim:
-            return bn(x)
-        else:
-            exponential_average_factor = 0.0
-
-            if bn.training and bn.track_running_stats:
-                if bn.num_batches_tracked is not None:
-                    bn.num_batches_tracked += 1
-                    if bn.momentum is None:  # use cumulative moving average
-                        exponential_average_factor = 1.0 / \
-                            float(bn.num_batches_tracked)
-                    else:  # use exponential moving average
-                        exponential_average_factor = bn.momentum
-
-            if bn.track_running_stats is False:
-                return F.batch_norm(
-                    x, None, None, bn.weight[:feature_dim],
-                    bn.bias[:feature_dim], bn.training or not bn.track_running_stats,
-                    exponential_average_factor, bn.eps,
-                )
-            else:
-                return F.batch_norm(
-                    x, bn.running_mean[:feature_dim], bn.running_var[:
-                                                                     feature_dim], bn.weight[:feature_dim],
-                    bn.bias[:feature_dim], bn.training or not bn.track_running_stats,
-                    exponential_average_factor, bn.eps,
-                )
+        return slice_batch_norm(x, bn, feature_dim)
 
     def forward(self, x, indim, outdim):
-        return self.bn_forward(x, self.bn, indim)
+        # the bn normalizes the output channels of the conv before it
+        return self.bn_forward(x[:, :outdim], self.bn, outdim)
+
+
+def init_bn_affine(tensor):
+    """(2, C) weight and bias of a bn"""
+    nn.init.ones_(tensor[0])
+    nn.init.zeros_(tensor[1])
+
+
+def init_bn_stats(tensor):
+    """(2 * C + 1,) running mean, running var and num batches tracked of a bn"""
+    c = tensor.numel() // 2
+    nn.init.zeros_(tensor[:c])
+    nn.init.ones_(tensor[c:2 * c])
+    nn.init.zeros_(tensor[2 * c:])
 
 
 class IndependentBN(BaseBN):
-    """SBN in MixPath"""
+    """SBN in MixPath, the bn of every (indim, outdim) materialized on first use"""
 
-    def __init__(self, indims, outdims, affine=True, track_running_stats=True):
+    def __init__(self, indims, outdims, affine=True, track_running_stats=True, eps=1e-5, momentum=0.1):
         super().__init__(indims, outdims)
-        for cin in indims:
-            for cout in outdims:
-                setattr(
-                    self, f"bn-{cin}-{cout}", nn.BatchNorm2d(cout, affine=affine, track_running_stats=track_running_stats))
+        self.affine = affine
+        self.track_running_stats = track_running_stats
+        self.eps = eps
+        self.momentum = momentum
+        self.params = LazyStore(init_bn_affine) if affine else None
+        self.stats = LazyStore(init_bn_stats, requires_grad=False) if track_running_stats else None
 
     def forward(self, x, indim, outdim):
         x = x[:, :outdim]
-        return getattr(self, f"bn-{indim}-{outdim}")(x)
+        key = f"{indim}-{outdim}"
+        weight = bias = None
+        if self.affine:
+            weight, bias = self.params.get(key, (2, outdim))
+        running_mean = running_var = None
+        exponential_average_factor = 0.0 if self.momentum is None else self.momentum
+        if self.track_running_stats:
+            stats = self.stats.get(key, (2 * outdim + 1,))
+            running_mean, running_var = stats[:outdim], stats[outdim:2 * outdim]
+            if self.training:
+                stats[2 * outdim:] += 1
+                if self.momentum is None:  # use cumulative moving average
+                    exponential_average_factor = 1.0 / float(stats[2 * outdim])
+        return F.batch_norm(
+            x, running_mean, running_var, weight, bias,
+            self.training or not self.track_running_stats,
+            exponential_average_factor, self.eps,
+        )
 
 
 class FrontShareBN(BaseBN):
@@ -129,8 +193,7 @@ class FrontShareBN(BaseBN):
                 self, f"bn-{cin}", nn.BatchNorm2d(self.max, affine=affine, track_running_stats=track_running_stats))
 
     def forward(self, x, indim, outdim):
-        x = getattr(self, f"bin-{indim}")(pad(x, self.max))
-        return pad(x[:, :outdim], self.max)
+        return bn_first_channels(x, getattr(self, f"bn-{indim}"), outdim)
 
 
 class EndShareBN(BaseBN):
@@ -152,9 +215,7 @@ class FullBN(BaseBN):
             self.max, affine=affine, track_running_stats=track_running_stats)
 
     def forward(self, x, indim, outdim):
-        x = self.bn(pad(x, self.max))
-        x = pad(x[:, :outdim], self.max)
-        return x
+        return bn_first_channels(x, self.bn, outdim)
 
 
 class MaskedBN(BaseBN):
@@ -164,7 +225,7 @@ class MaskedBN(BaseBN):
             self.max, affine=affine, track_running_stats=track_running_stats)
 
     def forward(self, x, indim, outdim):
-        return self.bn(x)
+        return bn_first_channels(x, self.bn)
 
 # CONV PART
 
@@ -195,40 +256,49 @@ class DynamicConv(BaseConv):
                               self.stride, bias=False)
 
     def forward(self, x, indim, outdim):
-        filters = self.conv.weight[:outdim, :indim, :, :]
+        x = x[:, :indim]
+        filters = self.conv.weight[:outdim, :x.size(1), :, :]
         padding = get_same_padding(self.kernel_size)
         return F.conv2d(x, filters, None, self.stride, padding)
 
 
 class MaskedConv(BaseConv):
-    def __init__(self, indims, outdims, layer_id, stride=1, down=False):
+    def __init__(self, indims, outdims, layer_id=None, stride=1, down=False):
         super().__init__(indims, outdims, stride, down)
+        self.layer_id = layer_id
         self.conv = nn.Conv2d(self.max_in, self.max_out, self.kernel_size,
                               self.stride, get_same_padding(self.kernel_size), bias=False)
+        # follows the module on .to(device)
         self.register_buffer("masks", torch.zeros([len(outdims),
-                                                   outdims[-1], 1, 1]).cuda())
+                                                   self.max_out, 1, 1]))
         for i, channel in enumerate(outdims):
             self.masks[i][:channel] = 1
 
     def forward(self, x, indim, outdim):
         # 默认x是符合indim的
-        x = self.conv(x)
+        x = conv_first_channels(x, self.conv, x.size(1))
         index = self.outdims.index(outdim)
         mixed_masks = self.masks[index]
 
         return x * mixed_masks
 
 
+def init_conv(tensor):
+    """the default init of nn.Conv2d"""
+    nn.init.kaiming_uniform_(tensor, a=math.sqrt(5))
+
+
 class IndependentConv(BaseConv):
+    """a kernel for every (indim, outdim), materialized on first use"""
+
     def __init__(self, indims, outdims, stride=1, down=False):
         super().__init__(indims, outdims, stride, down)
-        for cin in indims:
-            for cout in outdims:
-                setattr(self, f"conv-{cin}-{cout}", self._make_conv(cin, cout))
+        self.kernels = LazyStore(init_conv)
 
     def forward(self, x, indim, outdim):
         x = x[:, :indim]
-        return getattr(self, f"conv-{indim}-{outdim}")(x)
+        weight = self.kernels.get(f"{indim}-{outdim}", (outdim, indim, self.kernel_size, self.kernel_size))
+        return F.conv2d(x, weight, None, self.stride, get_same_padding(self.kernel_size))
 
 
 class FrontShareConv(BaseConv):
@@ -249,7 +319,7 @@ class EndShareConv(BaseConv):
             setattr(self, f"conv-{cout}", self._make_conv(self.max_in, cout))
 
     def forward(self, x, indim, outdim):
-        return getattr(self, f"conv-{outdim}")(pad(x[:, :indim], self.max_in))
+        return conv_first_channels(x, getattr(self, f"conv-{outdim}"), indim)
 
 
 class FullConv(BaseConv):
@@ -259,7 +329,7 @@ class FullConv(BaseConv):
                               self.stride, get_same_padding(self.kernel_size), bias=False)
 
     def forward(self, x, indim, outdim):
-        return self.conv(pad(x[:, :indim], self.max_in))
+        return conv_first_channels(x, self.conv, indim)
 
 # FC PART
 
@@ -275,14 +345,24 @@ class BaseFC(nn.Module):
         raise NotImplementedError()
 
 
+def init_linear(tensor):
+    """(out, in + 1) weight and bias column, the default init of nn.Linear"""
+    fan_in = tensor.size(1) - 1
+    nn.init.kaiming_uniform_(tensor[:, :fan_in], a=math.sqrt(5))
+    bound = 1 / math.sqrt(fan_in)
+    nn.init.uniform_(tensor[:, fan_in], -bound, bound)
+
+
 class IndependentFC(BaseFC):
+    """a linear for every indim, materialized on first use"""
+
     def __init__(self, indims, outdim):
         super().__init__(indims, outdim)
-        for cin in indims:
-            setattr(self, f"fc-{cin}", nn.Linear(cin, self.outdim))
+        self.fcs = LazyStore(init_linear)
 
     def forward(self, x, indim):
-        return getattr(self, f'fc-{indim}')(x[:, :indim])
+        fc = self.fcs.get(f'{indim}', (self.outdim, indim + 1))
+        return F.linear(x[:, :indim], fc[:, :indim], fc[:, indim])
 
 
 class FullFC(BaseFC):
@@ -294,8 +374,8 @@ class FullFC(BaseFC):
         nn.init.zeros_(self.fc.bias)
 
     def forward(self, x, indim):
-        x = pad(x[:, :indim], self.max)
-        return self.fc(x)
+        x = x[:, :indim]
+        return F.linear(x, self.fc.weight[:, :x.size(1)], self.fc.bias)
 
 
 class DynamicFC(BaseFC):
@@ -304,5 +384,6 @@ class DynamicFC(BaseFC):
         self.fc = nn.Linear(self.max, self.outdim)
 
     def forward(self, x, indim):
-        weight = self.fc.weight[:, :indim]
+        x = x[:, :indim]
+        weight = self.fc.weight[:, :x.size(1)]
         return F.linear(x, weight, self.fc.bias)
@@ -0,0 +1,68 @@
+import torch
+import torch.nn.functional as F
+
+
+def channel_masks(lenths, width, dtype=torch.float32):
+    """(K, width) 0/1 masks keeping the first lenths[k] channels of group k"""
+    channels = torch.arange(width, device=lenths.device)
+    return (channels < lenths.view(-1, 1)).to(dtype)
+
+
+def group_batch_norm(x, bn, groups, masks=None):
+    '''
+    BatchNorm for K subnets stacked along the batch dim, x: (K*B, C, H, W).
+
+    Batch statistics are computed per group, so every subnet is normalized
+    exactly as if it had been forwarded alone. Only the first C channels of
+    bn are used. masks (K, C) is folded into the affine transform.
+    '''
+    feature_dim = x.size(1)
+    weight = bn.weight[:feature_dim] if bn.weight is not None else None
+    bias = bn.bias[:feature_dim] if bn.bias is not None else None
+
+    use_batch_stats = bn.training or bn.running_mean is None
+    if not use_batch_stats:
+        out = F.batch_norm(x, bn.running_mean[:feature_dim], bn.running_var[:feature_dim],
+                           weight, bias, False, 0.0, bn.eps)
+        if masks is not None:
+            out = out.view(groups, -1, feature_dim, *x.shape[2:]) * \
+                masks.view(groups, 1, feature_dim, *([1] * (x.dim() - 2)))
+            out = out.view_as(x)
+        return out
+
+    xg = x.view(groups, -1, feature_dim, *x.shape[2:])
+    reduce_dims = [1] + list(range(3, xg.dim()))
+    var, mean = torch.var_mean(xg, dim=reduce_dims, unbiased=False, keepdim=True)
+
+    if bn.training and bn.track_running_stats and bn.running_mean is not None:
+        update_running_stats(bn, mean.view(groups, feature_dim), var.view(groups, feature_dim),
+                             xg[0].numel() // feature_dim)
+
+    scale = torch.rsqrt(var + bn.eps)
+    shift = -mean * scale
+    stat_shape = [1, 1, feature_dim] + [1] * (xg.dim() - 3)
+    if weight is not None:
+        scale = scale * weight.view(stat_shape)
+        shift = shift * weight.view(stat_shape)
+    if bias is not None:
+        shift = shift + bias.view(stat_shape)
+    if masks is not None:
+        mask_shape = [groups, 1, feature_dim] + [1] * (xg.dim() - 3)
+        scale = scale * masks.view(mask_shape)
+        shift = shift * masks.view(mask_shape)
+    return (xg * scale + shift).view_as(x)
+
+
+@torch.no_grad()
+def update_running_stats(bn, means, variances, n):
+    """apply the K per-group updates in order, as K separate forwards would"""
+    feature_dim = means.size(1)
+    variances = variances * n / max(n - 1, 1)  # unbiased, as nn.BatchNorm2d
+    for mean, var in zip(means, variances):
+        bn.num_batches_tracked.add_(1)
+        if bn.momentum is None:  # use cumulative moving average
+            factor = 1.0 / float(bn.num_batches_tracked)
+        else:  # use exponential moving average
+            factor = bn.momentum
+        bn.running_mean[:feature_dim].mul_(1 - factor).add_(mean, alpha=factor)
+        bn.running_var[:feature_dim].mul_(1 - factor).add_(var, alpha=factor)
@@ -0,0 +1,145 @@
+import math
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+
+__all__ = ['LazyStore', 'add_new_parameters', 'count_parameters']
+
+
+class LazyStore(nn.Module):
+    '''
+    tensors keyed by a string, materialized on first use and packed in flat chunks.
+
+    get(key, shape) returns the view of key, allocated and filled in place
+    by init_fn(view) the first time key is asked for. a full chunk is followed
+    by one twice its size, chunks never move, so views taken by a graph
+    still alive stay valid, and so do they when a new entry is written
+    next to theirs. requires_grad: chunks are parameters, otherwise
+    buffers. the parameters of the chunks created after the optimizer are
+    handed to it by add_new_parameters.
+
+    the untouched tail of the last chunk is zeros (zero grads, no weight
+    decay or momentum build up on it). numel() counts the touched entries,
+    the memory and parameter count of the store; the chunks are larger.
+    the state dict holds the touched entries only, packed in one tensor, and
+    loading it leaves one chunk of exactly that size.
+    '''
+
+    def __init__(self, init_fn, requires_grad=True, chunk_size=4096):
+        super().__init__()
+        self.init_fn = init_fn
+        self.requires_grad = requires_grad
+        self.chunk_size = chunk_size
+        self.entries = OrderedDict()  # key -> (chunk id, offset, shape)
+        self.num_chunks = 0
+        self.used = 0  # elements taken in the last chunk
+        self.new_params = []
+        # device and dtype of the chunks to come, follows .to()
+        self.register_buffer('anchor', torch.empty(0), persistent=False)
+
+    def chunk(self, i):
+        return getattr(self, 'chunk{}'.format(i))
+
+    def _add_chunk(self, numel):
+        # zeros, not empty: the untouched tail of a chunk is handed to the
+        # optimizer too, garbage there would turn into momentum (or nan) that
+        # the entry later materialized on it inherits
+        data = torch.zeros(numel, device=self.anchor.device, dtype=self.anchor.dtype)
+        name = 'chunk{}'.format(self.num_chunks)
+        if self.requires_grad:
+            param = nn.Parameter(data)
+            self.register_parameter(name, param)
+            self.new_params.append(param)
+        else:
+            self.register_buffer(name, data)
+        self.num_chunks += 1
+        self.used = 0
+
+    def _view(self, entry, data=False):
+        i, offset, shape = entry
+        chunk = self.chunk(i).data if data else self.chunk(i)
+        return chunk[offset:offset + math.prod(shape)].view(shape)
+
+    def get(self, key, shape):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.materialize(key, shape)
+        # the views of a buffer (running stats updated in place) get their own
+        # version counter, an update of one entry leaves the graphs of the others valid
+        return self._view(entry, data=not self.requires_grad)
+
+    def materialize(self, key, shape):
+        numel = math.prod(shape)
+        if self.num_chunks == 0 or self.used + numel > self.chunk(self.num_chunks - 1).numel():
+            size = self.chunk_size if self.num_chunks == 0 else 2 * self.chunk(self.num_chunks - 1).numel()
+            self._add_chunk(max(numel, size))
+        entry = (self.num_chunks - 1, self.used, tuple(shape))
+        self.used += numel
+        self.entries[key] = entry
+        # written through .data, the graphs holding views of the chunk stay valid
+        self.init_fn(self._view(entry, data=True))
+        return entry
+
+    def numel(self):
+        '''elements of the touched entries'''
+        return sum(math.prod(shape) for _, _, shape in self.entries.values())
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        views = [self._view(entry).reshape(-1) for entry in self.entries.values()]
+        packed = torch.cat(views) if views else self.anchor.new_empty(0)
+        destination[prefix + 'packed'] = packed if keep_vars else packed.detach()
+        destination[prefix + '_extra_state'] = [(key, shape) for key, (_, _, shape) in self.entries.items()]
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict,
+                              missing_keys, unexpected_keys, error_msgs):
+        if prefix + 'packed' not in state_dict or prefix + '_extra_state' not in state_dict:
+            missing_keys.extend(key for key in [prefix + 'packed', prefix + '_extra_state']
+                                if key not in state_dict)
+            return
+        packed = state_dict[prefix + 'packed']
+        for i in range(self.num_chunks):
+            delattr(self, 'chunk{}'.format(i))
+        self.entries.clear()
+        self.new_params = []
+        self.num_chunks = 0
+        if packed.numel():
+            self._add_chunk(packed.numel())
+            with torch.no_grad():
+                self.chunk(0).copy_(packed)
+        for key, shape in state_dict[prefix + '_extra_state']:
+            self.entries[key] = (0, self.used, tuple(shape))
+            self.used += math.prod(shape)
+        if self.used != packed.numel():
+            error_msgs.append('{}packed holds {} elements, its entries {}'.format(
+                prefix, packed.numel(), self.used))
+
+    def extra_repr(self):
+        return '{} entries, {} elements in {} chunks'.format(len(self.entries), self.numel(), self.num_chunks)
+
+
+def count_parameters(model):
+    '''parameters of model, a LazyStore counts its touched entries, not its chunks'''
+    stores = [m for m in model.modules() if isinstance(m, LazyStore)]
+    in_stores = {id(p) for m in stores for p in m.parameters()}
+    return sum(p.numel() for p in model.parameters() if id(p) not in in_stores) + \
+        sum(m.numel() for m in stores if m.requires_grad)
+
+
+def add_new_parameters(model, optimizer):
+    '''
+    add the chunks the LazyStores of model created since the optimizer was
+    built to it, as one param group with the hyper-parameters of the first
+    group. returns the num of parameters added.
+    '''
+    known = {id(p) for group in optimizer.param_groups for p in group['params']}
+    params = []
+    for m in model.modules():
+        if isinstance(m, LazyStore):
+            params.extend(p for p in m.new_params if id(p) not in known)
+            m.new_params = []
+    if params:
+        group = {k: v for k, v in optimizer.param_groups[0].items() if k != 'params'}
+        group['params'] = params
+        optimizer.add_param_group(group)
+    return len(params)
@@ -4,32 +4,12 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.nn.init as init
-from torch.utils.tensorboard.writer import SummaryWriter
+
+from .search_space import get_search_space
 
 __all__ = ["MaskedConv2dBN"]
 
-SuperNetSetting = [
-    [4, 8, 12, 16],  # 1
-    [4, 8, 12, 16],  # 2
-    [4, 8, 12, 16],  # 3
-    [4, 8, 12, 16],  # 4
-    [4, 8, 12, 16],  # 5
-    [4, 8, 12, 16],  # 6
-    [4, 8, 12, 16],  # 7
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 8
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 9
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 10
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 11
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 12
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 13
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 14
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 15
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 16
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 17
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 18
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 19
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # fc
-]
+SuperNetSetting = get_search_space().setting
 
 TrackRunningStats = False
 
@@ -49,7 +29,8 @@ def get_same_padding(kernel_size):
 class SampleConvBN(nn.Module):
     def __init__(self, layer_id, in_planes, out_planes, kernel_size, stride, padding, bias, affine=False):
         super(SampleConvBN, self).__init__()
-        assert out_planes == SuperNetSetting[layer_id][-1]
+        self.space = get_search_space()
+        assert out_planes == self.space.setting[layer_id][-1]
         global TrackRunningStats
         self.layer_id = layer_id
         self.conv = nn.Conv2d(in_planes, out_planes, kernel_size=kernel_size,
@@ -57,28 +38,22 @@ class SampleConvBN(nn.Module):
         self.bn = nn.BatchNorm2d(
             out_planes, affine=affine, track_running_stats=TrackRunningStats)
 
-        self.register_buffer('masks', torch.zeros(
-            [len(SuperNetSetting[layer_id]), SuperNetSetting[layer_id][-1], 1, 1]).cuda())  # 4, 16, 1, 1
-
-        for i, channel in enumerate(SuperNetSetting[layer_id]):
-            self.masks[i][:channel] = 1
+        masks = self.space.masks(layer_id)
+        self.register_buffer('masks', masks.view(*masks.shape, 1, 1).cuda())  # 4, 16, 1, 1
 
     def forward(self, x, weight, lenth=None):
         '''
         weight 设置一个 one hot [0 1 0 0] 相当于
         '''
         out = self.bn(self.conv(x))
-        mixed_masks = 0
 
         if lenth is None:  # supernet forward
-            for w, mask in zip(weight, self.masks):
-                # weight存储的信息是, 某一层信息 alpha [0,1,0,0]
-                # mask存储的信息也是一层的，每层包括4/8/16个mask
-                mixed_masks += w * mask
+            # weight存储的信息是, 某一层信息 alpha [0,1,0,0]
+            # mask存储的信息也是一层的，每层包括4/8/16个mask, 一次 matmul 完成混合
+            weight = torch.as_tensor(weight, dtype=out.dtype, device=out.device)
+            mixed_masks = torch.matmul(weight, self.masks.flatten(1)).view(1, -1, 1, 1)
         else:  # subnet forward
-            assert lenth in SuperNetSetting[self.layer_id]
-            index = SuperNetSetting[self.layer_id].index(lenth)
-            mixed_masks += self.masks[index]
+            mixed_masks = self.masks[self.space.index(self.layer_id, lenth)]
 
         out = out.cuda()
         return out * mixed_masks
@@ -110,11 +85,9 @@ class MaskedConv2dBN(nn.Module):
         self.bn = nn.BatchNorm2d(
             max_out_channels, affine=affine, track_running_stats=False)
 
-        self.register_buffer('masks', torch.zeros([len(SuperNetSetting[layer_id]),
-                                                   SuperNetSetting[layer_id][-1], 1, 1]).cuda())
-        
-        for i, channel in enumerate(SuperNetSetting[layer_id]):
-            self.masks[i][:channel] = 1
+        self.space = get_search_space()
+        masks = self.space.masks(layer_id)
+        self.register_buffer('masks', masks.view(*masks.shape, 1, 1).cuda())
 
         self.active_out_channel = self.max_out_channels
 
@@ -122,12 +95,9 @@ class MaskedConv2dBN(nn.Module):
         if out_channel is None:
             out_channel = self.active_out_channel
 
-        mixed_masks = 0
-
         # set mask based on out_channel
-        index = SuperNetSetting[self.layer_id].index(out_channel)
-        mixed_masks += self.masks[index]
-        
+        mixed_masks = self.masks[self.space.index(self.layer_id, out_channel)]
+
         # forward
         out = self.bn(self.conv(x))
 
@@ -0,0 +1,143 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import torch
+import yaml
+
+__all__ = ['SearchSpace', 'get_search_space']
+
+META_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, os.pardir, 'configs', 'meta.yml')
+
+
+class SearchSpace(object):
+    '''
+    channel choices of every layer, compiled into lookup tables once.
+
+    setting: list of per-layer candidate widths, as SuperNetSetting.
+    an arch has three equivalent forms, all vectorized over a leading batch dim:
+        str      '16-8-...-64', as in the arch json files
+        widths   (N, L) LongTensor of channel numbers (lenth_list)
+        indices  (N, L) LongTensor of choice indices
+    plus one-hot (N, L, max_choices), zero on the padded choices.
+    '''
+
+    def __init__(self, setting):
+        self.setting = [list(choices) for choices in setting]
+        self.num_layers = len(self.setting)
+        self.max_choices = max(len(choices) for choices in self.setting)
+        self.max_width = max(choices[-1] for choices in self.setting)
+
+        # (L,) number of choices per layer
+        self.num_choices = torch.tensor([len(choices) for choices in self.setting])
+        # (L, max_choices) widths, padded with 0
+        self.width_table = torch.zeros(self.num_layers, self.max_choices, dtype=torch.long)
+        # (L, max_width + 1) choice index of every width, -1 if not a choice
+        self.index_table = torch.full((self.num_layers, self.max_width + 1), -1, dtype=torch.long)
+        for layer_id, choices in enumerate(self.setting):
+            self.width_table[layer_id, :len(choices)] = torch.tensor(choices)
+            self.index_table[layer_id, choices] = torch.arange(len(choices))
+        # python copy for scalar lookups inside forward
+        self._index_lists = self.index_table.tolist()
+
+    def __len__(self):
+        return self.num_layers
+
+    @property
+    def level_config(self):
+        """{'level1': choices, ...} for every distinct choice list, in layer order"""
+        levels = []
+        for choices in self.setting:
+            if choices not in levels:
+                levels.append(choices)
+        return {'level{}'.format(i + 1): list(choices) for i, choices in enumerate(levels)}
+
+    @property
+    def model_config(self):
+        """{layer_id: choices}, as the get_configs() of the supernets"""
+        return {layer_id: list(choices) for layer_id, choices in enumerate(self.setting)}
+
+    @property
+    def max_widths(self):
+        return [choices[-1] for choices in self.setting]
+
+    def index(self, layer_id, width):
+        '''choice index of width in layer layer_id'''
+        index = self._index_lists[layer_id][width] if 0 <= width <= self.max_width else -1
+        assert index >= 0, 'width {} is not a choice of layer {}'.format(width, layer_id)
+        return index
+
+    def masks(self, layer_id):
+        '''(num_choices, max width of the layer) 0/1 masks, row i keeps setting[layer_id][i] channels'''
+        choices = self.width_table[layer_id, :len(self.setting[layer_id])]
+        channels = torch.arange(self.setting[layer_id][-1])
+        return (channels < choices.view(-1, 1)).float()
+
+    def encode(self, lenth_lists):
+        '''widths (..., L) -> choice indices (..., L) with one gather'''
+        lenth_lists = torch.as_tensor(lenth_lists, dtype=torch.long)
+        layers = torch.arange(self.num_layers).expand_as(lenth_lists)
+        indices = self.index_table[layers, lenth_lists.clamp(0, self.max_width)]
+        assert bool((indices >= 0).all() and (lenth_lists <= self.max_width).all()), \
+            'arch contains widths outside the search space'
+        return indices
+
+    def decode(self, indices):
+        '''choice indices (..., L) -> widths (..., L) with one gather'''
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        layers = torch.arange(self.num_layers).expand_as(indices)
+        assert bool((indices < self.num_choices).all() and (indices >= 0).all()), \
+            'choice index out of range'
+        return self.width_table[layers, indices]
+
+    def parse(self, arch_strs):
+        '''arch strings -> (N, L) widths, a single str gives (L,)'''
+        single = isinstance(arch_strs, str)
+        if single:
+            arch_strs = [arch_strs]
+        widths = np.array('-'.join(arch_strs).split('-'), dtype=np.int64)
+        assert widths.size == len(arch_strs) * self.num_layers, \
+            'arch strings must have {} layers'.format(self.num_layers)
+        widths = torch.from_numpy(widths).view(len(arch_strs), self.num_layers)
+        return widths[0] if single else widths
+
+    def format(self, widths):
+        '''(N, L) widths -> arch strings, (L,) gives a single str'''
+        widths = torch.as_tensor(widths, dtype=torch.long)
+        if widths.dim() == 1:
+            return '-'.join(map(str, widths.tolist()))
+        return ['-'.join(map(str, arch)) for arch in widths.tolist()]
+
+    def one_hot(self, indices):
+        '''choice indices (..., L) -> (..., L, max_choices) float one-hot'''
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        return torch.nn.functional.one_hot(indices, self.max_choices).float()
+
+    def from_one_hot(self, one_hot):
+        '''(..., L, max_choices) one-hot or alpha -> choice indices (..., L), argmax over valid choices'''
+        one_hot = torch.as_tensor(one_hot, dtype=torch.float)
+        valid = torch.arange(self.max_choices) < self.num_choices.view(-1, 1)
+        one_hot = one_hot.masked_fill(~valid.to(one_hot.device), float('-inf'))
+        return one_hot.argmax(dim=-1)
+
+    def encode_str(self, arch_strs):
+        """arch strings -> choice indices"""
+        return self.encode(self.parse(arch_strs))
+
+    def decode_str(self, indices):
+        """choice indices -> arch strings"""
+        return self.format(self.decode(indices))
+
+
+@lru_cache(maxsize=None)
+def load_supernet_setting(path=META_PATH):
+    with open(path, 'r') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    return tuple(tuple(choices) for choices in config['SuperNetSetting'])
+
+
+@lru_cache(maxsize=None)
+def get_search_space(path=META_PATH):
+    '''the search space of configs/meta.yml, built once per process'''
+    return SearchSpace(load_supernet_setting(path))
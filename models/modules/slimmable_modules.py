@@ -4,7 +4,6 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.nn.init as init
-from prettytable import PrettyTable
 
 
 class SlimmableLinear(nn.Linear):
@@ -67,6 +66,17 @@ class SwitchableBatchNorm2d(nn.Module):
         y = self.bn[idx](input)
         return y
 
+    def group_forward(self, input, widths):
+        '''
+        K subnets stacked along the batch dim, group k uses the bn of
+        widths[k] on its first widths[k] channels, the rest stays zero.
+        '''
+        groups = len(widths)
+        xs = input.view(groups, -1, *input.shape[1:])
+        outs = [F.pad(self.bn[self.num_features_list.index(w)](x[:, :w]), (0, 0, 0, 0, 0, input.size(1) - w))
+                for x, w in zip(xs, widths)]
+        return torch.cat(outs)
+
 
 
 class SlimmableConv2d(nn.Conv2d):
@@ -133,3 +143,15 @@ class SlimmableConv2d(nn.Conv2d):
         y = nn.functional.conv2d(input, weight, bias, self.stride, self.padding,
                                  self.dilation, self.groups)
         return y
+
+    def group_forward(self, input, widths):
+        '''
+        K subnets stacked along the batch dim, one conv at the widest output
+        of the group. input channels beyond a group's width are zero, so its
+        output and weight gradient are those of its own sliced conv.
+        '''
+        width = max(widths)
+        weight = self.weight[:width, :input.size(1)]
+        bias = self.bias[:width] if self.bias is not None else None
+        return nn.functional.conv2d(input, weight, bias, self.stride, self.padding,
+                                    self.dilation, self.groups_list[0])
@@ -27,17 +27,28 @@ class LambdaLayer(nn.Module):
 class BasicBlock(nn.Module):
     expansion = 1
 
-    def __init__(self, in_planes, planes, stride=1, option='B'):
+    def __init__(self, in_planes, planes, stride=1, option='B', mid_planes=None):
         super(BasicBlock, self).__init__()
+        # mid_planes: conv1 output, planes by default (subnets of the supernet differ)
+        mid_planes = planes if mid_planes is None else mid_planes
         self.conv1 = nn.Conv2d(
-            in_planes, planes, kernel_size=3, stride=stride, padding=1, bias=False)
-        self.bn1 = nn.BatchNorm2d(planes)
-        self.conv2 = nn.Conv2d(planes, planes, kernel_size=3,
+            in_planes, mid_planes, kernel_size=3, stride=stride, padding=1, bias=False)
+        self.bn1 = nn.BatchNorm2d(mid_planes)
+        self.conv2 = nn.Conv2d(mid_planes, planes, kernel_size=3,
                                stride=1, padding=1, bias=False)
         self.bn2 = nn.BatchNorm2d(planes)
 
         self.shortcut = nn.Sequential()
-        if stride != 1 or in_planes != planes:
+        if option == 'C':
+            """
+            1x1 conv shortcut in every block, as sample_resnet20 (same_shortcut).
+            """
+            self.shortcut = nn.Sequential(
+                nn.Conv2d(in_planes, self.expansion * planes,
+                          kernel_size=1, stride=stride, bias=False),
+                nn.BatchNorm2d(self.expansion * planes)
+            )
+        elif stride != 1 or in_planes != planes:
             if option == 'A':
                 """
                 For CIFAR10 ResNet paper uses option A.
@@ -60,26 +71,37 @@ class BasicBlock(nn.Module):
 
 
 class ResNet(nn.Module):
-    def __init__(self, block, num_blocks, num_classes=100):
+    def __init__(self, block, num_blocks, num_classes=100, widths=None, option='B'):
+        '''
+        widths: channel numbers of a subnet arch (stem, then conv1 and conv2
+        of every block), the plain 16/32/64 resnet by default.
+        '''
         super(ResNet, self).__init__()
-        self.in_planes = 16
-
-        self.conv1 = nn.Conv2d(3, 16, kernel_size=3,
+        if widths is None:
+            widths = [16] + sum([[planes] * 2 * n for planes, n in zip([16, 32, 64], num_blocks)], [])
+        self.widths = list(widths)
+        self.option = option
+        self.in_planes = self.widths[0]
+        self.width_idx = 1
+
+        self.conv1 = nn.Conv2d(3, self.in_planes, kernel_size=3,
                                stride=1, padding=1, bias=False)
-        self.bn1 = nn.BatchNorm2d(16)
-        self.layer1 = self._make_layer(block, 16, num_blocks[0], stride=1)
-        self.layer2 = self._make_layer(block, 32, num_blocks[1], stride=2)
-        self.layer3 = self._make_layer(block, 64, num_blocks[2], stride=2)
-        self.linear = nn.Linear(64, num_classes)
+        self.bn1 = nn.BatchNorm2d(self.in_planes)
+        self.layer1 = self._make_layer(block, num_blocks[0], stride=1)
+        self.layer2 = self._make_layer(block, num_blocks[1], stride=2)
+        self.layer3 = self._make_layer(block, num_blocks[2], stride=2)
+        self.linear = nn.Linear(self.in_planes, num_classes)
 
         self.apply(_weights_init)
 
-    def _make_layer(self, block, planes, num_blocks, stride):
+    def _make_layer(self, block, num_blocks, stride):
         strides = [stride] + [1]*(num_blocks-1)
         layers = []
         for stride in strides:
-            layers.append(block(self.in_planes, planes, stride))
+            mid_planes, planes = self.widths[self.width_idx:self.width_idx + 2]
+            layers.append(block(self.in_planes, planes, stride, self.option, mid_planes))
             self.in_planes = planes * block.expansion
+            self.width_idx += 2
 
         return nn.Sequential(*layers)
 
@@ -94,5 +116,5 @@ class ResNet(nn.Module):
         return out
 
 
-def resnet20(num_classes=100):
-    return ResNet(BasicBlock, [3, 3, 3], num_classes=num_classes)
+def resnet20(num_classes=100, widths=None, option='B'):
+    return ResNet(BasicBlock, [3, 3, 3], num_classes=num_classes, widths=widths, option=option)
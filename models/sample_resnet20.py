@@ -10,53 +10,16 @@ from itertools import combinations
 
 from torch.autograd import Variable
 
+from .modules.dynamic_ops import slice_batch_norm
+from .modules.group_ops import channel_masks, group_batch_norm
+from .modules.search_space import get_search_space
+
 __all__ = ["sample_resnet20"]
 
-SuperNetSetting = [
-    [4, 8, 12, 16],  # 1
-    [4, 8, 12, 16],  # 2
-    [4, 8, 12, 16],  # 3
-    [4, 8, 12, 16],  # 4
-    [4, 8, 12, 16],  # 5
-    [4, 8, 12, 16],  # 6
-    [4, 8, 12, 16],  # 7
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 8
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 9
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 10
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 11
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 12
-    [4, 8, 12, 16, 20, 24, 28, 32],  # 13
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 14
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 15
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 16
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 17
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 18
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # 19
-    [4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56, 60, 64],  # fc
-]
-
-LenList = [
-    16,
-    16,
-    16,
-    16,
-    16,
-    16,
-    16,
-    32,
-    32,
-    32,
-    32,
-    32,
-    32,
-    64,
-    64,
-    64,
-    64,
-    64,
-    64,
-    64,
-]
+# 超网配置, 来自 configs/meta.yml
+SuperNetSetting = get_search_space().setting
+
+LenList = get_search_space().max_widths
 MaskRepeat = 1  # used in RandomMixChannelConvBN and SampleRandomConvBN
 ProbRatio = 1.0  # used in 'sample_flops_uniform' and 'sample_flops_fair'
 R = 1  # used in SampleLocalFreeConvBN
@@ -103,7 +66,8 @@ class SampleConvBN(nn.Module):
         affine=False,
     ):
         super(SampleConvBN, self).__init__()
-        assert out_planes == SuperNetSetting[layer_id][-1]
+        self.space = get_search_space()
+        assert out_planes == self.space.setting[layer_id][-1]
         global TrackRunningStats
         self.layer_id = layer_id
         self.conv = nn.Conv2d(
@@ -118,29 +82,63 @@ class SampleConvBN(nn.Module):
             out_planes, affine=affine, track_running_stats=TrackRunningStats
         )
 
-        self.register_buffer(
-            "masks",
-            torch.zeros(
-                [len(SuperNetSetting[layer_id]), SuperNetSetting[layer_id][-1], 1, 1]
-            ).cuda(),
-        )  # 4, 16, 1, 1
-
-        for i, channel in enumerate(SuperNetSetting[layer_id]):
-            self.masks[i][:channel] = 1
+        # 4, 16, 1, 1: row i keeps the first SuperNetSetting[layer_id][i] channels
+        masks = self.space.masks(layer_id)
+        self.register_buffer("masks", masks.view(*masks.shape, 1, 1))
 
     def forward(self, x, weight, lenth=None):
+        if lenth is not None:  # subnet forward
+            return self.subnet_forward(x, lenth)
         out = self.bn(self.conv(x))
-        mixed_masks = 0
-        if lenth is None:  # supernet forward
-            for w, mask in zip(weight, self.masks):
-                # weight存储的信息是, 某一层信息 alpha [0,1,0,0]
-                # mask存储的信息也是一层的，每层包括4/8/16个mask
-                mixed_masks += w * mask
-        else:  # subnet forward
-            assert lenth in SuperNetSetting[self.layer_id]
-            index = SuperNetSetting[self.layer_id].index(lenth)
-            mixed_masks += self.masks[index]
-        return out * mixed_masks
+        # weight存储的信息是, 某一层信息 alpha [0,1,0,0]
+        # mask存储的信息也是一层的，每层包括4/8/16个mask, 一次 matmul 完成混合
+        weight = torch.as_tensor(weight, dtype=out.dtype, device=out.device)
+        mixed_masks = torch.matmul(weight, self.masks.flatten(1))
+        return out * mixed_masks.view(1, -1, 1, 1)
+
+    def subnet_forward(self, x, lenth):
+        """Run conv and bn on the active channels only.
+
+        Same numbers as masking the full-width output with ``masks[index]``,
+        but ``x`` only carries the active input channels and the output only
+        carries ``lenth`` channels, so the cost follows the subnet width.
+        """
+        self.space.index(self.layer_id, lenth)  # asserts lenth is a choice
+        conv = self.conv
+        weight = conv.weight[:lenth, : x.size(1)]
+        bias = conv.bias[:lenth] if conv.bias is not None else None
+        out = F.conv2d(
+            x, weight, bias, conv.stride, conv.padding, conv.dilation, conv.groups
+        )
+        return slice_batch_norm(out, self.bn)
+
+    def group_forward(self, x, lenths):
+        """Forward K subnets stacked along the batch dim.
+
+        x is (K*B, C, H, W) with subnet k in rows [k*B, (k+1)*B), lenths is a
+        (K,) LongTensor of output widths. The conv runs once on the widest
+        width of the group and each subnet keeps its own channels and bn
+        statistics, as if it had been forwarded alone.
+        """
+        width = int(lenths.max())
+        conv = self.conv
+        weight = conv.weight[:width, : x.size(1)]
+        bias = conv.bias[:width] if conv.bias is not None else None
+        out = F.conv2d(
+            x, weight, bias, conv.stride, conv.padding, conv.dilation, conv.groups
+        )
+        masks = channel_masks(lenths, width, out.dtype)
+        return group_batch_norm(out, self.bn, lenths.numel(), masks)
+
+
+def channel_add(out, shortcut):
+    """add two feature maps whose active widths may differ (zero padded)"""
+    diff = out.size(1) - shortcut.size(1)
+    if diff > 0:
+        shortcut = F.pad(shortcut, (0, 0, 0, 0, 0, diff))
+    elif diff < 0:
+        out = F.pad(out, (0, 0, 0, 0, 0, -diff))
+    return out + shortcut
 
 
 def _weights_init(m):
@@ -250,11 +248,35 @@ class BasicBlock(nn.Module):
             #     out += x
             # else:
             #     out += self.shortcut(x, weight2, lenth2)
+        elif lenth2 is not None:  # subnet forward, x and out may be sliced
+            out = channel_add(out, self.sliced_shortcut(x))
         else:
             out += self.shortcut(x)
         out = F.relu(out)
         return out
 
+    def group_forward(self, x, lenths1, lenths2):
+        groups = lenths2.numel()
+        out = F.relu(self.convbn1.group_forward(x, lenths1))
+        out = self.convbn2.group_forward(out, lenths2)
+
+        if self.same_shortcut:
+            out += self.shortcut.group_forward(x, lenths2)
+        elif len(self.shortcut) == 0:
+            out = channel_add(out, x)
+        else:
+            conv, bn = self.shortcut
+            shortcut = F.conv2d(x, conv.weight[:, : x.size(1)], None, conv.stride)
+            out = channel_add(out, group_batch_norm(shortcut, bn, groups))
+        return F.relu(out)
+
+    def sliced_shortcut(self, x):
+        if len(self.shortcut) == 0 or x.size(1) == self.shortcut[0].in_channels:
+            return self.shortcut(x)
+        conv, bn = self.shortcut
+        out = F.conv2d(x, conv.weight[:, : x.size(1)], None, conv.stride)
+        return bn(out)
+
 
 class ResNet(nn.Module):
     def __init__(
@@ -292,8 +314,37 @@ class ResNet(nn.Module):
         )
         # self.linear = nn.Linear(self.len_list[-2], num_classes)
 
+        if alpha_type in ("sample_flops_uniform", "sample_flops_fair"):
+            self._init_flops_prob(num_classes)
+        if alpha_type in ("sample_fair", "sample_flops_fair"):
+            self.register_buffer("counts1", torch.zeros(7, 4))
+            self.register_buffer("counts2", torch.zeros(6, 8))
+            self.register_buffer("counts3", torch.zeros(6, 16))
+
         self.apply(_weights_init)
 
+    def _init_flops_prob(self, num_classes):
+        """Choice probabilities and fair-count increments weighted by FLOPs.
+
+        prob{1,2,3}: per-stage choice probability, proportional to the FLOPs
+        of the choice (others at their widest) to the power ProbRatio.
+        delta{1,2,3}: (layers, choices) count increments in units of the
+        mean FLOPs of the layer, so 'sample_flops_fair' balances the FLOPs
+        spent on every choice instead of the number of times it is picked.
+        """
+        from utils.cost_model import get_cost_model
+
+        choice_flops = get_cost_model(num_classes).choice_flops()
+        for i, (start, end) in enumerate([(0, 7), (7, 13), (13, 19)]):
+            flops = np.stack(choice_flops[start:end]).astype(np.float64)
+            prob = flops.mean(axis=0) ** ProbRatio
+            setattr(self, "prob{}".format(i + 1), prob / prob.sum())
+            setattr(
+                self,
+                "delta{}".format(i + 1),
+                flops / flops.mean(axis=1, keepdims=True),
+            )
+
     def alpha_hold(self):
         if not hasattr(self, "pre_alphas"):
             self.pre_alphas = []
@@ -600,13 +651,15 @@ class ResNet(nn.Module):
 
         return nn.Sequential(*layers)
 
-    def forward(self, x, lenth_list=None):
+    def forward(self, x, lenth_list=None, alphas=None):
+        """alphas: (alpha1, alpha2, alpha3) of alpha_cal() to reuse instead of sampling"""
         if lenth_list is None:  # supernet forward
             lenth_list = [None] * len(LenList)
-        else:  # subnet forward
+            alpha1, alpha2, alpha3 = self.alpha_cal() if alphas is None else alphas
+        else:  # subnet forward, convbn slices by lenth and ignores alpha
             assert len(lenth_list) == len(LenList)
+            alpha1, alpha2, alpha3 = [None] * 7, [None] * 6, [None] * 6
         k = 0
-        alpha1, alpha2, alpha3 = self.alpha_cal()
         out = F.relu(self.convbn1(x, alpha1[0], lenth_list[k]))
         k += 1
         for i, layer in enumerate(self.layer1):
@@ -645,11 +698,70 @@ class ResNet(nn.Module):
             )
             k += 2
 
+        return self.classify(out)
+
+    def classify(self, out):
         out = F.avg_pool2d(out, out.size()[3])
         out = out.view(out.size(0), -1)
+        dropout, fc = self.linear
+        if out.size(1) != fc.in_features:  # sliced subnet features
+            return F.linear(dropout(out), fc.weight[:, : out.size(1)], fc.bias)
         out = self.linear(out)
         return out
 
+    def forward_cached(self, x, lenth_list, cache):
+        """Subnet forward reusing the block outputs of the previous call.
+
+        cache is a list owned by the caller and reset for every new x. Entry j
+        holds (lenth_list[: 2 * j + 1], output after block j), so consecutive
+        archs sharing leading channel numbers skip the shared blocks. Only
+        valid in eval mode, where a block output depends on x and the
+        channel numbers so far.
+        """
+        blocks = [*self.layer1, *self.layer2, *self.layer3]
+        key = tuple(lenth_list)
+        start = 0
+        while start < len(cache) and cache[start][0] == key[: 2 * start + 1]:
+            start += 1
+        del cache[start:]
+
+        if start == 0:
+            out = F.relu(self.convbn1(x, None, key[0]))
+            cache.append((key[:1], out))
+            start = 1
+        out = cache[start - 1][1]
+        for j in range(start, len(blocks) + 1):
+            k = 2 * j - 1
+            out = blocks[j - 1](
+                out, None, None, None, key[k - 1], key[k], key[k + 1]
+            )
+            cache.append((key[: k + 2], out))
+        return self.classify(out)
+
+    def forward_archs(self, x, lenth_lists):
+        """Evaluate K archs on the same batch in one pass.
+
+        lenth_lists is a (K, 20) LongTensor of channel numbers, returns logits
+        of shape (K, B, num_classes). Matches calling forward(x, lenth_list)
+        once per arch.
+        """
+        groups, batch_size = lenth_lists.size(0), x.size(0)
+        lenth_lists = lenth_lists.to(x.device)
+
+        # the first convbn sees the same input for every arch
+        lenths = lenth_lists[:, 0]
+        out = self.convbn1.subnet_forward(x, int(lenths.max()))
+        out = out.repeat(groups, 1, 1, 1).view(groups, batch_size, *out.shape[1:])
+        masks = channel_masks(lenths, out.size(2), out.dtype)
+        out = F.relu(out * masks.view(groups, 1, -1, 1, 1)).flatten(0, 1)
+
+        k = 1
+        for layer in [*self.layer1, *self.layer2, *self.layer3]:
+            out = layer.group_forward(out, lenth_lists[:, k], lenth_lists[:, k + 1])
+            k += 2
+
+        return self.classify(out).view(groups, batch_size, -1)
+
     def min_min(self, x, target, criterion):
         global R
         if self.convbn_type == SampleLocalFreeConvBN:
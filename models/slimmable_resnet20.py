@@ -1,10 +1,11 @@
 import math
+from collections import OrderedDict
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.nn.init as init
-from prettytable import PrettyTable
+from .modules.search_space import get_search_space
 from .modules.slimmable_modules import SlimmableConv2d, SlimmableLinear, SwitchableBatchNorm2d
 
 __all__ = ['slimmable_resnet20']
@@ -15,22 +16,8 @@ max_arc_rep = "16-16-16-16-16-16-16-32-32-32-32-32-32-64-64-64-64-64-64-64"
 
 
 def get_configs():
-    level_config = {
-        "level1": [4*(i+1) for i in range(4)],
-        "level2": [4*(i+1) for i in range(8)],
-        "level3": [4*(i+1) for i in range(16)]
-    }
-
-    model_config = {}
-
-    for i in range(0, 7):
-        model_config[i] = level_config["level1"]
-    for i in range(7, 13):
-        model_config[i] = level_config["level2"]
-    for i in range(13, 20):
-        model_config[i] = level_config["level3"]
-
-    return level_config, model_config
+    space = get_search_space()
+    return space.level_config, space.model_config
 
 
 class MutableBlock(nn.Module):
@@ -101,6 +88,33 @@ class MutableBlock(nn.Module):
             res += self.shortcut1(x)
         return self.relu(res)
 
+    def group_forward(self, x, in_widths, mid_widths, out_widths):
+        '''K subnets stacked along the batch dim, see MutableModel.forward_archs'''
+        conv1, bn1, _, conv2, bn2 = self.body
+        res = F.relu(bn1.group_forward(conv1.group_forward(x, mid_widths), mid_widths))
+        res = bn2.group_forward(conv2.group_forward(res, out_widths), out_widths)
+
+        # as forward: identity when the width and the size are kept, shortcut2 otherwise
+        groups, width = len(out_widths), res.size(1)
+        res = res.view(groups, -1, *res.shape[1:])
+        xs = x.view(groups, -1, *x.shape[1:])
+        conv, bn = self.shortcut2
+        stride = conv.stride[0]
+        need = [k for k in range(groups) if stride != 1 or in_widths[k] != out_widths[k]]
+        keep = [k for k in range(groups) if k not in need]
+        if keep:
+            identity = xs[keep, :, :width]
+            identity = F.pad(identity, (0, 0, 0, 0, 0, width - identity.size(2)))
+            res = res.index_add(0, torch.tensor(keep, device=x.device), identity)
+        if need:
+            sub = xs[need].flatten(0, 1)
+            widths = [out_widths[k] for k in need]
+            shortcut = bn.group_forward(conv.group_forward(sub, widths), widths)
+            shortcut = F.pad(shortcut, (0, 0, 0, 0, 0, width - shortcut.size(1)))
+            res = res.index_add(0, torch.tensor(need, device=x.device),
+                                shortcut.view(len(need), -1, *shortcut.shape[1:]))
+        return self.relu(res.flatten(0, 1))
+
 
 class MutableModel(nn.Module):
 
@@ -108,11 +122,13 @@ class MutableModel(nn.Module):
                  arc_representation,
                  block,
                  num_blocks,
-                 num_classes=100):
+                 num_classes=100,
+                 plan_capacity=1024):
         super(MutableModel, self).__init__()
 
         self.lc, self.mc = get_configs()
 
+        from prettytable import PrettyTable
         self.tb = PrettyTable()
         self.tb.field_names = ["op", "in", "out"]
 
@@ -152,6 +168,14 @@ class MutableModel(nn.Module):
 
         self._initialize_weights()
 
+        # the modules whose choices an arch sets, in the order modify_channel
+        # used to visit them, and the per arch plans of their choices (LRU)
+        self.slimmable_modules = [m for m in self.modules()
+                                  if isinstance(m, (SlimmableConv2d, SwitchableBatchNorm2d, SlimmableLinear))]
+        self.plan_capacity = plan_capacity
+        self.plans = OrderedDict()
+        self.current_arc = None
+
     def _make_layer(self, block, num_blocks, stride):
         strides = [stride] + [1] * (num_blocks-1)
         layers = []
@@ -197,9 +221,47 @@ class MutableModel(nn.Module):
                 if m.bias is not None:
                     nn.init.constant_(m.bias, 0)
 
-    def forward(self, x, arc):
+    def get_plan(self, arc):
+        '''
+        the (in_choice, out_choice) of every module of slimmable_modules for
+        arc, None for a bn in_choice. built once per arch string, LRU cached.
+        '''
+        key = '-'.join(map(str, arc))
+        plan = self.plans.get(key)
+        if plan is not None:
+            self.plans.move_to_end(key)
+            return plan
         self.get_true_arc_list(arc)
-        self.apply(self.modify_channel)
+        plan = []
+        for module in self.slimmable_modules:
+            if isinstance(module, SwitchableBatchNorm2d):
+                plan.append((None, self.switchableBatchNorm2d_out_choice_list.pop(0)))
+            elif isinstance(module, SlimmableConv2d):
+                plan.append((self.slimmableConv2d_in_choice_list.pop(0),
+                             self.slimmableConv2d_out_choice_list.pop(0)))
+            else:
+                plan.append((self.slimmableLinear_in_choice_list.pop(0),
+                             self.slimmableLinear_out_choice_list.pop(0)))
+        self.plans[key] = plan = tuple(plan)
+        if len(self.plans) > self.plan_capacity:
+            self.plans.popitem(last=False)
+        return plan
+
+    def set_arc(self, arc):
+        '''set the choices of arc on every slimmable module, no module walk'''
+        key = '-'.join(map(str, arc))
+        if key == self.current_arc:
+            return
+        for module, (in_choice, out_choice) in zip(self.slimmable_modules, self.get_plan(arc)):
+            # plain ints, skip the slow nn.Module.__setattr__
+            choices = module.__dict__
+            if in_choice is not None:
+                choices['in_choice'] = in_choice
+            choices['out_choice'] = out_choice
+        self.current_arc = key
+
+    def forward(self, x, arc):
+        self.set_arc(arc)
 
         # 第一个layer
         x = F.relu(self.first_bn(self.first_conv(x)))
@@ -218,6 +280,32 @@ class MutableModel(nn.Module):
         # print(x.shape)
         return x
 
+    def forward_archs(self, x, arcs):
+        '''
+        forward K archs on the same batch in one pass, (K, B, num_classes)
+        logits. every conv runs once on the K groups stacked along the batch
+        dim, every group keeps its own width and its own switchable bn, so
+        logits and gradients are those of K separate forward(x, arc) calls.
+        '''
+        arcs = [[int(w) for w in arc] for arc in arcs]
+        groups, batch_size = len(arcs), x.size(0)
+        widths = list(zip(*arcs))  # widths[l]: width of layer l in every group
+
+        # the first conv sees the same input for every arch
+        out = self.first_conv.group_forward(x, widths[0])
+        out = out.repeat(groups, 1, 1, 1)
+        out = F.relu(self.first_bn.group_forward(out, widths[0]))
+
+        k = 0
+        for block in [*self.layer1, *self.layer2, *self.layer3]:
+            out = block.group_forward(out, widths[k], widths[k + 1], widths[k + 2])
+            k += 2
+
+        out = self.avgpool(out).flatten(1)
+        # features beyond a group's width are zero, one linear serves all groups
+        out = F.linear(out, self.classifier.weight[:, :out.size(1)], self.classifier.bias)
+        return out.view(groups, batch_size, -1)
+
     def get_true_arc_list(self, arc_list):
         '''
         实际的网络架构
@@ -9,24 +9,23 @@ from .modules.dynamic_ops import *
 __all__ = ['SuperNet']
 
 class SuperNet(nn.Module):
-    def __init__(self, conv=FullConv, bn=FullBN, fc=FullFC, config=SuperNetSetting):
+    def __init__(self, conv=FullConv, bn=FullBN, fc=FullFC, config=SuperNetSetting, num_classes=100):
         super().__init__()
         self.bn_cls = bn
         self.conv_cls = conv
         self.fc_cls = fc
         self.config = config
+        self.num_classes = num_classes
         self.max_list = [max(x) for x in self.config]
         self.size_list = [len(x) for x in self.config]
         self._build_layers()
         self._init_weights()
 
     def _init_weights(self):
-        m = self.modules()
-        classname = m.__class__.__name__
-        # print(classname)
-        if isinstance(m, nn.Linear) or isinstance(m, nn.Conv2d):
-            init.kaiming_uniform_(
-                m.weight, mode='fan_out', nonlinearity='relu')
+        for m in self.modules():
+            if isinstance(m, nn.Linear) or isinstance(m, nn.Conv2d):
+                init.kaiming_uniform_(
+                    m.weight, mode='fan_out', nonlinearity='relu')
 
     def _build_layers(self):
         bn, conv, fc = self.bn_cls, self.conv_cls, self.fc_cls
@@ -47,7 +46,7 @@ class SuperNet(nn.Module):
                 setattr(self, f"bn-{i}-down",
                         bn(self.config[i], self.config[i+2]))
 
-        self.fc = fc(self.config[18], 100)
+        self.fc = fc(self.config[18], self.num_classes)
 
     def forward(self, x, arch, sc=True):
         # skip connection for sc
@@ -76,8 +75,8 @@ class SuperNet(nn.Module):
                         self, f"bn-{base}-down")(shortcut, arch[base], arch[base+2])
                 x = x + shortcut
                 x = F.relu(x)
-            x = F.adaptive_avg_pool2d(x, (1, 1)).flatten(1)
-            return self.fc(x, arch[18])
+        x = F.adaptive_avg_pool2d(x, (1, 1)).flatten(1)
+        return self.fc(x, arch[18])
 
 
 if __name__ == "__main__":
@@ -20,6 +20,10 @@ import torchvision.datasets as datasets
 import numpy as np
 from model.sample_resnet20 import sample_resnet20
 from utils.utils import *
+from utils.arch_table import open_arch_table
+from utils.bn_calibration import BNCalibrator, calibration_images
+from utils.eval_cache import EvalCache
+from utils.evaluator import eval_config
 
 '''
 Namespace(affine=True, 
@@ -100,6 +104,10 @@ parser.add_argument('--bn_calibrate_batch', type=int,
                     default=10000, help='bn calibrate batch')
 parser.add_argument('--bn_calibrate_batch_num', type=int,
                     default=1, help='bn calibrate batch num')
+parser.add_argument('--bn_calibrate_cache', type=int, default=1024,
+                    help='num of archs whose calibrated bn stats are kept')
+parser.add_argument('--bn_calibrate_file', default='data/bn_calibrate_images.pt', type=str,
+                    help='cache of the calibration images, empty to disable')
 parser.add_argument('--train', action='store_true', help='train on supernet')
 parser.add_argument('--train_batch_size', type=int,
                     default=128, help='train epoch on supernet')
@@ -116,6 +124,8 @@ parser.add_argument('--train_weight_decay', type=float,
 parser.add_argument('--train_print_freq', type=int, default=100,
                     help='train print freq epoch on supernet')
 parser.add_argument('--seed', type=int, default=2, help='random seed')
+parser.add_argument('--eval_cache', default='data/eval_cache.sqlite', type=str,
+                    help='sqlite cache of results keyed by weights and eval config, empty to disable')
 args = parser.parse_args()
 best_prec1 = 0
 
@@ -150,10 +160,11 @@ def main():
     #                  localsep_portion=args.localsep_portion, 
     #                  same_shortcut=args.sameshortcut, 
     #                  track_running_stats=args.track_running_stats)
-    model = sample_resnet20()
+    model = sample_resnet20(track_running_stats=args.track_running_stats)
     model.cuda()
     # try:
-    model.load_state_dict(torch.load(args.model_path)['state_dict'])
+    # running stats are recalibrated per arch, the checkpoint may not have them
+    model.load_state_dict(torch.load(args.model_path)['state_dict'], strict=not args.bn_calibrate)
     # except:
     #     print("BN track running stats is False in pt but True in model, so here ignore it")
     #     model.load_state_dict(torch.load(args.model_path)[
@@ -179,28 +190,52 @@ def main():
         pin_memory=True,
     )
 
+    calibrator = None
+    if args.bn_calibrate:
+        calibrate_loader = torch.utils.data.DataLoader(
+            datasets.CIFAR100(root='./data', train=True, download=True,
+                              transform=transforms.Compose([transforms.ToTensor(), normalize])),
+            batch_size=args.bn_calibrate_batch, shuffle=False, num_workers=args.workers)
+        images = calibration_images(calibrate_loader, args.bn_calibrate_batch * args.bn_calibrate_batch_num,
+                                    'cuda', args.bn_calibrate_file or None)
+        calibrator = BNCalibrator(model, images, args.bn_calibrate_cache, args.bn_calibrate_batch)
+
+    cache = None
+    if args.eval_cache:
+        cache = EvalCache(args.eval_cache, model, eval_config(
+            val_loader, dataset='cifar100', track_running_stats=args.track_running_stats,
+            bn_calibrate=[args.bn_calibrate_batch, args.bn_calibrate_batch_num] if args.bn_calibrate else None))
+
     val_loader = get_loader(val_loader)
 
-    with open(args.eval_json_path, 'r') as f:
-        archs_info = json.load(f)
+    # rows read from the mapped table, no dict of all the archs
+    table = open_arch_table(args.eval_json_path)
     sub_archs_info = {}
 
     if args.train:
         model_origin = model
 
     for arch_i in range(args.arch_start, min(50001, args.arch_start + args.arch_num)):
-        if 'arch{}'.format(arch_i) in archs_info:
-            lenlist = get_arch_lenlist(archs_info, arch_i)
-
-            prec1 = validate(val_loader, model, lenlist)
+        if 'arch{}'.format(arch_i) in table:
+            lenlist = table.widths[table.index('arch{}'.format(arch_i))].tolist()
+            arch_str = table.arch_str('arch{}'.format(arch_i))
+
+            hit = cache.get([arch_str]) if cache is not None else {}
+            if arch_str in hit:
+                prec1 = hit[arch_str][0] * 100
+            else:
+                if calibrator is not None:
+                    calibrator.apply(lenlist)
+                prec1 = validate(val_loader, model, lenlist)
+                if cache is not None:
+                    cache.put([arch_str], [prec1 / 100])
 
             sub_archs_info['arch{}'.format(arch_i)] = {}
             sub_archs_info['arch{}'.format(arch_i)]['acc'] = prec1
-            sub_archs_info['arch{}'.format(
-                arch_i)]['arch'] = archs_info['arch{}'.format(arch_i)]['arch']
+            sub_archs_info['arch{}'.format(arch_i)]['arch'] = arch_str
 
             logging.info('Arch{}: [acc: {:.5f}][arch: {}]'.format(
-                arch_i, prec1, archs_info['arch{}'.format(arch_i)]['arch']))
+                arch_i, prec1, arch_str))
 
     save_json = os.path.join(args.save_dir, '{}.json'.format(args.save_file))
     with open(save_json, 'w') as f:
@@ -24,6 +24,7 @@ import pytorch_warmup as warmup
 # from resnet20_supernet import 
 from model.sample_resnet20 import sample_resnet20
 from utils.utils import *
+from utils.accumulation import AccumulationEngine
 
 
 '''
@@ -135,6 +136,11 @@ parser.add_argument('--track_file', default='Track1_submit/files/Track1_200_arch
                     type=str, help='used in sample_trackarch')
 parser.add_argument('--sample_accumulation_steps', type=int,
                     default=6, help='used in sample_based method')
+parser.add_argument('--memory_budget', type=float, default=0,
+                    help='MB of activations alive at once, batches are split in micro batches '
+                         '(and forwards recomputed) to fit, 0 for no limit')
+parser.add_argument('--micro_batch_size', type=int, default=None,
+                    help='fixed micro batch size instead of one picked from --memory_budget')
 parser.add_argument('--label_smooth', type=float,
                     default=0.0, help='label smoothing')
 
@@ -293,6 +299,9 @@ def main():
                 'alpha3': alpha3,
             }, False, filename=os.path.join(alpha_path, 'epoch_-1.th'))
 
+    engine = AccumulationEngine(args.memory_budget * 2 ** 20 if args.memory_budget > 0 else None,
+                                micro_batch_size=args.micro_batch_size)
+
     for epoch in range(args.start_epoch, args.epochs):
 
         # train for one epoch
@@ -304,7 +313,7 @@ def main():
                 args.drop_path_rate * (epoch - args.start_epoch) / (args.epochs - args.start_epoch))
 
         train(train_queue, valid_queue if 'mix' == args.alpha_type else None, model, criterion if args.label_smooth ==
-              0 else criterion_smooth, soft_criterion, optimizer, arch_optimizer, lr_scheduler, warmup_scheduler, epoch, args)
+              0 else criterion_smooth, soft_criterion, optimizer, arch_optimizer, lr_scheduler, warmup_scheduler, epoch, args, engine)
 
         if 'mix' == args.alpha_type:
             with torch.no_grad():
@@ -348,10 +357,15 @@ def main():
             args.save_dir, 'result.json'), alpha1, alpha2, alpha3)
 
 
-def train(train_queue, valid_queue, model, criterion, soft_criterion, optimizer, arch_optimizer, scheduler, warmup_scheduler, epoch, args):
+def train(train_queue, valid_queue, model, criterion, soft_criterion, optimizer, arch_optimizer, scheduler, warmup_scheduler, epoch, args, engine=None):
     """
         Run one train epoch
     """
+    if engine is None:
+        engine = AccumulationEngine()
+    widest = [16, 16, 16, 16, 16, 16, 16, 32, 32, 32, 32, 32, 32, 64, 64, 64, 64, 64, 64, 64]
+    narrowest = [4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4]
+
     batch_time = AverageMeter()
     data_time = AverageMeter()
     losses = AverageMeter()
@@ -419,53 +433,57 @@ def train(train_queue, valid_queue, model, criterion, soft_criterion, optimizer,
         elif args.tauloss:
             optimizer.zero_grad()  # zero gradient
             for _ in range(args.sample_accumulation_steps): 
-                model.alpha_hold()
-                output = model(input_var)
-                loss1 = criterion(output, target_var)
-                model.alpha_hold()
-                output = model(input_var)
-                loss2 = criterion(output, target_var)
-                
-                new_input_var = input_var + args.tauloss_noise * \
-                    2 * (torch.rand(input_var.size()) - 1).cuda()
-                model.alpha_pop()
-                
-                output = model(new_input_var)
-                loss3 = criterion(output, target_var)
-                model.alpha_pop()
-                
-                output = model(new_input_var)
-                loss4 = criterion(output, target_var)
-                loss = 0.25 * (loss1 + loss2 + loss3 + loss4) + 0.5 * args.tauloss_lamda * max(
-                    0, -torch.sign(loss1 - loss2) * (loss3 - loss4) - torch.sign(loss3 - loss4) * (loss1 - loss2))
-                loss.backward()  # compute gradient
+                # two archs, each on the clean and the noisy input
+                alphas1, alphas2 = model.alpha_cal(), model.alpha_cal()
+
+                def tau_loss(forward, x, y):
+                    output = forward(model, x, alphas=alphas1)
+                    loss1 = criterion(output, y)
+                    output = forward(model, x, alphas=alphas2)
+                    loss2 = criterion(output, y)
+
+                    new_x = x + args.tauloss_noise * 2 * (torch.rand_like(x) - 1)
+                    output = forward(model, new_x, alphas=alphas1)
+                    loss3 = criterion(output, y)
+                    output = forward(model, new_x, alphas=alphas2)
+                    loss4 = criterion(output, y)
+                    loss = 0.25 * (loss1 + loss2 + loss3 + loss4) + 0.5 * args.tauloss_lamda * max(
+                        0, -torch.sign(loss1 - loss2) * (loss3 - loss4) - torch.sign(loss3 - loss4) * (loss1 - loss2))
+                    return loss, output
+
+                loss, output = engine.step(tau_loss, input_var, target_var)  # compute gradient
             optimizer.step()  # do SGD step
         else: # 进入这里
             optimizer.zero_grad()  # zero gradient
             for _ in range(args.sample_accumulation_steps): 
                 # 作者解释说这是类似fairnas的方式，累积多个以后，然后同时进行更新
-                output = model(input_var)  # compute output
-                loss = criterion(output, target_var)  # compute loss
-
-                if args.distill:
-                    teacher_output = model(input_var, [
-                                           16, 16, 16, 16, 16, 16, 16, 32, 32, 32, 32, 32, 32, 64, 64, 64, 64, 64, 64, 64])
-                    teacher_loss = criterion(teacher_output, target_var)
-                    soft_target_var = torch.nn.functional.softmax(
-                        teacher_output, dim=1).detach()
-                    distill_loss = soft_criterion(output, soft_target_var)
-
-                    loss = 0.5 * (loss + teacher_loss) + \
-                        args.distill_lamda * distill_loss
-
-                    if args.min_distill:
-                        min_output = model(
-                            input_var, [4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4])
-                        min_loss = criterion(min_output, target_var)
-                        min_distill_loss = soft_criterion(
-                            min_output, soft_target_var)
-                        loss = loss + 0.5 * min_loss + args.min_distill_lamda * min_distill_loss
-                loss.backward()  # compute gradient
+                # one arch per accumulation step, shared by all its micro batches
+                alphas = model.alpha_cal()
+
+                def sample_loss(forward, x, y):
+                    output = forward(model, x, alphas=alphas)  # compute output
+                    loss = criterion(output, y)  # compute loss
+
+                    if args.distill:
+                        teacher_output = forward(model, x, widest)
+                        teacher_loss = criterion(teacher_output, y)
+                        soft_target_var = torch.nn.functional.softmax(
+                            teacher_output, dim=1).detach()
+                        distill_loss = soft_criterion(output, soft_target_var)
+
+                        loss = 0.5 * (loss + teacher_loss) + \
+                            args.distill_lamda * distill_loss
+
+                        if args.min_distill:
+                            min_output = forward(model, x, narrowest)
+                            min_loss = criterion(min_output, y)
+                            min_distill_loss = soft_criterion(
+                                min_output, soft_target_var)
+                            loss = loss + 0.5 * min_loss + args.min_distill_lamda * min_distill_loss
+                    return loss, output
+
+                # micro batches are backwarded (and their graphs freed) one by one
+                loss, output = engine.step(sample_loss, input_var, target_var)
             optimizer.step()  # do SGD step
 
         if valid_queue is not None: # TODO 在验证集上跑？
@@ -0,0 +1,219 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from datasets.dataset import ArchLoader, get_val_loader
+from eval_archs import load_supernet
+from models.modules.search_space import get_search_space
+from utils.cost_model import get_cost_model
+from utils.eval_cache import EvalCache
+from utils.evaluator import eval_config, evaluate_archs, preload
+
+parser = argparse.ArgumentParser("ResNet20-cifar100-search")
+parser.add_argument('--model_path', default='weights/model-latest.th',
+                    help='supernet checkpoint', type=str)
+parser.add_argument('--mode', default='evolution', type=str, help='evolution or random')
+parser.add_argument('--population', default=50, type=int, help='archs per generation')
+parser.add_argument('--generations', default=20, type=int, help='num of generations')
+parser.add_argument('--topk', default=10, type=int, help='parents kept every generation')
+parser.add_argument('--num_mutation', default=25, type=int, help='children by mutation')
+parser.add_argument('--num_crossover', default=25, type=int, help='children by crossover')
+parser.add_argument('--mutation_prob', default=0.1, type=float,
+                    help='prob of resampling a layer when mutating')
+parser.add_argument('--max_flops', default=None, type=float, help='flops constraint, M')
+parser.add_argument('--max_params', default=None, type=float, help='params constraint, M')
+parser.add_argument('--num_batches', default=None, type=int,
+                    help='num of val batches used for scoring, all by default')
+parser.add_argument('--batch_size', default=1000, type=int, help='val batch size')
+parser.add_argument('--workers', default=3, type=int, help='num of workers')
+parser.add_argument('--group_size', default=None, type=int,
+                    help='num of archs packed in one forward, 1 on cpu and 8 on gpu by default')
+parser.add_argument('--chunk_size', default=256, type=int,
+                    help='num of archs sharing cached blocks when group_size is 1')
+parser.add_argument('--dataset', default='cifar100', type=str, help='cifar10 or cifar100')
+parser.add_argument('--num_classes', default=100, type=int)
+parser.add_argument('--track_running_stats', action='store_true',
+                    help='bn track_running_stats')
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu',
+                    type=str, help='cpu or cuda')
+parser.add_argument('--eval_cache', default='data/eval_cache.sqlite', type=str,
+                    help='sqlite cache of results keyed by weights and eval config, empty to disable')
+parser.add_argument('--seed', default=0, type=int, help='random seed')
+parser.add_argument('--save_dir', default='search', type=str,
+                    help='the directory used to save the result')
+parser.add_argument('--save_file', default='search-final', type=str,
+                    help='the file used to save the result')
+
+
+class CachedEvaluator(object):
+    '''
+    score archs on the supernet, every arch string is evaluated once.
+    cache: {arch str: top1 in [0, 1]}
+    disk_cache: optional EvalCache shared with the other eval paths
+    '''
+
+    def __init__(self, model, batches, group_size=1, chunk_size=256, disk_cache=None):
+        self.model = model
+        self.batches = batches
+        self.group_size = group_size
+        self.chunk_size = chunk_size
+        self.disk_cache = disk_cache
+        self.space = get_search_space()
+        self.cache = {}
+
+    def __call__(self, archs):
+        arch_strs = self.space.format(archs)
+        todo = sorted(set(s for s in arch_strs if s not in self.cache))
+        if todo:
+            top1, _ = evaluate_archs(self.model, self.batches, self.space.parse(todo).numpy(),
+                                     self.group_size, self.chunk_size, verbose=False,
+                                     cache=self.disk_cache)
+            self.cache.update(zip(todo, top1.tolist()))
+        return np.array([self.cache[s] for s in arch_strs])
+
+
+class Searcher(object):
+    def __init__(self, evaluator, args):
+        self.evaluator = evaluator
+        self.args = args
+        self.loader = ArchLoader()
+        self.rng = np.random.RandomState(args.seed)
+        self.cost_model = get_cost_model(args.num_classes)
+
+    def is_valid(self, archs):
+        flops, params = self.cost_model(archs)
+        valid = np.ones(len(archs), dtype=bool)
+        if self.args.max_flops is not None:
+            valid &= flops <= self.args.max_flops * 1e6
+        if self.args.max_params is not None:
+            valid &= params <= self.args.max_params * 1e6
+        return valid
+
+    def keep(self, archs, num, exclude=()):
+        '''first num valid archs, unique and not in exclude'''
+        seen = set(map(tuple, exclude))
+        result = []
+        for arch, valid in zip(archs, self.is_valid(archs)):
+            key = tuple(arch)
+            if valid and key not in seen:
+                seen.add(key)
+                result.append(arch)
+                if len(result) == num:
+                    break
+        return result
+
+    def fill(self, num, propose, exclude=(), max_tries=100):
+        '''draw archs from propose(n) until num valid and unique ones are found'''
+        result = []
+        for _ in range(max_tries):
+            if len(result) == num:
+                break
+            result += self.keep(propose(2 * num), num - len(result), list(exclude) + result)
+        if len(result) < num:
+            logging.info('only {}/{} valid archs found under the constraints'.format(len(result), num))
+        return np.array(result, dtype=np.int64).reshape(-1, 20)
+
+    def random_archs(self, n):
+        return self.loader.sample(n, 'uniform', rng=self.rng)
+
+    def mutation(self, parents, n):
+        archs = parents[self.rng.randint(len(parents), size=n)]
+        resample = self.rng.random_sample(archs.shape) < self.args.mutation_prob
+        return np.where(resample, self.random_archs(n), archs)
+
+    def crossover(self, parents, n):
+        a = parents[self.rng.randint(len(parents), size=n)]
+        b = parents[self.rng.randint(len(parents), size=n)]
+        return np.where(self.rng.random_sample(a.shape) < 0.5, a, b)
+
+    def random_search(self):
+        num = self.args.population * self.args.generations
+        archs = self.fill(num, self.random_archs)
+        acc = self.evaluator(archs)
+        order = np.argsort(-acc, kind='stable')
+        return archs[order], acc[order]
+
+    def evolution_search(self):
+        args = self.args
+        population = self.fill(args.population, self.random_archs)
+        parents = np.zeros((0, 20), dtype=np.int64)
+        for generation in range(args.generations):
+            t0 = time.time()
+            candidates = np.concatenate([parents, population])
+            acc = self.evaluator(candidates)
+            order = np.argsort(-acc, kind='stable')[:args.topk]
+            parents, parent_acc = candidates[order], acc[order]
+            logging.info('generation {}: top1 {:.4f}, mean top-{} {:.4f}, {} archs cached, {:.1f}s'.format(
+                generation, parent_acc[0], len(parents), parent_acc.mean(),
+                len(self.evaluator.cache), time.time() - t0))
+
+            mutation = self.fill(args.num_mutation, lambda n: self.mutation(parents, n), parents)
+            crossover = self.fill(args.num_crossover, lambda n: self.crossover(parents, n),
+                                  np.concatenate([parents, mutation]))
+            population = np.concatenate([mutation, crossover])
+            rest = args.population - len(population)
+            if rest > 0:
+                population = np.concatenate(
+                    [population, self.fill(rest, self.random_archs, np.concatenate([parents, population]))])
+        acc = self.evaluator(parents)
+        return parents, acc
+
+
+def main():
+    args = parser.parse_args()
+    if args.group_size is None:
+        args.group_size = 1 if args.device == 'cpu' else 8
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    if not os.path.exists(args.save_dir):
+        os.makedirs(args.save_dir)
+
+    log_format = '%(asctime)s %(message)s'
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format=log_format, datefmt='%m/%d %I:%M:%S %p')
+    logging.info(args)
+
+    model = load_supernet(args.model_path, args.device, args.track_running_stats)
+    val_loader = get_val_loader(args.batch_size, args.workers, clss=args.dataset)
+    batches = preload(val_loader, args.device)[:args.num_batches]
+
+    disk_cache = None
+    if args.eval_cache:
+        disk_cache = EvalCache(args.eval_cache, model, eval_config(
+            batches, dataset=args.dataset, track_running_stats=args.track_running_stats))
+
+    searcher = Searcher(CachedEvaluator(model, batches, args.group_size, args.chunk_size, disk_cache), args)
+    t0 = time.time()
+    if args.mode == 'evolution':
+        archs, acc = searcher.evolution_search()
+    elif args.mode == 'random':
+        archs, acc = searcher.random_search()
+    else:
+        raise ValueError('unknown search mode: {}'.format(args.mode))
+    logging.info('searched {} archs in {:.1f}s'.format(len(searcher.evaluator.cache), time.time() - t0))
+
+    space = get_search_space()
+    flops, params = get_cost_model(args.num_classes)(archs)
+    result = {
+        'topk': [{'arch': s, 'acc': float(a), 'flops': int(f), 'params': int(p)}
+                 for s, a, f, p in zip(space.format(archs), acc, flops, params)],
+        'cache': searcher.evaluator.cache,
+    }
+    for i, item in enumerate(result['topk'][:5]):
+        logging.info('top{}: {}'.format(i + 1, item))
+
+    save_json = os.path.join(args.save_dir, '{}.json'.format(args.save_file))
+    with open(save_json, 'w') as f:
+        json.dump(result, f)
+    logging.info('saved {}'.format(save_json))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,8 @@ from model.dynamic_resnet20 import dynamic_resnet20
 from model.masked_resnet20 import masked_resnet20
 from model.sample_resnet20 import sample_resnet20
 from utils.angle import generate_angle
+from utils.eval_cache import EvalCache
+from utils.evaluator import eval_config
 from utils.utils import (ArchLoader, AvgrageMeter, CrossEntropyLabelSmooth,
                          DataIterator, accuracy, bn_calibration_init,
                          get_lastest_model, get_parameters, retrain_bn,
@@ -54,6 +56,8 @@ def get_args():
                         default=4e-5, help='weight decay')
     parser.add_argument('--gpu', type=int, default=0, help='gpu device id')
     parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--eval_cache', type=str, default='data/eval_cache.sqlite',
+                        help='sqlite cache of results keyed by weights and eval config, empty to disable')
     args = parser.parse_args()
     return args
 
@@ -144,10 +148,19 @@ def validate(model, args, *, arch_loader=None):
 
     model.eval()
 
+    cache = None
+    if args.eval_cache:
+        cache = EvalCache(args.eval_cache, model, eval_config(val_dataloader, dataset='cifar100'))
+
     arch_loader = tqdm(arch_loader)
     for key, arch in arch_loader:
         arch_list = [int(itm) for itm in arch[0].split('-')]
 
+        hit = cache.get([arch[0]]) if cache is not None else {}
+        if arch[0] in hit:
+            result_dict[key[0]] = {'arch': arch[0], 'acc': hit[arch[0]][0]}
+            continue
+
         with torch.no_grad():
             top1 = AvgrageMeter()
             for data, target in val_dataloader:  # 过一遍数据集
@@ -167,6 +180,8 @@ def validate(model, args, *, arch_loader=None):
         tmp_dict['acc'] = top1.avg / 100
 
         result_dict[key[0]] = tmp_dict
+        if cache is not None:
+            cache.put([arch[0]], [top1.avg / 100])
 
         post_fix = {"top1": "%.4f" % (top1.avg/100)}
         arch_loader.set_postfix(log=post_fix)
@@ -22,14 +22,18 @@ from torch.optim import lr_scheduler
 from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm
 import models
+from datasets.batch_transforms import mixup
 from datasets.dataset import get_train_loader, get_val_loader, ArchLoader
+from utils.checkpoint import CheckpointManager
+from utils.eval_cache import EvalCache
+from utils.evaluator import eval_config
+from utils.sandwich import sandwich_step
 from utils.utils import (
     AvgrageMeter,
     CrossEntropyLossSoft,
     accuracy,
     create_exp_dir,
     reduce_mean,
-    save_checkpoint,
     mixup_criterion,
     mixup_accuracy,
     load_checkpoint,
@@ -47,6 +51,13 @@ parser.add_argument(
     "--learning_rate", type=float, default=0.05, help="init learning rate"
 )  # 0.8
 parser.add_argument("--num_workers", type=int, default=3, help="num of workers")
+parser.add_argument(
+    "--data_backend",
+    type=str,
+    default="torchvision",
+    help="torchvision (PIL transforms in workers), batch (batched augmentation after collate) "
+    "or tensor (uint8 .npy cache, batched augmentation)",
+)
 parser.add_argument(
     "--model-type",
     type=str,
@@ -72,6 +83,11 @@ parser.add_argument("--momentum", type=float, default=0.9, help="momentum")
 parser.add_argument("--weight_decay", type=float, default=5e-4, help="weight decay")
 parser.add_argument("--cutout", type=float, default=0, help="cutout rate")
 parser.add_argument("--mixup", action="store_true", help="use mixup or not")
+parser.add_argument(
+    "--fused_sandwich",
+    action="store_true",
+    help="forward the sandwich subnets in one pass instead of one by one",
+)
 parser.add_argument("--mixup_alpha", type=float, default=1.0, help="alpha in mixup")
 parser.add_argument(
     "--resume", type=str, default="", help="path of resume weights. (model-latest.th)"
@@ -92,6 +108,24 @@ parser.add_argument(
 parser.add_argument(
     "--save_dir", type=str, help="save exp floder name", default="exp1_sandwich"
 )
+parser.add_argument(
+    "--eval_cache",
+    type=str,
+    default="",
+    help="sqlite cache of infer results keyed by weights and eval config, empty to disable",
+)
+parser.add_argument(
+    "--keep_last",
+    type=int,
+    default=None,
+    help="num of epoch checkpoints kept, all by default",
+)
+parser.add_argument(
+    "--keep_best",
+    type=int,
+    default=None,
+    help="num of best_model-NNNNN.th kept besides best_model-latest.th, keep_last by default",
+)
 args = parser.parse_args()
 
 # process argparse & yaml
@@ -209,12 +243,28 @@ def main():
         args.batch_size = args.batch_size // args.world_size
     # Prepare data
     train_loader = get_train_loader(
-        args.batch_size, args.num_workers, clss=args.dataset
+        args.batch_size,
+        args.num_workers,
+        clss=args.dataset,
+        backend=args.data_backend,
+        device=args.device,
     )
     # 原来跟train batch size一样，现在修改小一点 ，
-    val_loader = get_val_loader(args.batch_size, args.num_workers, clss=args.dataset)
+    val_loader = get_val_loader(
+        args.batch_size,
+        args.num_workers,
+        clss=args.dataset,
+        backend=args.data_backend,
+        device=args.device,
+    )
 
     archloader = ArchLoader("data/track_200.json")
+    # snapshots to cpu, written and linked to model-latest.th in the background
+    checkpointer = CheckpointManager(
+        "exp/{}/weights".format(args.exp_name),
+        keep_last=args.keep_last,
+        keep_best=args.keep_best,
+    )
 
     for epoch in range(args.epochs):
         train(
@@ -244,27 +294,18 @@ def main():
                 top1_val, objs_val = valid(
                     train_loader, val_loader, model, criterion, archloader, args, epoch
                 )
-            if best_val_acc < top1_val:
+            is_best = best_val_acc < top1_val
+            if is_best:
                 # update
                 best_val_acc = top1_val
-                save_checkpoint(
-                    {
-                        "state_dict": model.state_dict(),
-                        "prec": top1_val,
-                        "last_epoch": epoch,
-                        "optimizer": optimizer.state_dict(),
-                    },
-                    epoch,
-                    args.exp_name,
-                    tag="best_",
-                )
             if args.local_rank == 0:
                 # model
                 if writer is not None:
                     writer.add_scalar("Val/loss", objs_val, epoch)
                     writer.add_scalar("Val/acc1", top1_val, epoch)
 
-                save_checkpoint(
+                # written once, best_model-*.th are links to it
+                checkpointer.save(
                     {
                         "state_dict": model.state_dict(),
                         "prec": top1_val,
@@ -272,8 +313,9 @@ def main():
                         "optimizer": optimizer.state_dict(),
                     },
                     epoch,
-                    args.exp_name,
+                    best=is_best,
                 )
+    checkpointer.close()
     logging.info("best top1 acc in validation datasets: %.2f" % (best_val_acc))
 
 
@@ -292,7 +334,6 @@ def train(
     writer=None,
 ):
     losses_, top1_ = AvgrageMeter(), AvgrageMeter()
-    inplace_distillation = True
 
     model.train()
     widest = [
@@ -333,41 +374,36 @@ def train(
         if args.model_type in ["dynamic", "masked", "slimmable"]:
             # sandwich rule
             candidate_list = []
-            candidate_list += [
-                archloader.generate_spos_like_batch().tolist() for i in range(6)
-            ]
+            candidate_list += archloader.sample(6, "uniform").tolist()
             candidate_list += [narrowest]
 
             # archloader.generate_niu_fair_batch(step)
-            # 全模型来一遍
-            soft_target = model(image, widest)
-            soft_loss = criterion(soft_target, target)
-            soft_loss.backward()
-
-            # 采样几个子网来一遍
-            for arc in candidate_list:
-                logits = model(image, arc)
-                # loss = soft_criterion(logits, soft_target.cuda(
-                #     args.gpu, non_blocking=True))
-                if inplace_distillation:
-                    T = 1  # temperature in knowledge distillation 2 10 20
-
-                    soft_target = torch.nn.functional.softmax(
-                        soft_target / T, dim=1
-                    ).detach()
-
-                    loss = 0.5 * torch.mean(
-                        soft_criterion(logits, soft_target)
-                    ) + 0.5 * criterion(logits, target)
-                else:
-                    loss = criterion(logits, target)
-
-                loss.backward()
+            # 全模型来一遍, 再蒸馏采样的几个子网 (--fused_sandwich 时一次前向)
+            loss, logits = sandwich_step(
+                model,
+                image,
+                target,
+                widest,
+                candidate_list,
+                criterion,
+                soft_criterion,
+                fused=args.fused_sandwich,
+            )
 
             prec1, _ = accuracy(logits, target, topk=(1, 5))
             losses_.update(loss.data.item(), n)
             top1_.update(prec1.data.item(), n)
 
+        elif args.mixup:
+            image, target_a, target_b, lam = mixup(image, target, args.mixup_alpha)
+            logits = model(image)
+            loss = mixup_criterion(criterion, logits, target_a, target_b, lam)
+            loss.backward()
+
+            prec1 = mixup_accuracy(logits, target_a, target_b, lam)
+            losses_.update(loss.data.item(), n)
+            top1_.update(prec1.data.item(), n)
+
         else:
             logits = model(image)
             loss = criterion(logits, target)
@@ -421,10 +457,23 @@ def infer(train_loader, val_loader, model, criterion, archloader, args, epoch):
 
     # [16, 16, 16, 16, 16, 16, 16, 32, 32, 32, 32, 32, 32, 64, 64, 64, 64, 64, 64, 64]
     # .generate_width_to_narrow(epoch, args.epochs)
-    fair_arc_list = archloader.generate_spos_like_batch().tolist()
+    fair_arc_list = archloader.sample(1, "uniform")[0].tolist()
 
     logging.info("{} |=> Test rng = {}".format(now, fair_arc_list))  # 只测试最后一个模型
 
+    cache = None
+    if args.eval_cache:
+        cache = EvalCache(
+            args.eval_cache,
+            model,
+            eval_config(val_loader, dataset=args.dataset, model_type=args.model_type),
+        )
+        arch_str = archloader.convert_list_arc_str(fair_arc_list)
+        hit = cache.get([arch_str])
+        if arch_str in hit:
+            top1, loss = hit[arch_str]
+            return top1 * 100, loss
+
     # if args.model_type == "dynamic":
     #     # BN calibration
     #     retrain_bn(model, train_loader, fair_arc_list, device=0)
@@ -462,6 +511,8 @@ def infer(train_loader, val_loader, model, criterion, archloader, args, epoch):
             )
         )
 
+    if cache is not None:
+        cache.put([arch_str], [top1_.avg / 100], [objs_.avg])
     return top1_.avg, objs_.avg
 
 
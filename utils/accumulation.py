@@ -0,0 +1,124 @@
+import torch
+from torch.utils.checkpoint import checkpoint
+
+
+class SavedBytes(object):
+    '''
+    context counting the bytes autograd saves for backward, i.e. the
+    activation memory the graphs built inside it hold until backward.
+    a tensor saved by several ops is counted once.
+    '''
+
+    def __init__(self):
+        self.bytes = 0
+        self.forwards = 0
+        self._saved = set()
+
+    def _pack(self, tensor):
+        key = (tensor.data_ptr(), tensor.device, tuple(tensor.shape))
+        if key not in self._saved:
+            self._saved.add(key)
+            self.bytes += tensor.numel() * tensor.element_size()
+        return tensor
+
+    def __enter__(self):
+        self._hooks = torch.autograd.graph.saved_tensors_hooks(self._pack, lambda tensor: tensor)
+        self._hooks.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._hooks.__exit__(*exc)
+
+
+class AccumulationEngine(object):
+    '''
+    gradient accumulation of one batch in micro batches sized to a memory budget.
+
+    step(loss_fn, input, target) calls loss_fn(forward, x, y) on every micro
+    batch and returns (loss, output) of the whole batch, detached. loss_fn
+    runs its model calls through forward(fn, *args, **kwargs) and returns
+    the mean loss of its micro batch and the output to report. every micro
+    batch loss is scaled by its share of the batch and backwarded at once,
+    so only one micro batch graph is alive and the gradients are those of
+    the batch mean. fn must be deterministic given its arguments (sample
+    the arch outside and pass it in): torch rng is replayed, numpy's is not.
+
+    memory_budget: bytes of saved activations allowed at once, None for no
+    limit (one micro batch, no probe). with a budget, the first step of
+    every input shape probes the bytes per sample on a small first micro
+    batch. if the budget would need micro batches below min_micro_batch, every forward is checkpointed
+    instead: only its inputs are kept and it is recomputed in backward, so
+    a loss combining several forwards holds one graph at a time.
+    micro batches smaller than the batch see their own BN statistics, and
+    loss terms that are not a mean over samples are computed per micro batch.
+    '''
+
+    def __init__(self, memory_budget=None, min_micro_batch=32, probe_size=8, micro_batch_size=None):
+        self.memory_budget = memory_budget
+        self.min_micro_batch = min_micro_batch
+        self.probe_size = probe_size
+        self.micro_batch_size = micro_batch_size
+        self.plans = {}  # input shape -> (micro batch size, checkpointed)
+
+    def plan(self, batch_size, bytes_per_sample, forwards=1):
+        '''(micro batch size, checkpointed) for a batch whose graphs need bytes_per_sample'''
+        if self.memory_budget is None or bytes_per_sample == 0:
+            return batch_size, False
+        size = int(self.memory_budget // bytes_per_sample)
+        if size >= min(self.min_micro_batch, batch_size) or forwards == 1:
+            return max(1, min(size, batch_size)), False
+        # checkpointed: one forward graph alive instead of all of them
+        size = int(self.memory_budget * forwards // bytes_per_sample)
+        return max(1, min(size, batch_size)), True
+
+    def step(self, loss_fn, input, target):
+        batch_size = input.size(0)
+        key = tuple(input.shape)
+        start = 0
+        losses, outputs = [], []
+
+        if self.micro_batch_size is not None:
+            self.plans.setdefault(key, (min(self.micro_batch_size, batch_size), False))
+        elif self.memory_budget is None:
+            # no limit, one pass over the whole batch, nothing to probe
+            self.plans.setdefault(key, (batch_size, False))
+        if key not in self.plans:
+            # probe on the first micro batch, its gradients count as usual
+            size = min(self.probe_size, batch_size)
+            counter = SavedBytes()
+            with counter:
+                loss, output = loss_fn(self._counted(counter), input[:size], target[:size])
+            self._backward(loss, output, size / batch_size, losses, outputs)
+            self.plans[key] = self.plan(batch_size, counter.bytes / size, max(1, counter.forwards))
+            start = size
+
+        size, checkpointed = self.plans[key]
+        forward = self._checkpointed if checkpointed else self._direct
+        while start < batch_size:
+            end = min(start + size, batch_size)
+            loss, output = loss_fn(forward, input[start:end], target[start:end])
+            self._backward(loss, output, (end - start) / batch_size, losses, outputs)
+            start = end
+
+        return sum(losses), torch.cat(outputs)
+
+    @staticmethod
+    def _backward(loss, output, weight, losses, outputs):
+        (loss * weight).backward()
+        losses.append(loss.detach() * weight)
+        outputs.append(output.detach())
+
+    @staticmethod
+    def _direct(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    @staticmethod
+    def _checkpointed(fn, *args, **kwargs):
+        return checkpoint(fn, *args, use_reentrant=False, **kwargs)
+
+    @staticmethod
+    def _counted(counter):
+        def forward(fn, *args, **kwargs):
+            counter.forwards += 1
+            return fn(*args, **kwargs)
+        return forward
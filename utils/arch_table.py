@@ -0,0 +1,162 @@
+'''
+binary arch table: one structured .npy of n records (key, arch widths, acc),
+the widths (n, L) uint8 and acc nan when the file has none. loaded with
+np.load(mmap_mode='r'), so opening a 50k arch file reads no arch at all.
+'''
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+SUFFIX = '.archs.npy'
+
+
+def table_dtype(key_len, num_layers):
+    return np.dtype([('key', 'U{}'.format(max(1, key_len))), ('arch', np.uint8, (num_layers,)),
+                     ('acc', np.float64)])
+
+
+class ArchTable(object):
+    def __init__(self, records):
+        self.records = records
+        self._index = None
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        return cls(np.load(path, mmap_mode='r' if mmap else None))
+
+    @classmethod
+    def from_dict(cls, arch_dict):
+        '''from {key: {'arch': '4-8-...', 'acc'?}}, as the arch and result jsons'''
+        keys = list(arch_dict.keys())
+        strs = [arch_dict[key]['arch'] for key in keys]
+        widths = np.array('-'.join(strs).split('-'), dtype=np.int64).reshape(len(keys), -1) \
+            if keys else np.zeros((0, 0), dtype=np.int64)
+        assert widths.size == 0 or (widths.min() >= 0 and widths.max() < 256), 'widths must fit uint8'
+        accs = [arch_dict[key].get('acc', np.nan) for key in keys]
+        return cls.from_arrays(keys, widths, accs)
+
+    @classmethod
+    def from_arrays(cls, keys, widths, accs=None):
+        widths = np.asarray(widths)
+        records = np.empty(len(keys), dtype=table_dtype(max(map(len, keys), default=1), widths.shape[1]))
+        records['key'] = keys
+        records['arch'] = widths
+        records['acc'] = np.nan if accs is None else np.asarray(accs, dtype=np.float64)
+        return cls(records)
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        # write a temp file of this process then rename, a reader never maps
+        # a half written table, concurrent writers never share a temp file
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(self.records))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def keys(self):
+        return self.records['key']
+
+    @property
+    def widths(self):
+        '''(n, L) uint8 widths'''
+        return self.records['arch']
+
+    @property
+    def accs(self):
+        return self.records['acc']
+
+    def index(self, key):
+        if self._index is None:
+            self._index = {key: i for i, key in enumerate(self.keys.tolist())}
+        return self._index[key]
+
+    def __contains__(self, key):
+        try:
+            self.index(key)
+        except KeyError:
+            return False
+        return True
+
+    def arch_strs(self, rows=None):
+        widths = self.widths if rows is None else self.widths[rows]
+        return ['-'.join(map(str, arch)) for arch in widths.tolist()]
+
+    def arch_str(self, key):
+        return '-'.join(map(str, self.widths[self.index(key)].tolist()))
+
+    def to_dict(self):
+        '''
+        {key: {'arch', 'acc'?}}, acc left out where it is nan. a table holds
+        no other field, read it directly where only some archs are needed.
+        '''
+        result = {}
+        for key, arch, acc in zip(self.keys.tolist(), self.arch_strs(), self.accs.tolist()):
+            result[key] = {'arch': arch} if acc != acc else {'acc': acc, 'arch': arch}
+        return result
+
+
+def table_path(json_path):
+    return os.path.splitext(json_path)[0] + SUFFIX
+
+
+def open_arch_table(path):
+    '''
+    the table of an arch or result file: a .npy table is mapped, a json is
+    converted once into the table next to it and the table mapped from then
+    on, as long as it is newer than the json.
+    '''
+    if path.endswith('.npy'):
+        return ArchTable.load(path)
+    cached = table_path(path)
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+        try:
+            return ArchTable.load(cached)
+        except (OSError, ValueError, EOFError):
+            pass  # unreadable cache, converted again below
+    table = ArchTable.from_json(path)
+    try:
+        table.save(cached)
+        return ArchTable.load(cached)
+    except (OSError, ValueError, EOFError):
+        # read only location or a broken cache, keep the table in memory
+        return table
+
+
+def merge_tables(tables):
+    '''one table of all records, later tables win on duplicated keys, first seen order'''
+    key_len = max(int(t.keys.dtype.itemsize // 4) for t in tables)
+    num_layers = tables[0].widths.shape[1]
+    records = np.concatenate([np.asarray(t.records).astype(table_dtype(key_len, num_layers)) for t in tables])
+    keys = records['key']
+    # the last record of every key, placed where the key first appears
+    _, first = np.unique(keys, return_index=True)
+    _, last = np.unique(keys[::-1], return_index=True)
+    last = len(keys) - 1 - last
+    order = np.argsort(first)
+    return ArchTable(records[last[order]])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("convert arch/result jsons to binary arch tables")
+    parser.add_argument('inputs', nargs='+', help='arch or result jsons')
+    args = parser.parse_args()
+    for path in args.inputs:
+        table = ArchTable.from_json(path)
+        table.save(table_path(path))
+        print('{} archs -> {}'.format(len(table), table_path(path)))
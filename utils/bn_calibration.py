@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+
+
+def calibration_images(loader, num_samples, device='cpu', path=None):
+    '''
+    the first num_samples images of loader as one (N, C, H, W) tensor on
+    device, the fixed set every arch is calibrated on. path: torch.save
+    cache of the tensor, loaded instead of iterating the loader when present.
+    '''
+    if path is not None:
+        try:
+            images = torch.load(path, map_location='cpu')
+            if images.size(0) >= num_samples:
+                return images[:num_samples].to(device)
+        except FileNotFoundError:
+            pass
+
+    images, total = [], 0
+    for x, _ in loader:
+        images.append(x[:num_samples - total].cpu())
+        total += images[-1].size(0)
+        if total >= num_samples:
+            break
+    images = torch.cat(images)
+    if path is not None:
+        torch.save(images, path)
+    return images.to(device)
+
+
+class BNCalibrator(object):
+    '''
+    recalibrate the BN running statistics of a supernet for one arch.
+
+    calibrate(arch) resets the running stats and forwards the calibration
+    images once, without grad, with only the BN layers in training mode and
+    a cumulative average (momentum None). as one batch (the default) this
+    gives the exact per-channel mean and variance of the set; in chunks of
+    batch_size it is an approximation: the mean is the average of the chunk
+    means (exact only for equal chunks), the variance the average of the
+    per-chunk variances, which leaves out the spread between chunk means.
+    the resulting stats of every arch are kept in an LRU cache of capacity
+    archs, so an arch scored again only copies its buffers back.
+
+    the model must be called as model(x, arch) and its BN layers must track
+    running stats.
+    '''
+
+    def __init__(self, model, images, capacity=1024, batch_size=None):
+        self.model = model
+        self.images = images
+        self.capacity = capacity
+        self.batch_size = batch_size or images.size(0)
+        self.bns = [m for m in model.modules()
+                    if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.track_running_stats]
+        if not self.bns:
+            raise ValueError('no BN layer tracks running stats, build the model with track_running_stats')
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._original = self._state()
+
+    @staticmethod
+    def key(arch):
+        return arch if isinstance(arch, str) else '-'.join(map(str, arch))
+
+    def _state(self):
+        return [(bn.running_mean.clone(), bn.running_var.clone(), bn.num_batches_tracked.clone())
+                for bn in self.bns]
+
+    def _load(self, state):
+        for bn, (mean, var, num) in zip(self.bns, state):
+            bn.running_mean.copy_(mean)
+            bn.running_var.copy_(var)
+            bn.num_batches_tracked.copy_(num)
+
+    @torch.no_grad()
+    def calibrate(self, arch):
+        '''recompute the stats of arch from the calibration images, leaves the model in eval mode'''
+        momentums = [bn.momentum for bn in self.bns]
+        self.model.eval()
+        for bn in self.bns:
+            bn.reset_running_stats()
+            bn.momentum = None
+            bn.train()
+        for i in range(0, self.images.size(0), self.batch_size):
+            self.model(self.images[i:i + self.batch_size], arch)
+        for bn, momentum in zip(self.bns, momentums):
+            bn.momentum = momentum
+            bn.eval()
+        return self._state()
+
+    @torch.no_grad()
+    def apply(self, arch):
+        '''set the BN stats of arch, from the cache or calibrated, model left in eval mode'''
+        key = self.key(arch)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self._load(self.cache[key])
+            self.model.eval()
+            self.hits += 1
+            return
+        self.misses += 1
+        self.cache[key] = self.calibrate(arch)
+        if len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+
+    @torch.no_grad()
+    def restore(self):
+        '''the running stats the model had before any calibration'''
+        self._load(self._original)
@@ -0,0 +1,112 @@
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+def to_cpu(obj):
+    '''a copy of a (nested) state with every tensor detached and copied to cpu memory'''
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def atomic_save(state, path):
+    '''torch.save to a temp file next to path, renamed over it once on disk'''
+    tmp = '{}.tmp{}'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def link(src, dst):
+    '''
+    point dst at the file src without writing it again: a hard link (the
+    checkpoint outlives the removal of src), a copy where links are not
+    supported. replaces dst atomically.
+    '''
+    tmp = '{}.tmp{}'.format(dst, os.getpid())
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class CheckpointManager(object):
+    '''
+    checkpoints of a run in directory, written in a background thread.
+
+    save(state, iters) snapshots state to cpu memory on the calling thread
+    and returns, the thread writes {tag}model-{iters:05}.th atomically and
+    links {tag}model-latest.th to it, best=True also best_model-{iters:05}.th
+    and best_model-latest.th. keep_last: num of {tag}model-NNNNN.th kept, the
+    older ones are removed (the best links keep their data), None keeps all.
+    keep_best: the same for best_model-NNNNN.th, keep_last when None;
+    best_model-latest.th is always kept.
+    at most max_pending snapshots wait for the disk, save blocks beyond that.
+    a failed write raises on the next save, wait or close.
+    '''
+
+    def __init__(self, directory, keep_last=None, max_pending=1, async_write=True, keep_best=None):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.keep_best = keep_last if keep_best is None else keep_best
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=1) if async_write else None
+        self.pending = []
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, iters, tag=''):
+        return os.path.join(self.directory, '{}model-{:05}.th'.format(tag, iters))
+
+    def latest_path(self, tag=''):
+        return os.path.join(self.directory, '{}model-latest.th'.format(tag))
+
+    def save(self, state, iters, tag='', best=False):
+        self._collect(self.max_pending - 1)
+        state = to_cpu(state)
+        if self.executor is None:
+            self._write(state, iters, tag, best)
+        else:
+            self.pending.append(self.executor.submit(self._write, state, iters, tag, best))
+
+    def _write(self, state, iters, tag, best):
+        path = self.path(iters, tag)
+        atomic_save(state, path)
+        link(path, self.latest_path(tag))
+        if best:
+            link(path, self.path(iters, 'best_'))
+            link(path, self.latest_path('best_'))
+        if self.keep_last is not None:
+            self._prune(tag, self.keep_last)
+        if best and self.keep_best is not None:
+            self._prune('best_', self.keep_best)
+
+    def _prune(self, tag, keep):
+        pattern = re.compile(r'^{}model-(\d+)\.th$'.format(re.escape(tag)))
+        saved = sorted((int(m.group(1)), name) for m, name in
+                       ((pattern.match(name), name) for name in os.listdir(self.directory)) if m)
+        for _, name in saved[:max(0, len(saved) - keep)]:
+            os.remove(os.path.join(self.directory, name))
+
+    def _collect(self, limit=0):
+        '''wait until at most limit writes are pending, raise the error of a failed one'''
+        while len(self.pending) > max(0, limit):
+            self.pending.pop(0).result()
+
+    def wait(self):
+        self._collect()
+
+    def close(self):
+        self._collect()
+        if self.executor is not None:
+            self.executor.shutdown()
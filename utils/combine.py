@@ -1,20 +1,57 @@
-import json
-
-f1 = open("acc_track_part1.json", "r")
-
-d1 = json.load(f1)
-
-f2 = open("acc_track_part2.json", "r")
-
-d2 = json.load(f2)
-
-f3 = open("acc_track_part3.json", "r")
-
-d3 = json.load(f3)
-
-
-d_a = {**d1,**d2,**d3}
-
-f_a = open("results.json","w")
-
-json.dump(d_a, f_a)
\ No newline at end of file
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.arch_table import ArchTable, merge_tables, open_arch_table
+from utils.journal import load_journal, load_journal_dir
+
+
+def load_table(path):
+    """arch table of a result json, an arch table (.npy), a journal file or a journal dir"""
+    if os.path.isdir(path):
+        records = load_journal_dir(path)
+    elif path.endswith('.jsonl'):
+        records = load_journal(path)
+    else:
+        return open_arch_table(path)
+    return ArchTable.from_dict(records)
+
+
+def load_results(path):
+    """{key: {'acc', 'arch'}} from a result json, an arch table (.npy), a journal file or a journal dir"""
+    if os.path.isdir(path):
+        records = load_journal_dir(path)
+    elif path.endswith('.jsonl'):
+        records = load_journal(path)
+    elif path.endswith('.npy'):
+        return ArchTable.load(path).to_dict()
+    else:
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {key: {'acc': r['acc'], 'arch': r['arch']} for key, r in records.items()}
+
+
+def combine(paths):
+    """merge results, later paths win on duplicated keys"""
+    return merge_tables([load_table(path) for path in paths]).to_dict()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("combine eval results")
+    parser.add_argument('inputs', nargs='*', help='result jsons, journal files or journal dirs',
+                        default=['acc_track_part1.json', 'acc_track_part2.json',
+                                 'acc_track_part3.json'])
+    parser.add_argument('--output', default='results.json', type=str,
+                        help='result json, or arch table if it ends with .npy')
+    args = parser.parse_args()
+
+    table = merge_tables([load_table(path) for path in args.inputs])
+    if args.output.endswith('.npy'):
+        table.save(args.output)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(table.to_dict(), f)
+    print('merged {} archs into {}'.format(len(table), args.output))
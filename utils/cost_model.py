@@ -0,0 +1,159 @@
+import time
+from functools import lru_cache
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from models.modules.search_space import get_search_space
+
+
+class CostModel(object):
+    '''
+    exact flops (MACs) and params of sample_resnet20 subnets.
+
+    every conv of the supernet gets a (in choices, out choices) table of its
+    cost, so the cost of (n, 20) archs is one gather per conv, summed.
+    the last arch column (fc) is not used: the classifier sees the output of
+    the last block.
+    same_shortcut: every block has a 1x1 convbn shortcut, as sample_resnet20
+    by default, otherwise only the stride 2 blocks do.
+    '''
+
+    def __init__(self, num_classes=100, same_shortcut=True, affine=True, input_size=32):
+        self.space = get_search_space()
+        self.num_classes = num_classes
+        widths = [np.asarray(choices) for choices in self.space.setting]
+
+        # (in layer, out layer, kernel size, stride, output size), in layer None is the image
+        self.convs = [(None, 0, 3, 1, input_size)]
+        for j in range(1, 10):
+            stride = 2 if j in (4, 7) else 1
+            size = input_size >> ((j - 1) // 3)
+            self.convs.append((2 * j - 2, 2 * j - 1, 3, stride, size))
+            self.convs.append((2 * j - 1, 2 * j, 3, 1, size))
+            if same_shortcut or stride == 2:
+                self.convs.append((2 * j - 2, 2 * j, 1, stride, size))
+
+        self.flops_tables, self.params_tables = [], []
+        for i, (lin, lout, k, _, size) in enumerate(self.convs):
+            cin = np.array([3]) if lin is None else widths[lin]
+            cout = widths[lout]
+            macs = k * k * cin[:, None] * cout[None, :]
+            bn = 2 * cout[None, :] if affine and i > 0 else 0  # the stem bn has no affine
+            self.flops_tables.append(macs * size * size)
+            self.params_tables.append(macs + bn)
+
+        self.fc_layer = 18
+        self.fc_flops = widths[self.fc_layer] * num_classes
+        self.fc_params = widths[self.fc_layer] * num_classes + num_classes
+        self.latency_tables = None
+        self._choice_flops = None
+
+    def indices(self, archs):
+        '''(n, 20) channel numbers -> (n, 20) numpy choice indices'''
+        archs = torch.as_tensor(np.asarray(archs, dtype=np.int64)).view(-1, self.space.num_layers)
+        return self.space.encode(archs).numpy()
+
+    def _gather(self, idx, tables, fc):
+        total = fc[idx[:, self.fc_layer]].astype(np.float64)
+        zeros = np.zeros(len(idx), dtype=np.int64)
+        for (lin, lout, _, _, _), table in zip(self.convs, tables):
+            total += table[zeros if lin is None else idx[:, lin], idx[:, lout]]
+        return total
+
+    def __call__(self, archs):
+        '''flops (MACs) and params of (n, 20) archs, both (n,) int arrays'''
+        idx = self.indices(archs)
+        flops = self._gather(idx, self.flops_tables, self.fc_flops)
+        params = self._gather(idx, self.params_tables, self.fc_params)
+        return flops.astype(np.int64), params.astype(np.int64)
+
+    def flops(self, archs):
+        return self(archs)[0]
+
+    def params(self, archs):
+        return self(archs)[1]
+
+    def choice_flops(self):
+        '''
+        [(num_choices,) flops of every choice of layer l, the others at their widest],
+        how much each choice costs, used to weight flops-aware sampling
+        '''
+        if self._choice_flops is None:
+            widest = np.array(self.space.max_widths)
+            self._choice_flops = []
+            for layer_id, choices in enumerate(self.space.setting):
+                archs = np.tile(widest, (len(choices), 1))
+                archs[:, layer_id] = choices
+                self._choice_flops.append(self.flops(archs))
+        return self._choice_flops
+
+    def calibrate_latency(self, batch_size=1, repeats=20, device='cpu'):
+        '''
+        measure every conv at every (in, out) choice pair once, and time
+        archs by summing the table. convs sharing a shape share a timing.
+        '''
+        timings = {}
+        widths = [np.asarray(choices) for choices in self.space.setting]
+        self.latency_tables = []
+        with torch.no_grad():
+            for lin, lout, k, stride, size in self.convs:
+                cin_list = [3] if lin is None else widths[lin].tolist()
+                table = np.zeros((len(cin_list), len(widths[lout])))
+                for a, cin in enumerate(cin_list):
+                    for b, cout in enumerate(widths[lout].tolist()):
+                        key = (cin, cout, k, stride, size)
+                        if key not in timings:
+                            timings[key] = _time_conv(key, batch_size, repeats, device)
+                        table[a, b] = timings[key]
+                self.latency_tables.append(table)
+            self.fc_latency = np.array([
+                _time_linear(cin, self.num_classes, batch_size, repeats, device)
+                for cin in widths[self.fc_layer].tolist()])
+        return self
+
+    def latency(self, archs):
+        '''(n,) estimated seconds per forward of (n, 20) archs, needs calibrate_latency or load_latency'''
+        assert self.latency_tables is not None, 'calibrate_latency() or load_latency() first'
+        return self._gather(self.indices(archs), self.latency_tables, self.fc_latency)
+
+    def save_latency(self, path):
+        np.savez(path, *self.latency_tables, fc=self.fc_latency)
+
+    def load_latency(self, path):
+        data = np.load(path)
+        self.latency_tables = [data['arr_{}'.format(i)] for i in range(len(self.convs))]
+        self.fc_latency = data['fc']
+        return self
+
+
+def _time_conv(key, batch_size, repeats, device):
+    cin, cout, k, stride, size = key
+    x = torch.randn(batch_size, cin, size * stride, size * stride, device=device)
+    w = torch.randn(cout, cin, k, k, device=device)
+    return _time(lambda: F.conv2d(x, w, None, stride, k // 2), repeats, device)
+
+
+def _time_linear(cin, cout, batch_size, repeats, device):
+    x = torch.randn(batch_size, cin, device=device)
+    w = torch.randn(cout, cin, device=device)
+    return _time(lambda: F.linear(x, w), repeats, device)
+
+
+def _time(fn, repeats, device):
+    fn()  # warm up
+    if device != 'cpu':
+        torch.cuda.synchronize()
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if device != 'cpu':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - t0) / repeats
+
+
+@lru_cache(maxsize=None)
+def get_cost_model(num_classes=100, same_shortcut=True):
+    '''tables are built once per setting'''
+    return CostModel(num_classes, same_shortcut)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import torch
+
+
+def state_dict_hash(state_dict):
+    '''content hash of a state_dict: names, dtypes, shapes and values'''
+    sha = hashlib.sha1()
+    for name in sorted(state_dict.keys()):
+        tensor = state_dict[name]
+        sha.update(name.encode())
+        if torch.is_tensor(tensor):
+            tensor = tensor.detach().cpu().contiguous()
+            sha.update('{}{}'.format(tensor.dtype, tuple(tensor.shape)).encode())
+            sha.update(tensor.view(-1).view(torch.uint8).numpy().tobytes()
+                       if tensor.numel() else b'')
+        else:
+            sha.update(repr(tensor).encode())
+    return sha.hexdigest()
+
+
+class EvalCache(object):
+    '''
+    on-disk top1/loss of evaluated archs, in sqlite.
+
+    rows are keyed by (model hash, eval config, arch str), so a cache file
+    can be shared between checkpoints and eval settings: a changed weight or
+    config never hits an old entry. top1 is in [0, 1], loss may be None.
+    '''
+
+    def __init__(self, path, model, config):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        state_dict = model.state_dict() if hasattr(model, 'state_dict') else model
+        self.model_hash = state_dict_hash(state_dict)
+        self.config = json.dumps(config, sort_keys=True)
+
+        # several eval processes may share one file
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                          'model TEXT, config TEXT, arch TEXT, top1 REAL, loss REAL, '
+                          'PRIMARY KEY (model, config, arch))')
+        self.conn.commit()
+
+    def get(self, arch_strs, chunk_size=500):
+        '''{arch str: (top1, loss)} for the cached ones among arch_strs'''
+        result = {}
+        arch_strs = list(arch_strs)
+        for i in range(0, len(arch_strs), chunk_size):
+            chunk = arch_strs[i:i + chunk_size]
+            rows = self.conn.execute(
+                'SELECT arch, top1, loss FROM results WHERE model = ? AND config = ? '
+                'AND arch IN ({})'.format(','.join('?' * len(chunk))),
+                [self.model_hash, self.config] + chunk)
+            result.update((arch, (top1, loss)) for arch, top1, loss in rows)
+        return result
+
+    def put(self, arch_strs, top1, loss=None):
+        if loss is None:
+            loss = [None] * len(arch_strs)
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+            [(self.model_hash, self.config, arch, float(t), None if l is None else float(l))
+             for arch, t, l in zip(arch_strs, top1, loss)])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
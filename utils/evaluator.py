@@ -0,0 +1,111 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from tqdm import tqdm
+
+
+def preload(loader, device):
+    """materialize a dataloader once as a list of (input, target) on device"""
+    return [(x.to(device), y.to(device)) for x, y in loader]
+
+
+def convert_str_arc_list(arc_str):
+    return [int(i) for i in arc_str.split('-')]
+
+
+def group_archs(archs, group_size, chunk_size=256):
+    '''
+    split arch indices into the units evaluated together.
+
+    group_size > 1: groups of archs packed into one forward, sorted by total
+    width so that the widest arch of a group (which sets the conv width of
+    the whole group) is close to the others.
+    group_size == 1: chunks of lexicographically sorted archs, evaluated one
+    by one while reusing the blocks shared with the previous arch.
+    '''
+    if group_size > 1:
+        order = np.argsort(archs.sum(axis=1), kind='stable')
+        step = group_size
+    else:
+        order = np.lexsort(archs.T[::-1])
+        step = chunk_size
+    return [order[i:i + step] for i in range(0, len(order), step)]
+
+
+@torch.no_grad()
+def iter_evaluate(model, batches, archs, group_size=1, chunk_size=256, verbose=True):
+    '''
+    evaluate (n, 20) archs on preloaded batches.
+    yields (indices, top1, loss) for every group or chunk, top1 in [0, 1].
+    '''
+    archs = np.asarray(archs, dtype=np.int64)
+    total = sum(target.size(0) for _, target in batches)
+    device = batches[0][0].device
+    model.eval()
+
+    groups = group_archs(archs, group_size, chunk_size)
+    if verbose:
+        groups = tqdm(groups)
+
+    for idx in groups:
+        num = len(idx)
+        correct = torch.zeros(num, device=device)
+        loss = torch.zeros(num, device=device)
+
+        for data, target in batches:
+            if group_size > 1:
+                logits = model.forward_archs(data, torch.from_numpy(archs[idx]))
+            else:
+                cache = []
+                logits = torch.stack([model.forward_cached(data, arch, cache)
+                                      for arch in archs[idx].tolist()])
+            correct += (logits.argmax(dim=-1) == target).sum(dim=1)
+            loss += F.cross_entropy(logits.flatten(0, 1), target.repeat(num),
+                                    reduction='none').view(num, -1).sum(dim=1)
+
+        yield idx, (correct / total).cpu().numpy(), (loss / total).cpu().numpy()
+
+
+def eval_config(batches, **kwargs):
+    '''
+    what an eval result depends on besides the weights and the arch, keys the EvalCache.
+    batches: preloaded batches or the (unshuffled) dataloader they come from.
+    '''
+    if hasattr(batches, 'dataset'):
+        config = {'num_samples': len(batches.dataset), 'batch_size': batches.batch_size}
+    else:
+        config = {'num_samples': sum(target.size(0) for _, target in batches),
+                  'batch_size': batches[0][1].size(0)}
+    config.update(kwargs)
+    return config
+
+
+def evaluate_archs(model, batches, archs, group_size=1, chunk_size=256, verbose=True, cache=None):
+    '''
+    top1 in [0, 1] and mean loss for every arch, as two (n,) arrays.
+    cache: optional EvalCache, consulted before and filled after the forwards.
+    '''
+    archs = np.asarray(archs, dtype=np.int64)
+    top1 = np.zeros(len(archs))
+    loss = np.zeros(len(archs))
+
+    todo = np.arange(len(archs))
+    if cache is not None:
+        arch_strs = ['-'.join(map(str, arch)) for arch in archs.tolist()]
+        hit = cache.get(arch_strs)
+        for i, arch_str in enumerate(arch_strs):
+            if arch_str in hit:
+                top1[i], cached_loss = hit[arch_str]
+                loss[i] = np.nan if cached_loss is None else cached_loss
+        todo = np.array([i for i, arch_str in enumerate(arch_strs) if arch_str not in hit], dtype=np.int64)
+        if len(todo) == 0:
+            return top1, loss
+
+    for idx, group_top1, group_loss in iter_evaluate(model, batches, archs[todo], group_size,
+                                                     chunk_size, verbose):
+        top1[todo[idx]] = group_top1
+        loss[todo[idx]] = group_loss
+
+    if cache is not None:
+        cache.put([arch_strs[i] for i in todo], top1[todo], loss[todo])
+    return top1, loss
@@ -0,0 +1,88 @@
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from models.resnet20 import resnet20
+
+
+def _copy_convbn(conv, bn, convbn, in_width):
+    '''slice a sample_resnet20 SampleConvBN into a dense conv and bn'''
+    out_width = conv.out_channels
+    conv.weight.copy_(convbn.conv.weight[:out_width, :in_width])
+    src = convbn.bn
+    if src.running_mean is None:
+        raise ValueError('the supernet bn has no running stats, calibrate it first '
+                         '(utils.bn_calibration.BNCalibrator)')
+    bn.running_mean.copy_(src.running_mean[:out_width])
+    bn.running_var.copy_(src.running_var[:out_width])
+    bn.eps = src.eps
+    if src.weight is not None:
+        bn.weight.copy_(src.weight[:out_width])
+        bn.bias.copy_(src.bias[:out_width])
+    else:
+        nn.init.ones_(bn.weight)
+        nn.init.zeros_(bn.bias)
+
+
+@torch.no_grad()
+def export_subnet(supernet, arch, num_classes=100):
+    '''
+    a dense models/resnet20.py network with the weights of the subnet arch
+    (list of 20 channel numbers, or its '-' string) of a sample_resnet20
+    supernet, every tensor physically sliced to the chosen widths. the BN
+    running stats of the supernet are those of the subnet, so calibrate
+    them for arch first unless the supernet was trained with tracked stats.
+    '''
+    if isinstance(arch, str):
+        arch = [int(w) for w in arch.split('-')]
+    blocks = [*supernet.layer1, *supernet.layer2, *supernet.layer3]
+    if not all(block.same_shortcut for block in blocks):
+        raise NotImplementedError('only supernets with a convbn shortcut in every block (same_shortcut)')
+
+    model = resnet20(num_classes=num_classes, widths=arch, option='C').to(supernet.linear[1].weight.device)
+    _copy_convbn(model.conv1, model.bn1, supernet.convbn1, 3)
+    dense_blocks = [*model.layer1, *model.layer2, *model.layer3]
+    for j, (dense, block) in enumerate(zip(dense_blocks, blocks)):
+        _copy_convbn(dense.conv1, dense.bn1, block.convbn1, arch[2 * j])
+        _copy_convbn(dense.conv2, dense.bn2, block.convbn2, arch[2 * j + 1])
+        _copy_convbn(dense.shortcut[0], dense.shortcut[1], block.shortcut, arch[2 * j])
+
+    fc = supernet.linear[1]
+    model.linear.weight.copy_(fc.weight[:, :arch[18]])
+    model.linear.bias.copy_(fc.bias)
+    return model.eval()
+
+
+def fold_bn(model):
+    '''
+    fold every bn of a models/resnet20.py network into the conv before it
+    (conv with bias, bn replaced by nn.Identity), for inference only
+    '''
+    model.eval()
+    model.conv1 = fuse_conv_bn_eval(model.conv1, model.bn1)
+    model.bn1 = nn.Identity()
+    for block in [*model.layer1, *model.layer2, *model.layer3]:
+        block.conv1 = fuse_conv_bn_eval(block.conv1, block.bn1)
+        block.bn1 = nn.Identity()
+        block.conv2 = fuse_conv_bn_eval(block.conv2, block.bn2)
+        block.bn2 = nn.Identity()
+        if len(block.shortcut) == 2:
+            block.shortcut = nn.Sequential(fuse_conv_bn_eval(*block.shortcut))
+    return model
+
+
+def save_subnet(path, model, arch, folded):
+    torch.save({'arch': '-'.join(map(str, arch)), 'widths': model.widths, 'option': model.option,
+                'num_classes': model.linear.out_features, 'folded': folded,
+                'state_dict': model.state_dict()}, path)
+
+
+def load_subnet(path, map_location='cpu'):
+    '''the network saved by save_subnet, folded again if it was saved folded'''
+    checkpoint = torch.load(path, map_location=map_location)
+    model = resnet20(num_classes=checkpoint['num_classes'], widths=checkpoint['widths'],
+                     option=checkpoint['option'])
+    if checkpoint['folded']:
+        fold_bn(model)
+    model.load_state_dict(checkpoint['state_dict'])
+    return model.eval()
@@ -0,0 +1,76 @@
+import glob
+import json
+import os
+
+
+class ResultJournal(object):
+    '''
+    append-only jsonl journal of arch results, one {"key", "acc", ...} per line.
+    every append is flushed and fsynced, so a crash loses at most the
+    record being written (a truncated last line is skipped when loading).
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+
+    def append(self, records):
+        with open(self.path, 'a+') as f:
+            # terminate a line left truncated by a crash before appending
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                if f.read(1) != '\n':
+                    f.write('\n')
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load(self):
+        return load_journal(self.path)
+
+
+def load_journal(path):
+    """{key: record} from one journal file, later records win"""
+    result = {}
+    if not os.path.exists(path):
+        return result
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:  # truncated by a crash
+                continue
+            result[record['key']] = record
+    return result
+
+
+def check_journal_dir(dirname, header):
+    '''
+    bind the journals of dirname to header (the weights and eval settings
+    their results come from): written on first use, a later run with another
+    header raises instead of resuming from results it did not produce.
+    '''
+    path = os.path.join(dirname, 'header.json')
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            saved = json.load(f)
+        if saved != header:
+            raise ValueError('journal {} was written for {}, not {}; use another journal dir '
+                             'or remove it'.format(dirname, saved, header))
+        return
+    os.makedirs(dirname, exist_ok=True)
+    tmp = '{}.tmp{}'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(header, f, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def load_journal_dir(dirname):
+    """{key: record} merged over every *.jsonl journal in dirname"""
+    result = {}
+    for path in sorted(glob.glob(os.path.join(dirname, '*.jsonl'))):
+        result.update(load_journal(path))
+    return result
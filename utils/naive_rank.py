@@ -1,39 +1,29 @@
-from statistics import get_arch_list
-import json 
+import json
+import os
+import sys
 
-'''
-直接根据参数量进行排序
-'''
+import numpy as np
 
-arch_l, arch_d = get_arch_list("data/Track1_final_archs.json")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from utils.arch_table import open_arch_table
+from utils.cost_model import get_cost_model
 
-def sort_by_value(d):
-    items = d.items()
-    backitems = [[v[1], v[0]] for v in items]
-    backitems.sort()
-    return [backitems[i][1] for i in range(0, len(backitems))]
+'''
+直接根据 FLOPs 进行排序 (精确计算每个子网的 FLOPs, 而不是通道数之和)
+'''
 
+table = open_arch_table("data/Track1_final_archs.json")
 
-dict_arch_param = {}
+keys = table.keys.tolist()
+flops, params = get_cost_model()(table.widths.astype(np.int64))
+score = flops / flops.max()
 
 result_dict = {}
 
-for key, value in arch_d.items():
-    sum_s = sum([int(i) for i in value['arch'].split("-")])
-    acc = sum_s / 752
-    print(key, sum_s, '\t', acc)
-    dict_arch_param[key] = sum_s
-
-    tmp_dict = {}
-    tmp_dict['acc'] = acc 
-    tmp_dict['arch'] = value['arch']
-
-    result_dict[key] = tmp_dict
-
-print(result_dict)
-
-# print(sort_by_value(dict_arch_param))
+for key, arch, acc, f, p in zip(keys, table.arch_strs(), score.tolist(), flops.tolist(), params.tolist()):
+    print(key, f, p, '\t', acc)
+    result_dict[key] = {'acc': acc, 'arch': arch}
 
-with open("naive_result.json",'w') as f:
-    json.dump(result_dict, f)
\ No newline at end of file
+with open("naive_result.json", 'w') as f:
+    json.dump(result_dict, f)
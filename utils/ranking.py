@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.combine import load_results
+
+
+def align(pred, target, by='key'):
+    """
+    (keys, pred accs, target accs) of the archs in both result dicts
+    ({key: {'acc', 'arch'}}), matched by result key or by arch string,
+    in the order of target
+    """
+    if by == 'arch':
+        pred = {v['arch']: v for v in pred.values()}
+        target = {v['arch']: v for v in target.values()}
+    keys = [key for key in target if key in pred]
+    x = np.array([float(pred[key]['acc']) for key in keys])
+    y = np.array([float(target[key]['acc']) for key in keys])
+    return keys, x, y
+
+
+def rankdata(x):
+    """ranks from 1, ties get their average rank (scipy.stats.rankdata)"""
+    x = np.asarray(x)
+    order = np.argsort(x, kind='stable')
+    sorted_x = x[order]
+    # first and last position of every run of equal values
+    new = np.r_[True, sorted_x[1:] != sorted_x[:-1]]
+    run = np.cumsum(new) - 1
+    starts = np.flatnonzero(new)
+    ends = np.r_[starts[1:], len(x)]
+    ranks = np.empty(len(x))
+    ranks[order] = ((starts + ends + 1) / 2)[run]
+    return ranks
+
+
+def pearson(x, y):
+    x = np.asarray(x, dtype=np.float64) - np.mean(x)
+    y = np.asarray(y, dtype=np.float64) - np.mean(y)
+    den = np.sqrt((x * x).sum() * (y * y).sum())
+    if den == 0:
+        return 0.0
+    return float((x * y).sum() / den)
+
+
+def spearman(x, y):
+    return pearson(rankdata(x), rankdata(y))
+
+
+def _ties(new):
+    """num of tied pairs of a sorted array, new: True where a run of equal values starts"""
+    counts = np.diff(np.r_[np.flatnonzero(new), len(new)]).astype(np.int64)
+    return int((counts * (counts - 1) // 2).sum())
+
+
+def count_inversions(y):
+    """
+    pairs i < j with y[i] > y[j], bottom up merge sort: every level merges
+    the sorted runs of all block pairs with one stable argsort, a right
+    element jumps over the left ones greater than it.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    idx = np.arange(n)
+    # dense ints, so (block pair, value) fits one int64 key
+    y = np.unique(y, return_inverse=True)[1].astype(np.int64).reshape(-1)
+    inversions = 0
+    width = 1
+    while width < n:
+        start = idx // (2 * width) * (2 * width)
+        order = np.argsort(start // (2 * width) * (n + 1) + y, kind='stable')
+        pos = np.empty(n, dtype=np.int64)
+        pos[order] = idx
+        right = idx - start >= width
+        # left elements merged before a right one are the ones not greater than it
+        before = pos[right] - start[right] - (idx[right] - start[right] - width)
+        inversions += int((width - before).sum())
+        y = y[order]
+        width *= 2
+    return inversions
+
+
+def kendalltau(x, y):
+    """kendall tau-b in O(n log n), as scipy.stats.kendalltau"""
+    x, y = np.asarray(x), np.asarray(y)
+    n = len(x)
+    order = np.lexsort((y, x))
+    x, y = x[order], y[order]
+    pairs = n * (n - 1) // 2
+    new_x = np.r_[True, x[1:] != x[:-1]]
+    new_xy = new_x | np.r_[True, y[1:] != y[:-1]]
+    sorted_y = np.sort(y)
+    x_ties, xy_ties = _ties(new_x), _ties(new_xy)
+    y_ties = _ties(np.r_[True, sorted_y[1:] != sorted_y[:-1]])
+    # sorted by (x, y), pairs tied in x are never inversions
+    discordant = count_inversions(y)
+    concordant = pairs - x_ties - y_ties + xy_ties - discordant
+    den = np.sqrt(float(pairs - x_ties) * float(pairs - y_ties))
+    if den == 0:
+        return 0.0
+    return float((concordant - discordant) / den)
+
+
+def top_k_precision(x, y, k):
+    """share of the k best archs by x that are among the k best by y"""
+    k = min(k, len(x))
+    top_x = np.argpartition(-np.asarray(x), k - 1)[:k]
+    top_y = np.argpartition(-np.asarray(y), k - 1)[:k]
+    return len(np.intersect1d(top_x, top_y)) / k
+
+
+def ndcg(x, y, k=None):
+    """ndcg@k of the archs ranked by x, gains the target accs y"""
+    y = np.asarray(y, dtype=np.float64)
+    k = min(k or len(x), len(x))
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    dcg = (y[np.argsort(-np.asarray(x), kind='stable')[:k]] * discounts).sum()
+    idcg = (np.sort(y)[::-1][:k] * discounts).sum()
+    return float(dcg / idcg) if idcg > 0 else 0.0
+
+
+def metrics(x, y, k=50):
+    return {
+        'pearson': pearson(x, y),
+        'spearman': spearman(x, y),
+        'kendall': kendalltau(x, y),
+        'top{}'.format(k): top_k_precision(x, y, k),
+        'ndcg@{}'.format(k): ndcg(x, y, k),
+    }
+
+
+def bootstrap(x, y, k=50, num=200, alpha=0.05, seed=0):
+    """{metric: (low, high)} percentile intervals over num resamples of the archs"""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(num):
+        idx = rng.integers(0, len(x), len(x))
+        samples.append(metrics(x[idx], y[idx], k))
+    return {name: tuple(np.quantile([s[name] for s in samples], [alpha / 2, 1 - alpha / 2]).tolist())
+            for name in samples[0]}
+
+
+def compare(paths, target_path, by='key', k=50, num_bootstrap=0, seed=0):
+    """[{'path', 'num', metric: value, metric_ci: (low, high)}] of every result file against the target"""
+    target = load_results(target_path)
+    rows = []
+    for path in paths:
+        _, x, y = align(load_results(path), target, by)
+        row = {'path': path, 'num': len(x)}
+        row.update(metrics(x, y, k))
+        if num_bootstrap:
+            for name, ci in bootstrap(x, y, k, num_bootstrap, seed=seed).items():
+                row[name + '_ci'] = ci
+        rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    from prettytable import PrettyTable
+
+    parser = argparse.ArgumentParser("ranking correlation of eval results")
+    parser.add_argument('inputs', nargs='+', help='result jsons, journal files or journal dirs')
+    parser.add_argument('--target', default='data/benchmark.json', type=str,
+                        help='ground truth accs the inputs are ranked against')
+    parser.add_argument('--by', default='key', choices=['key', 'arch'],
+                        help='match archs by result key or by arch string')
+    parser.add_argument('--topk', default=50, type=int)
+    parser.add_argument('--bootstrap', default=0, type=int,
+                        help='num of bootstrap resamples for 95%% intervals, 0 to skip')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--output', default=None, type=str, help='json file the table is saved to')
+    args = parser.parse_args()
+
+    rows = compare(args.inputs, args.target, args.by, args.topk, args.bootstrap, args.seed)
+    names = list(metrics([0., 1.], [0., 1.], args.topk))
+    tb = PrettyTable()
+    tb.field_names = ['result', 'num'] + names
+    for row in rows:
+        cells = []
+        for name in names:
+            cell = '{:.4f}'.format(row[name])
+            if name + '_ci' in row:
+                cell += ' [{:.4f}, {:.4f}]'.format(*row[name + '_ci'])
+            cells.append(cell)
+        tb.add_row([row['path'], row['num']] + cells)
+    print(tb)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,41 @@
+import torch
+import torch.nn.functional as F
+
+
+def distill_loss(logits, soft_target, target, soft_criterion, criterion):
+    '''inplace distillation: half soft loss to the widest net, half hard loss'''
+    return 0.5 * torch.mean(soft_criterion(logits, soft_target)) + 0.5 * criterion(logits, target)
+
+
+def sandwich_step(model, image, target, widest, candidates, criterion, soft_criterion,
+                  fused=False, temperature=1):
+    '''
+    sandwich rule on one batch: the widest arch with the hard loss, then every
+    candidate distilled from it. backward is called on every loss, so the
+    gradients are accumulated in the parameters, optimizer.step is left to
+    the caller. returns (loss, logits) of the last candidate.
+
+    fused: forward all candidates in one model.forward_archs pass (one conv
+    per layer on the stacked batch) and backward their summed loss once, the
+    gradients are the sum of the separate passes. off by default: every conv
+    runs at the widest width of the group on K x B rows, slower than the
+    separate passes unless the candidates have close widths. models without
+    forward_archs, or wrapped in DistributedDataParallel (whose gradient
+    sync hooks only see its own forward), fall back to separate passes.
+    '''
+    soft_logits = model(image, widest)
+    criterion(soft_logits, target).backward()
+    soft_target = F.softmax(soft_logits.detach() / temperature, dim=1)
+
+    if fused and hasattr(model, 'forward_archs'):
+        logits = model.forward_archs(image, candidates)
+        losses = [distill_loss(group_logits, soft_target, target, soft_criterion, criterion)
+                  for group_logits in logits]
+        sum(losses).backward()
+        return losses[-1].detach(), logits[-1].detach()
+
+    for arc in candidates:
+        logits = model(image, arc)
+        loss = distill_loss(logits, soft_target, target, soft_criterion, criterion)
+        loss.backward()
+    return loss.detach(), logits.detach()
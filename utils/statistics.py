@@ -1,16 +1,16 @@
-import json
+import os
+import sys
+
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def get_arch_list(path):
-    with open(path, "r") as f:
-        arc_dict = json.load(f)
+from utils.arch_table import open_arch_table
 
-    arc_list = []
 
-    for i, v in arc_dict.items():
-        arc_list.append(v["arch"])
-    return arc_list, arc_dict
+def get_arch_list(path):
+    table = open_arch_table(path)
+    return table.arch_strs(), table.to_dict()
 
 
 arc_list, _ = get_arch_list("data/track_200.json")
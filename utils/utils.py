@@ -35,22 +35,28 @@ class Cutout(object):
         return img
 
 
-def generate_result(file, alpha1, alpha2, alpha3):
-    with open('Track1_final_archs.json', 'r') as f:
-        data = json.load(f)
-
-    alpha = alpha1.detach().cpu().numpy().tolist() + \
-        alpha2.detach().cpu().numpy().tolist() + alpha3.detach().cpu().numpy().tolist()
-    archindex_logprob_list = []
-    for i in range(1, 50001):
-        archindex = 'arch{}'.format(i)
-        logprob = 0
-        arch = data[archindex]['arch']
-        for j, c in enumerate(arch.split('-')[:-1]):
-            index = SuperNetSetting[j].index(int(c))
-            logprob += math.log(alpha[j][index])
-        archindex_logprob_list.append((archindex, logprob))
-    archindex_logprob_list = sorted(archindex_logprob_list, key=lambda x: x[1])
+def generate_result(file, alpha1, alpha2, alpha3, arch_file='Track1_final_archs.json'):
+    from models.modules.search_space import get_search_space
+    space = get_search_space()
+
+    from utils.arch_table import open_arch_table
+    table = open_arch_table(arch_file)
+
+    # (19, max_choices) alpha of every layer but fc, zero padded
+    alphas = [alpha1, alpha2, alpha3]
+    alpha = torch.zeros(sum(a.size(0) for a in alphas), space.max_choices)
+    row = 0
+    for a in alphas:
+        alpha[row:row + a.size(0), :a.size(1)] = a.detach().cpu()
+        row += a.size(0)
+
+    keys = table.keys.tolist()
+    indices = space.encode(torch.from_numpy(table.widths.astype(np.int64)))[:, :alpha.size(0)]
+    logprob = alpha.log().gather(1, indices.t()).sum(dim=0)
+    archindex_logprob_list = sorted(zip(keys, logprob.tolist()), key=lambda x: x[1])
+    with open(file, 'w') as f:
+        json.dump(dict(archindex_logprob_list), f)
+    return archindex_logprob_list
 
 
 class AverageMeter(object):
@@ -217,15 +223,17 @@ def save_checkpoint(state, iters, exp_name, tag=''):
     '''
     state = state_dict, best_prec, last_epoch, optimizer.state_dict()
     '''
+    from utils.checkpoint import atomic_save, link
     if not os.path.exists("exp/{}/weights".format(exp_name)):
         os.makedirs("exp/{}/weights".format(exp_name))
     filename = os.path.join(
         "exp/{}/weights/{}model-{:05}.th".format(exp_name, tag, iters))
 
-    torch.save(state, filename)
+    atomic_save(state, filename)
     latestfilename = os.path.join(
         "exp/{}/weights/{}model-latest.th".format(exp_name, tag))
-    torch.save(state, latestfilename)
+    # the same checkpoint, linked instead of serialized twice
+    link(filename, latestfilename)
 
 
 def get_lastest_model():